@@ -1,37 +1,109 @@
-from src.rag_logic import RAGSystem
-import gradio as gr
 import time
+APP_START = time.perf_counter()
+
+import os
+import threading
+from src.rag_logic import RAGSystem, PRODUCT_KEYWORDS, detect_product, logger
+from src.scheduler import StreamingScheduler
+from src.telemetry import METRICS_PORT, serve_metrics
+import gradio as gr
 
-# Initialize RAG system
-rag = RAGSystem()
+# Load models in the background so the UI can bind its port right away
+rag = RAGSystem(background=True)
+_first_request = threading.Event()
+# Gradio workers: questions from concurrent analysts are micro-batched into
+# one embed, batched retrieval and one padded generate, and each analyst's
+# answer streams as its row of the batch decodes
+UI_WORKERS = 8
+scheduler = StreamingScheduler(rag, max_batch_size=UI_WORKERS)
 
-def respond(query, history):
-    """Generate streaming response with Gradio"""
-    result = rag.generate_response(query)
-    response = result['answer']
-    
-    # Format sources
-    sources = "\n\n## Sources:\n" + "\n".join([
-        f"**Product: {meta['product']}**\n{text[:200]}..."
-        for text, meta in zip(
-            result['sources']['documents'][0],
-            result['sources']['metadatas'][0]
-        )
+AUTO_PRODUCT = "Auto-detect"
+ALL_PRODUCTS = "All products"
+
+def resolve_product(query, product_choice):
+    """Map the product selector to a retrieval filter"""
+    if product_choice == AUTO_PRODUCT:
+        return detect_product(query)
+    if product_choice == ALL_PRODUCTS:
+        return None
+    return product_choice
+
+def render_status():
+    """Markdown summary of model loading progress"""
+    status = rag.status()
+    if status['ready']:
+        stats = rag.streaming_stats()
+        if stats['ttft_p50_s'] is None:
+            return "✅ Ready"
+        return f"✅ Ready · time to first token p50 {stats['ttft_p50_s']:.2f}s over {stats['streams']} answers"
+    parts = []
+    for name, component in status['components'].items():
+        seconds = f" ({component['seconds']:.1f}s)" if component['seconds'] is not None else ""
+        parts.append(f"{name}: {component['state']}{seconds}")
+    return "⏳ Loading models... " + " · ".join(parts)
+
+def log_ready():
+    """Report how long after start-up the system could answer"""
+    ready = rag.wait_until_ready()
+    logger.info(f"RAG system {'ready' if ready else 'failed to load'} "
+                f"{time.perf_counter() - APP_START:.2f}s after start: {rag.status()['components']}")
+
+def format_sources(sources):
+    """Markdown list of retrieved chunks"""
+    if sources.get('aggregate'):
+        facts = sources['aggregate']
+        return (f"\n\n## Sources:\nComplaint trend cube: {facts['total']:,} complaints, "
+                f"{facts['with_narrative']:,} with narratives")
+    if not sources.get('documents'):
+        return ""
+    return "\n\n## Sources:\n" + "\n".join([
+        f"**Product: {meta['product']}**{similar_complaints(meta)}\n{text[:200]}..."
+        for text, meta in zip(sources['documents'][0], sources['metadatas'][0])
     ])
-    
-    # Stream tokens
-    full_response = response + sources
-    for i in range(len(full_response)):
-        time.sleep(0.02)
-        yield full_response[:i+1]
+
+def similar_complaints(meta):
+    """Note on how many near-duplicate complaints a source stands for"""
+    count = int((meta or {}).get('duplicate_count') or 1)
+    return f" (+{count - 1} near-identical complaints)" if count > 1 else ""
+
+def respond(history, product_choice=AUTO_PRODUCT):
+    """Stream the answer to the last question into the chat history"""
+    query = history[-1][0]
+    if not rag.is_ready:
+        history[-1][1] = "⏳ Models are still loading; your question will be answered as soon as they are ready."
+        yield history
+    if not _first_request.is_set():
+        _first_request.set()
+        logger.info(f"First request {time.perf_counter() - APP_START:.2f}s after start")
+
+    # Sources are shown as soon as retrieval finishes, then tokens as they arrive
+    answer, sources = "", ""
+    for event in scheduler.stream(query, product=resolve_product(query, product_choice)):
+        if event['type'] == 'sources':
+            sources = format_sources(event['sources'])
+        elif event['type'] == 'token':
+            answer += event['text']
+        else:
+            answer = event['answer']
+            if event['type'] == 'done':
+                logger.info(f"Answered in {event.get('total_seconds') or 0:.2f}s, "
+                            f"first token after {event['ttft_seconds'] or 0:.2f}s")
+        history[-1][1] = (answer or "_Generating..._") + sources
+        yield history
 
 # Build Gradio interface
 with gr.Blocks(theme=gr.themes.Soft()) as demo:
     gr.Markdown("# 🏦 CrediTrust Complaint Analyst")
     gr.Markdown("Ask questions about customer feedback across financial products")
+    status = gr.Markdown(render_status())
     
     chatbot = gr.Chatbot(height=500)
     msg = gr.Textbox(label="Your Question")
+    product = gr.Dropdown(
+        choices=[AUTO_PRODUCT, ALL_PRODUCTS, *PRODUCT_KEYWORDS],
+        value=AUTO_PRODUCT,
+        label="Product"
+    )
     clear = gr.Button("Clear History")
     
     def user(user_message, history):
@@ -44,15 +116,22 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         queue=False
     ).then(
         fn=respond,
-        inputs=[msg, chatbot],
+        inputs=[chatbot, product],
         outputs=[chatbot]
     )
     
     clear.click(lambda: None, None, chatbot, queue=False)
+    demo.load(render_status, None, status, every=2)
 
 if __name__ == "__main__":
-    demo.queue().launch(
+    threading.Thread(target=log_ready, daemon=True).start()
+    # Prometheus scrapes /metrics here; set RAG_TRACE_FILE to also write JSONL spans
+    serve_metrics(int(os.environ.get("RAG_METRICS_PORT", METRICS_PORT)))
+    demo.queue(concurrency_count=UI_WORKERS).launch(
         server_name="0.0.0.0",
         server_port=7860,
-        share=False
-    )
\ No newline at end of file
+        share=False,
+        prevent_thread_lock=True
+    )
+    logger.info(f"UI serving {time.perf_counter() - APP_START:.2f}s after start")
+    demo.block_thread()
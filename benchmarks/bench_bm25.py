@@ -0,0 +1,55 @@
+"""Build time, load time and query latency of the BM25 index
+
+Run from the project root:
+    python -m benchmarks.bench_bm25 --chunks 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from src.artifacts import write_artifact
+from src.bm25 import BM25Index, build_bm25_index
+
+def make_chunks(rows: int, words: int = 80, vocabulary: int = 50_000, seed: int = 0) -> pd.DataFrame:
+    """Chunks drawn from a Zipf-distributed vocabulary, like real narratives"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.2, size=(rows, words)), vocabulary)
+    return pd.DataFrame({
+        'text': [" ".join(f"w{r}" for r in row) for row in ranks],
+        'complaint_id': np.arange(rows),
+        'product': np.array(['BNPL', 'Credit Card', 'Money Transfer'])[np.arange(rows) % 3],
+        'chunk_id': [f"{i}_0" for i in range(rows)],
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 inverted index")
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chunks_path = os.path.join(tmp, "chunks.parquet")
+        write_artifact(make_chunks(args.chunks), chunks_path)
+        start = time.perf_counter()
+        build_bm25_index(chunks_path, os.path.join(tmp, "bm25"))
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = BM25Index.load(os.path.join(tmp, "bm25"))
+        load_seconds = time.perf_counter() - start
+
+        rng = np.random.default_rng(1)
+        queries = [" ".join(f"w{r}" for r in rng.integers(2, 5000, size=4)) for _ in range(args.queries)]
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.query([query], args.k)
+            latencies.append(time.perf_counter() - start)
+
+    print(f"chunks={args.chunks} postings={index.meta['n_postings']} terms={index.meta['n_terms']}")
+    print(f"build {build_seconds:.1f}s  load {load_seconds * 1e3:.1f}ms  "
+          f"query p50 {np.percentile(latencies, 50) * 1e3:.2f}ms  p95 {np.percentile(latencies, 95) * 1e3:.2f}ms")
@@ -0,0 +1,59 @@
+"""Micro-benchmark for TextSplitter on very long narratives
+
+Run from the project root:
+    python -m benchmarks.bench_chunking
+
+Time per word should stay flat as narratives grow if splitting is linear.
+"""
+import argparse
+import random
+import time
+
+from src.chunking import TextSplitter
+
+VOCABULARY = ["account", "fee", "late", "payment", "card", "bank", "credit", "loan",
+              "transfer", "refund", "charged", "interest", "xxxx", "100.50", "dispute"]
+
+def make_narrative(n_words: int, seed: int = 0) -> str:
+    """Build a synthetic narrative with sentences and paragraphs"""
+    rng = random.Random(seed)
+    words = []
+    for i in range(n_words):
+        word = rng.choice(VOCABULARY)
+        if i % 17 == 16:
+            word += "."
+        if i % 211 == 210:
+            word += "\n\n"
+        words.append(word)
+    return " ".join(words)
+
+def bench(n_words: int, splitter: TextSplitter, repeat: int) -> dict:
+    """Time split_text_with_offsets on one narrative length"""
+    text = make_narrative(n_words)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = splitter.split_text_with_offsets(text)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "words": n_words,
+        "chunks": len(chunks),
+        "seconds": best,
+        "us_per_word": best / n_words * 1e6,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark TextSplitter on long narratives")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    splitter = TextSplitter(args.chunk_size, args.chunk_overlap)
+    print(f"{'words':>10} {'chunks':>8} {'seconds':>10} {'us/word':>8}")
+    for size in args.sizes:
+        result = bench(size, splitter, args.repeat)
+        print(f"{result['words']:>10} {result['chunks']:>8} "
+              f"{result['seconds']:>10.4f} {result['us_per_word']:>8.3f}")
@@ -0,0 +1,128 @@
+"""Generation speed, memory and answer agreement of the CPU inference mode
+
+Run from the project root:
+    python -m benchmarks.bench_cpu_inference --threads 4
+
+Each configuration runs in its own process so memory is not shared. Memory
+is reported three ways: the peak while loading (float32 weights are read
+before they are quantized, so this is near the float32 size for both
+configurations), the resident size once the model is loaded, and the peak
+during generation. Decoding is greedy, so agreement measures the effect of
+quantization alone.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+
+from benchmarks.bench_pipeline import StageMemory, status_mb
+from src.rag_logic import LLM_MODEL, PROMPT_TEMPLATE
+
+QUESTIONS = [
+    "Why are customers unhappy with BNPL?",
+    "What fees do credit card customers complain about?",
+    "What goes wrong with money transfers?",
+    "Why are personal loan applications rejected?",
+    "What problems do customers report with savings accounts?",
+]
+CONTEXTS = [
+    "i was charged a late fee even though i paid on time and the company refused to refund it",
+    "my zelle transfer never arrived and the bank said it could not reverse the payment",
+    "the interest rate on my savings account was lowered without any notice",
+    "my loan application was denied with no explanation after a hard credit inquiry",
+    "they keep adding an annual fee i never agreed to and customer service hangs up",
+]
+
+def build_prompts(n: int) -> list:
+    return [PROMPT_TEMPLATE.format(
+        context="\n".join(f"[Source {j + 1}] {CONTEXTS[(i + j) % len(CONTEXTS)]}" for j in range(3)),
+        question=QUESTIONS[i % len(QUESTIONS)]) for i in range(n)]
+
+def run_config(model_name: str, optimized: bool, threads: int, prompts: list, new_tokens: int) -> dict:
+    import torch
+    from src.inference import PrefixKVCache, configure_torch_threads, load_generator
+
+    configure_torch_threads(threads)
+    memory = StageMemory()
+    start = time.perf_counter()
+    tokenizer, model = load_generator(model_name, "cpu", cpu_int8=optimized)
+    prefix_cache = (PrefixKVCache(model, tokenizer, PROMPT_TEMPLATE.split("{context}")[0])
+                    if optimized else None)
+    load_seconds = time.perf_counter() - start
+    load_memory = memory.stop()
+    loaded_rss_mb = status_mb("VmRSS") if load_memory['memory_source'] == "VmHWM" else None
+
+    memory = StageMemory()
+    answers, generated, seconds = [], 0, 0.0
+    with torch.no_grad():
+        for prompt in prompts:
+            inputs = prefix_cache.inputs_for(prompt, 512) if prefix_cache else None
+            inputs = inputs or tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
+            start = time.perf_counter()
+            output = model.generate(**inputs, max_new_tokens=new_tokens, do_sample=False)
+            seconds += time.perf_counter() - start
+            if not model.config.is_encoder_decoder:
+                output = output[:, inputs['input_ids'].shape[1]:]
+            generated += int((output[0] != tokenizer.pad_token_id).sum())
+            answers.append(tokenizer.decode(output[0], skip_special_tokens=True))
+    return {
+        'config': "cpu-int8" if optimized else "float32",
+        'load_s': load_seconds,
+        'tokens_per_second': generated / seconds if seconds else 0.0,
+        'load_peak_rss_mb': load_memory['peak_rss_mb'],
+        'loaded_rss_mb': loaded_rss_mb,
+        'generate_peak_rss_mb': memory.stop()['peak_rss_mb'],
+        'kv_prefix_cache': bool(prefix_cache and prefix_cache.enabled),
+        'answers': answers,
+    }
+
+def token_f1(a: str, b: str) -> float:
+    a, b = a.split(), b.split()
+    common = sum(min(a.count(t), b.count(t)) for t in set(a))
+    if not a or not b or not common:
+        return float(a == b)
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CPU-optimized generation")
+    parser.add_argument("--model", default=LLM_MODEL)
+    parser.add_argument("--prompts", type=int, default=10)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--config", choices=["float32", "cpu-int8"], default=None,
+                        help="Run a single configuration (used internally)")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if args.config:
+        result = run_config(args.model, args.config == "cpu-int8", args.threads,
+                            build_prompts(args.prompts), args.new_tokens)
+        with open(args.out, "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    results = []
+    for config in ("float32", "cpu-int8"):
+        with tempfile.NamedTemporaryFile(suffix=".json") as out:
+            command = [sys.executable, "-m", "benchmarks.bench_cpu_inference", "--config", config,
+                       "--model", args.model, "--prompts", str(args.prompts),
+                       "--new-tokens", str(args.new_tokens), "--out", out.name]
+            if args.threads:
+                command += ["--threads", str(args.threads)]
+            subprocess.run(command, check=True)
+            results.append(json.load(open(out.name)))
+
+    baseline = results[0]['answers']
+    for result in results:
+        answers = result.pop('answers')
+        result['exact_agreement'] = sum(a == b for a, b in zip(answers, baseline)) / len(baseline)
+        result['token_f1'] = sum(token_f1(a, b) for a, b in zip(answers, baseline)) / len(baseline)
+    table = pd.DataFrame(results)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    print(f"speedup {table['tokens_per_second'][1] / table['tokens_per_second'][0]:.2f}x, "
+          f"loaded size {table['loaded_rss_mb'][1] / table['loaded_rss_mb'][0]:.2f}x, "
+          f"load peak {table['load_peak_rss_mb'][1] / table['load_peak_rss_mb'][0]:.2f}x of float32")
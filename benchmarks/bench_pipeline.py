@@ -0,0 +1,260 @@
+"""End-to-end offline benchmark of every pipeline stage on synthetic complaints
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline --complaints 20000 --out bench.json
+    python -m benchmarks.bench_pipeline --complaints 20000 --compare bench.json
+
+Embedding and generation use deterministic stub models unless local model
+paths are given, so the suite needs no network. Results (throughput,
+latency percentiles and peak memory per stage) are written as JSON; with
+``--compare`` throughput drops or latency and memory rises beyond
+``--tolerance`` against a previous run are reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+import numpy as np
+
+from benchmarks.synthetic import ISSUES, generate_complaints, generator_config
+from src.artifacts import write_artifact
+from src.bm25 import BM25Index, build_bm25_index
+from src.chunking import create_chunks
+from src.context import pack_context, token_counter, whitespace_counter
+from src.data_processing import clean_narrative, preprocess_data
+from src.embedding import run_embedding_pipeline
+from src.rag_logic import PROMPT_TEMPLATE
+from src.vector_index import FlatIndexBuilder
+
+MEMORY_NOISE_MB = 5
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embedder with the SentenceTransformer ``encode`` API"""
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, convert_to_numpy=True):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                embeddings[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+class EchoGenerator:
+    """Stand-in LLM that answers with the first words of its context"""
+    def generate(self, prompt: str, max_new_tokens: int) -> str:
+        context = prompt.split("Context:", 1)[-1]
+        return " ".join(context.split()[:max_new_tokens])
+
+def status_mb(field: str) -> float:
+    """``VmRSS``/``VmHWM``-style field of /proc/self/status in MB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+    raise OSError(f"{field} missing from /proc/self/status")
+
+class StageMemory:
+    """Peak memory of one stage
+
+    ``ru_maxrss`` is a process-lifetime high-water mark, so every stage after
+    the hungriest would repeat its figure. On Linux the kernel's RSS
+    high-water mark (VmHWM) is reset when the stage starts; elsewhere
+    tracemalloc's peak of traced allocations (numpy arrays included) is used.
+    ``peak_delta_mb`` is the stage's own growth over the RSS it started at.
+    """
+    def __init__(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self.source = "VmHWM"
+            self.start_mb = status_mb("VmRSS")
+        except OSError:
+            self.source = "tracemalloc"
+            self.start_mb = None
+            tracemalloc.start()
+
+    def stop(self) -> dict:
+        if self.source == "VmHWM":
+            peak_mb = status_mb("VmHWM")
+            delta_mb = peak_mb - self.start_mb
+        else:
+            delta_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            peak_mb = None
+        return {'rss_start_mb': self.start_mb, 'peak_rss_mb': peak_mb, 'peak_delta_mb': delta_mb,
+                'memory_source': self.source}
+
+def latency_stats(latencies: list) -> dict:
+    latencies_ms = np.asarray(latencies) * 1e3
+    return {f"p{q}_ms": float(np.percentile(latencies_ms, q)) for q in (50, 95, 99)}
+
+def timed_stage(results: dict, name: str, items: int, seconds: float, memory: StageMemory, **extra):
+    results[name] = {'items': items, 'seconds': seconds,
+                     'throughput_per_s': items / seconds if seconds else 0.0,
+                     **memory.stop(), **extra}
+    print(f"{name:<12} {items:>9} items {seconds:>8.2f}s "
+          f"{results[name]['throughput_per_s']:>11.1f}/s  +{results[name]['peak_delta_mb']:.0f}MB peak")
+
+def run_suite(args) -> dict:
+    stages = {}
+    raw = generate_complaints(args.complaints, seed=args.seed)
+    narratives = raw['Consumer complaint narrative'].dropna().tolist()
+
+    sample = narratives[:args.latency_samples]
+    memory = StageMemory()
+    latencies = []
+    for text in sample:
+        start = time.perf_counter()
+        clean_narrative(text)
+        latencies.append(time.perf_counter() - start)
+    timed_stage(stages, "clean", len(sample), sum(latencies), memory, **latency_stats(latencies))
+
+    memory = StageMemory()
+    start = time.perf_counter()
+    processed = preprocess_data(raw.copy(), n_jobs=args.jobs)
+    timed_stage(stages, "preprocess", len(raw), time.perf_counter() - start, memory)
+
+    memory = StageMemory()
+    start = time.perf_counter()
+    chunks = create_chunks(processed)
+    timed_stage(stages, "chunk", len(processed), time.perf_counter() - start, memory,
+                chunks=len(chunks))
+
+    if args.embedder:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.embedder)
+    else:
+        model = HashingEmbedder()
+    # Product order gives the flat index contiguous partitions, as in production
+    chunks = chunks.sort_values('product', kind='stable').reset_index(drop=True)
+    texts = chunks['text'].tolist()
+    embeddings = np.zeros((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def write_batch(positions, batch_embeddings):
+        embeddings[positions] = batch_embeddings
+
+    memory = StageMemory()
+    start = time.perf_counter()
+    run_embedding_pipeline(model, texts, list(range(len(texts))), write_batch)
+    timed_stage(stages, "embed", len(texts), time.perf_counter() - start, memory)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = StageMemory()
+        start = time.perf_counter()
+        builder = FlatIndexBuilder(os.path.join(tmp, "flat"), len(texts), embeddings.shape[1])
+        builder.add(np.arange(len(texts)), embeddings)
+        index = builder.finalize(chunks[['chunk_id', 'complaint_id', 'product', 'text']], "benchmark")
+        chunks_path = os.path.join(tmp, "chunks.parquet")
+        write_artifact(chunks, chunks_path)
+        build_bm25_index(chunks_path, os.path.join(tmp, "bm25"))
+        lexical = BM25Index.load(os.path.join(tmp, "bm25"))
+        timed_stage(stages, "index", len(texts), time.perf_counter() - start, memory)
+
+        rng = np.random.default_rng(args.seed + 1)
+        questions = [f"customers complaining about {rng.choice(ISSUES)} and {rng.choice(ISSUES)}"
+                     for _ in range(args.queries)]
+        query_embeddings = model.encode(questions, convert_to_numpy=True)
+        memory = StageMemory()
+        latencies, retrieved = [], []
+        for question, embedding in zip(questions, query_embeddings):
+            start = time.perf_counter()
+            dense = index.query([embedding], n_results=args.k)
+            lexical.query([question], n_results=args.k)
+            latencies.append(time.perf_counter() - start)
+            retrieved.append(dense)
+        timed_stage(stages, "retrieve", len(questions), sum(latencies), memory, **latency_stats(latencies))
+
+    if args.llm:
+        from src.inference import load_generator
+        tokenizer, llm = load_generator(args.llm)
+        count_tokens = token_counter(tokenizer)
+
+        def generate(prompt):
+            inputs = tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
+            return llm.generate(**inputs, max_new_tokens=args.new_tokens, do_sample=False)
+    else:
+        count_tokens, generator = whitespace_counter, EchoGenerator()
+
+        def generate(prompt):
+            return generator.generate(prompt, args.new_tokens)
+
+    memory = StageMemory()
+    latencies = []
+    for question, results in zip(questions, retrieved):
+        start = time.perf_counter()
+        frame = PROMPT_TEMPLATE.format(context="", question=question)
+        context, _ = pack_context(results, count_tokens, 512 - count_tokens([frame])[0])
+        generate(PROMPT_TEMPLATE.format(context=context, question=question))
+        latencies.append(time.perf_counter() - start)
+    timed_stage(stages, "generate", len(questions), sum(latencies), memory, **latency_stats(latencies))
+    return stages
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Stages whose throughput fell or p95 latency or peak memory rose by more than ``tolerance``"""
+    regressions = []
+    for name, stage in current['stages'].items():
+        old = baseline['stages'].get(name)
+        if not old:
+            continue
+        if old['throughput_per_s'] and stage['throughput_per_s'] < old['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old['throughput_per_s']:.1f} -> "
+                               f"{stage['throughput_per_s']:.1f}/s")
+        if old.get('p95_ms') and stage.get('p95_ms', 0) > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.2f} -> {stage['p95_ms']:.2f}ms")
+        # A few MB of allocator noise is not a regression, however small the baseline
+        if (old.get('memory_source') == stage['memory_source']
+                and stage['peak_delta_mb'] > old['peak_delta_mb'] * (1 + tolerance)
+                and stage['peak_delta_mb'] - old['peak_delta_mb'] > MEMORY_NOISE_MB):
+            regressions.append(f"{name}: peak memory +{old['peak_delta_mb']:.1f} -> "
+                               f"+{stage['peak_delta_mb']:.1f}MB")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of every pipeline stage")
+    parser.add_argument("--complaints", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--latency-samples", type=int, default=2000)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--embedder", default=None, help="Local SentenceTransformer path instead of the stub")
+    parser.add_argument("--llm", default=None, help="Local generator model path instead of the stub")
+    parser.add_argument("--out", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = {
+        'commit': git_commit(),
+        'created_at': time.time(),
+        'config': {**{k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+                   'generator': generator_config(), 'cpus': os.cpu_count()},
+        'stages': run_suite(args),
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
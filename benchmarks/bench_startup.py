@@ -0,0 +1,62 @@
+"""Import time per module and cold start of the RAG system
+
+Run from the project root:
+    python -m benchmarks.bench_startup
+
+Each module is imported in a fresh interpreter, so times include everything
+it pulls in. The cold-start part needs the model dependencies and a built
+index; it is skipped when torch is not installed.
+"""
+import argparse
+import subprocess
+import sys
+import time
+import pandas as pd
+
+MODULES = [
+    "numpy", "pandas", "pyarrow", "torch", "transformers", "sentence_transformers",
+    "chromadb", "gradio", "src.utils", "src.cache", "src.vector_index", "src.bm25",
+    "src.rag_logic",
+]
+
+def import_seconds(module: str) -> float:
+    """Wall time to import a module in a new interpreter, or ``None`` if missing"""
+    code = (f"import time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return float(result.stdout.strip().splitlines()[-1]) if result.returncode == 0 else None
+
+def cold_start(question: str, background: bool) -> dict:
+    """Seconds until the constructor returns, each component loads and a first answer"""
+    start = time.perf_counter()
+    from src.rag_logic import RAGSystem
+    imported = time.perf_counter() - start
+    rag = RAGSystem(background=background)
+    constructed = time.perf_counter() - start
+    rag.wait_until_ready()
+    ready = time.perf_counter() - start
+    rag.generate_response(question, use_cache=False)
+    return {
+        'mode': "background" if background else "eager",
+        'import_s': imported,
+        'constructor_s': constructed,
+        **{f"{name}_s": seconds for name, seconds in rag.load_seconds.items()},
+        'ready_s': ready,
+        'first_answer_s': time.perf_counter() - start,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark imports and RAG cold start")
+    parser.add_argument("--question", default="Why are customers unhappy with BNPL?")
+    parser.add_argument("--eager", action="store_true",
+                        help="Time blocking construction instead of background loading")
+    args = parser.parse_args()
+
+    imports = pd.DataFrame([{'module': m, 'import_s': import_seconds(m)} for m in MODULES])
+    print(imports.to_string(index=False, na_rep="not installed", float_format=lambda v: f"{v:.3f}"))
+
+    if import_seconds("torch") is None:
+        print("torch not installed; skipping cold-start measurement")
+    else:
+        result = cold_start(args.question, background=not args.eager)
+        print(pd.Series(result).to_string(float_format=lambda v: f"{v:.2f}"))
@@ -0,0 +1,102 @@
+"""Latency and recall of the flat vector index against Chroma's HNSW
+
+Run from the project root:
+    python -m benchmarks.bench_vector_index --rows 200000
+
+Ground truth is exact float32 cosine top-k. Chroma is skipped when chromadb
+is not installed.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from src.vector_index import FlatIndexBuilder, FlatVectorIndex, normalize_rows
+
+def make_embeddings(rows: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered synthetic embeddings, closer to real text than pure noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return normalize_rows(centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32))
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def bench_flat(directory: str, embeddings: np.ndarray, queries: np.ndarray,
+               truth: np.ndarray, k: int, dtype: str) -> dict:
+    n, dim = embeddings.shape
+    records = pd.DataFrame({'chunk_id': [str(i) for i in range(n)]})
+    builder = FlatIndexBuilder(directory, n, dim, dtype)
+    builder.add(np.arange(n), embeddings)
+    builder.finalize(records, "synthetic")
+    start = time.perf_counter()
+    index = FlatVectorIndex.load(directory)
+    open_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        _, rows = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    _, rows = index.search(queries, k)
+    batch_seconds = time.perf_counter() - start
+    return {
+        'backend': f"flat-{dtype}",
+        'open_s': open_seconds,
+        'p50_ms': np.percentile(latencies, 50) * 1e3,
+        'p95_ms': np.percentile(latencies, 95) * 1e3,
+        'batch_ms_per_query': batch_seconds / len(queries) * 1e3,
+        'recall': recall_at_k(rows, truth),
+        'vector_mb': index.vectors.nbytes / 2**20,
+    }
+
+def bench_chroma(directory: str, embeddings: np.ndarray, queries: np.ndarray,
+                 truth: np.ndarray, k: int) -> dict:
+    import chromadb
+
+    client = chromadb.PersistentClient(path=directory)
+    collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+    for start in range(0, len(embeddings), 5000):
+        batch = embeddings[start:start + 5000]
+        collection.add(ids=[str(i) for i in range(start, start + len(batch))],
+                       embeddings=batch.tolist())
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - start)
+        found.append([int(i) for i in result['ids'][0]])
+    return {
+        'backend': "chroma-hnsw",
+        'p50_ms': np.percentile(latencies, 50) * 1e3,
+        'p95_ms': np.percentile(latencies, 95) * 1e3,
+        'recall': recall_at_k(np.array(found), truth),
+        'vector_mb': embeddings.astype(np.float32).nbytes / 2**20,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark flat vector index vs Chroma")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    embeddings = make_embeddings(args.rows, args.dim)
+    queries = make_embeddings(args.queries, args.dim, seed=1)
+    truth = np.argsort(-(queries @ embeddings.T), axis=1)[:, :args.k]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float16", "int8"):
+            results.append(bench_flat(f"{tmp}/{dtype}", embeddings, queries, truth, args.k, dtype))
+        try:
+            results.append(bench_chroma(f"{tmp}/chroma", embeddings, queries, truth, args.k))
+        except ImportError:
+            print("chromadb not installed; skipping HNSW comparison")
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
@@ -0,0 +1,89 @@
+"""Deterministic synthetic CFPB complaints for offline benchmarks
+
+Product mix and the share of missing narratives come from
+``docs/eda_stats.json``. The EDA only records the median over all rows (0,
+since most narratives are missing), so non-empty narrative lengths follow a
+log-normal in words whose parameters are recorded with every benchmark run.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from src.data_processing import PRODUCT_MAP
+from src.utils import get_project_root
+
+# Median and log-space spread of non-empty narrative lengths, in words
+NARRATIVE_MEDIAN_WORDS = 180
+NARRATIVE_SIGMA = 0.85
+MAX_NARRATIVE_WORDS = 6000
+
+ISSUES = ["late fee", "unauthorized charge", "interest rate", "chargeback", "zelle transfer",
+          "wire transfer", "credit limit", "annual fee", "loan application", "account closed",
+          "payment not credited", "identity theft", "collection call", "overdraft", "refund"]
+VOCABULARY = (
+    "i my the bank company account card payment loan they would not refund charged fee "
+    "called customer service told me was and to for on with after months days again "
+    "never received money transfer balance statement dispute credit report interest "
+    "closed without notice asked manager escalate denied approved paid time due "
+    "website app error fraud scam stolen reported police letter email branch"
+).split()
+BOILERPLATE = ["I am writing to file a complaint.", "Dear Sir or Madam,",
+               "To whom it may concern,", "Please see below for details."]
+
+def load_eda_stats(path: str = None) -> dict:
+    """The EDA summary the generator is calibrated to"""
+    path = path or os.path.join(get_project_root(), "docs", "eda_stats.json")
+    with open(path) as f:
+        stats = json.load(f)
+    return stats[0] if isinstance(stats, list) else stats
+
+def product_mix(stats: dict, target_only: bool = True) -> dict:
+    """Product shares; ``target_only`` keeps products the pipeline does not filter out"""
+    counts = {product: count for product, count in stats['products'].items()
+              if not target_only or product in PRODUCT_MAP}
+    total = sum(counts.values())
+    return {product: count / total for product, count in counts.items()}
+
+def _narrative(rng: np.random.Generator, n_words: int) -> str:
+    words = list(rng.choice(VOCABULARY, size=n_words))
+    for position in rng.integers(0, n_words, size=max(1, n_words // 40)):
+        words[position] = str(rng.choice(ISSUES))
+    for position in rng.integers(0, n_words, size=max(1, n_words // 60)):
+        amount = f"${rng.integers(5, 5000)}.{rng.integers(0, 100):02d}"
+        words[position] = str(rng.choice(["XXXX", "XX/XX/XXXX", amount]))
+    sentences, start = [], 0
+    while start < n_words:
+        end = min(n_words, start + int(rng.integers(8, 25)))
+        sentence = " ".join(words[start:end])
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+        start = end
+    if rng.random() < 0.3:
+        sentences.insert(0, str(rng.choice(BOILERPLATE)))
+    return " ".join(sentences)
+
+def generate_complaints(n: int, seed: int = 0, target_only: bool = True,
+                        stats: dict = None) -> pd.DataFrame:
+    """Raw-format complaints with the real product mix and missing-narrative rate"""
+    stats = stats or load_eda_stats()
+    rng = np.random.default_rng(seed)
+    mix = product_mix(stats, target_only)
+    products = rng.choice(list(mix), size=n, p=list(mix.values()))
+    missing = rng.random(n) < stats['missing_narratives'] / stats['total_records']
+    lengths = np.clip(rng.lognormal(np.log(NARRATIVE_MEDIAN_WORDS), NARRATIVE_SIGMA, size=n),
+                      1, MAX_NARRATIVE_WORDS).astype(int)
+    narratives = [None if missing[i] else _narrative(rng, lengths[i]) for i in range(n)]
+    return pd.DataFrame({
+        'Complaint ID': np.arange(1, n + 1),
+        'Product': products,
+        'Consumer complaint narrative': narratives,
+    })
+
+def generator_config(target_only: bool = True) -> dict:
+    """Parameters that define the synthetic data, stored with results"""
+    return {
+        'narrative_median_words': NARRATIVE_MEDIAN_WORDS,
+        'narrative_sigma': NARRATIVE_SIGMA,
+        'max_narrative_words': MAX_NARRATIVE_WORDS,
+        'target_only': target_only,
+    }
@@ -0,0 +1,154 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+# Intermediate artifacts are columnar by default; CSV remains an export format
+ARTIFACT_FORMAT = "parquet"
+PARQUET_COMPRESSION = "zstd"
+
+# Low-cardinality columns stored as dictionary-encoded / categorical
+CATEGORICAL_COLUMNS = ('Product', 'product')
+
+def artifact_path(directory: str, name: str, fmt: str = ARTIFACT_FORMAT) -> str:
+    """Build the path of a pipeline artifact in the given format"""
+    return os.path.join(directory, f"{name}.{fmt}")
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+def _encode_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert known low-cardinality columns to categoricals"""
+    columns = [col for col in CATEGORICAL_COLUMNS
+               if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not columns:
+        return df
+    return df.astype({col: 'category' for col in columns})
+
+def write_artifact(df: pd.DataFrame, path: str):
+    """Write a DataFrame artifact, choosing the format from the file extension"""
+    logger.info(f"Writing {len(df)} records to {path}")
+    with ArtifactWriter(path) as writer:
+        writer.write(df)
+
+def read_artifact(path: str, columns: list = None) -> pd.DataFrame:
+    """Read an artifact, loading only the requested columns
+
+    Parquet files are memory-mapped and dictionary columns come back as
+    categoricals, so nothing is re-parsed or re-inferred.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Artifact not found at {path}")
+    logger.info(f"Reading {columns or 'all columns'} from {path}")
+    if _is_parquet(path):
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+def artifact_columns(path: str) -> list:
+    """Column names of an artifact, read from the Parquet schema or CSV header"""
+    if _is_parquet(path):
+        return pq.ParquetFile(path, memory_map=True).schema_arrow.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def iter_artifact(path: str, columns: list = None, batch_size: int = 100_000):
+    """Iterate over an artifact in DataFrame batches of at most ``batch_size`` rows"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Artifact not found at {path}")
+    if _is_parquet(path):
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size)
+
+def export_csv(path: str, csv_path: str = None) -> str:
+    """Export a Parquet artifact to CSV one row group at a time"""
+    csv_path = csv_path or os.path.splitext(path)[0] + ".csv"
+    logger.info(f"Exporting {path} to {csv_path}")
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    with ArtifactWriter(csv_path) as writer:
+        for i in range(parquet_file.num_row_groups):
+            writer.write(parquet_file.read_row_group(i).to_pandas())
+    return csv_path
+
+def _artifact_schema(schema: pa.Schema) -> pa.Schema:
+    """Schema for every row group, fixed from the first batch
+
+    All-null columns (inferred as the null type) are stored as strings and
+    dictionary indices are widened to int32, so later batches with values or
+    more categories still cast to it.
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+class ArtifactWriter:
+    """Incrementally append DataFrame batches to a Parquet or CSV artifact
+
+    Batches go to ``path + ".tmp"``, which replaces ``path`` only when the
+    writer closes cleanly; if the ``with`` block raises, the partial file is
+    deleted and any previous artifact at ``path`` is left untouched.
+    """
+    def __init__(self, path: str, columns: list = None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.rows = 0
+        self._started = False
+        self._parquet_writer = None
+        self._schema = None
+        self._columns = columns
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, df: pd.DataFrame):
+        """Append one batch; every batch becomes one Parquet row group"""
+        if self._columns is None:
+            self._columns = list(df.columns)
+        if _is_parquet(self.path):
+            table = pa.Table.from_pandas(_encode_categoricals(df), preserve_index=False)
+            if self._parquet_writer is None:
+                self._schema = _artifact_schema(table.schema)
+                self._parquet_writer = pq.ParquetWriter(
+                    self.tmp_path, self._schema, compression=PARQUET_COMPRESSION)
+            self._parquet_writer.write_table(table.cast(self._schema))
+        else:
+            df.to_csv(self.tmp_path, mode='a' if self._started else 'w',
+                      header=not self._started, index=False)
+        self._started = True
+        self.rows += len(df)
+
+    def close(self):
+        """Finalize the artifact, leaving a valid empty file if nothing was written"""
+        if not self._started:
+            self.write(pd.DataFrame(columns=self._columns or []))
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Discard everything written so far"""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            logger.error(f"Discarding partial artifact {self.tmp_path}")
+            self.abort()
+        return False
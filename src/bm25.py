@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from src.artifacts import iter_artifact
+from src.utils import configure_logging, get_project_root
+from src.vector_index import COLLECTION_NAME, PARTITION_COLUMN, contiguous_partitions
+
+logger = configure_logging()
+
+# Terms are stored in a fixed-width array so the vocabulary can be memory-mapped
+MAX_TERM_LENGTH = 32
+TERM_DTYPE = f"<U{MAX_TERM_LENGTH}"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from had has have he her his i if in into is it its
+me my of on or our she so than that the their them then there these they this to was we
+were which who will with you your
+""".split())
+
+SIDECAR_COLUMNS = ['chunk_id', 'complaint_id', 'product', 'text']
+
+def get_bm25_dir(name: str = COLLECTION_NAME) -> str:
+    """Get absolute path to a BM25 index directory"""
+    return os.path.join(get_project_root(), "vectorstore", "bm25", name)
+
+def tokenize(text: str) -> list:
+    """Lower-case alphanumeric terms (decimals kept whole), without stopwords"""
+    if not isinstance(text, str):
+        return []
+    return [term for term in _TOKEN_RE.findall(text.lower())
+            if term not in STOPWORDS and len(term) <= MAX_TERM_LENGTH]
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuse ranked id lists; returns ``(id, score)`` pairs, best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda pair: -pair[1])
+
+def build_bm25_index(chunks_path: str, index_dir: str = None, batch_size: int = 100_000,
+                     k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+    """Build a BM25 inverted index over the chunks artifact
+
+    Postings are stored term-major in flat NumPy arrays (CSR layout: per-term
+    offsets into doc-id and term-frequency arrays) and written next to an
+    Arrow sidecar, all memory-mappable. Documents are numbered in product
+    order, so a product filter is a contiguous doc-id range. The index is
+    built in a scratch directory and swapped in atomically.
+    """
+    index_dir = index_dir or get_bm25_dir()
+    build_dir = index_dir + ".building"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    vocabulary = {}
+    term_parts, doc_parts, tf_parts, lengths, sidecar_parts = [], [], [], [], []
+    n_docs = 0
+    for batch in iter_artifact(chunks_path, columns=SIDECAR_COLUMNS, batch_size=batch_size):
+        batch_terms, batch_docs, batch_tfs = [], [], []
+        for doc_id, text in enumerate(batch['text'].tolist(), start=n_docs):
+            counts = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                batch_terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                batch_docs.append(doc_id)
+                batch_tfs.append(tf)
+        term_parts.append(np.asarray(batch_terms, dtype=np.int32))
+        doc_parts.append(np.asarray(batch_docs, dtype=np.int32))
+        tf_parts.append(np.minimum(np.asarray(batch_tfs, dtype=np.int64), 65535).astype(np.uint16))
+        sidecar_parts.append(pa.Table.from_pandas(batch.astype({'product': str}), preserve_index=False))
+        n_docs += len(batch)
+        logger.info(f"Tokenized {n_docs} chunks, {len(vocabulary)} terms")
+
+    term_ids = np.concatenate(term_parts) if term_parts else np.empty(0, dtype=np.int32)
+    doc_ids = np.concatenate(doc_parts) if doc_parts else np.empty(0, dtype=np.int32)
+    tfs = np.concatenate(tf_parts) if tf_parts else np.empty(0, dtype=np.uint16)
+    del term_parts, doc_parts, tf_parts
+    sidecar = (pa.concat_tables(sidecar_parts) if sidecar_parts
+               else pa.Table.from_pandas(pd.DataFrame(columns=SIDECAR_COLUMNS), preserve_index=False))
+
+    # Renumber documents in product order, like the flat index's partitions
+    products = sidecar.column(PARTITION_COLUMN).to_numpy(zero_copy_only=False)
+    doc_order = np.argsort(products, kind='stable')
+    renumber = np.empty(n_docs, dtype=np.int32)
+    renumber[doc_order] = np.arange(n_docs, dtype=np.int32)
+    doc_ids = renumber[doc_ids]
+    lengths = np.asarray(lengths, dtype=np.int32)[doc_order]
+    sidecar = sidecar.take(doc_order)
+    partitions = contiguous_partitions(products[doc_order])
+
+    # Renumber terms alphabetically so lookups are a binary search on the vocabulary
+    terms = np.array(sorted(vocabulary), dtype=TERM_DTYPE)
+    remap = np.empty(len(vocabulary), dtype=np.int32)
+    remap[[vocabulary[t] for t in terms.tolist()]] = np.arange(len(terms), dtype=np.int32)
+    term_ids = remap[term_ids]
+    order = np.lexsort((doc_ids, term_ids))  # doc ids ascending per term
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+
+    np.save(os.path.join(build_dir, "terms.npy"), terms)
+    np.save(os.path.join(build_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(build_dir, "doc_ids.npy"), doc_ids[order])
+    np.save(os.path.join(build_dir, "tfs.npy"), tfs[order])
+    np.save(os.path.join(build_dir, "doc_lengths.npy"), lengths)
+    with pa.OSFile(os.path.join(build_dir, "sidecar.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, sidecar.schema) as writer:
+            writer.write_table(sidecar)
+    with open(os.path.join(build_dir, "meta.json"), "w") as f:
+        json.dump({
+            'n_docs': n_docs,
+            'n_terms': len(terms),
+            'n_postings': int(len(doc_ids)),
+            'avg_doc_length': float(np.mean(lengths)) if len(lengths) else 0.0,
+            'k1': k1,
+            'b': b,
+            'partitions': {PARTITION_COLUMN: partitions} if partitions else {},
+        }, f, indent=2)
+
+    retired = index_dir + ".old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, retired)
+    os.rename(build_dir, index_dir)
+    shutil.rmtree(retired, ignore_errors=True)
+    logger.info(f"Wrote BM25 index with {len(terms)} terms and {len(doc_ids)} postings to {index_dir}")
+    return BM25Index.load(index_dir)
+
+class BM25Index:
+    """Memory-mapped BM25 inverted index over chunks
+
+    Loading maps the arrays and sidecar without deserializing them; a query
+    touches only the postings of its own terms.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        self.terms = load("terms")
+        self.offsets = load("offsets")
+        self.doc_ids = load("doc_ids")
+        self.tfs = load("tfs")
+        self.doc_lengths = load("doc_lengths")
+        self.sidecar = pa.ipc.open_file(pa.memory_map(os.path.join(directory, "sidecar.arrow"))).read_all()
+        self.k1 = self.meta['k1']
+        self.b = self.meta['b']
+        self.n_docs = self.meta['n_docs']
+        self._length_norm = None
+        self._codes_cache = {}
+
+    @classmethod
+    def load(cls, directory: str = None) -> "BM25Index":
+        """Open an existing index"""
+        directory = directory or get_bm25_dir()
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            raise FileNotFoundError(f"BM25 index not found at {directory}")
+        return cls(directory)
+
+    def partitions(self, column: str = PARTITION_COLUMN) -> dict:
+        """Contiguous ``{value: (start, end)}`` doc-number ranges of a partitioned column"""
+        return {value: tuple(bounds) for value, bounds
+                in self.meta.get('partitions', {}).get(column, {}).items()}
+
+    def codes(self, name: str) -> tuple:
+        """Integer codes of a sidecar column (-1 for nulls) and its ``{value: code}`` lookup, cached"""
+        if name not in self._codes_cache:
+            encoded = self.sidecar.column(name).dictionary_encode().combine_chunks()
+            codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+            lookup = {value: code for code, value in enumerate(encoded.dictionary.to_pylist())}
+            self._codes_cache[name] = (codes, lookup)
+        return self._codes_cache[name]
+
+    def _term_id(self, term: str) -> int:
+        i = int(np.searchsorted(self.terms, term))
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def scores(self, query: str, where: dict = None) -> tuple:
+        """``(doc_numbers, scores)`` of the chunks matching ``query`` and ``where``, ascending doc numbers
+
+        Only the postings of the query's terms are read and scored. Product
+        filters narrow each posting list to the product's doc-number range by
+        binary search; other ``where`` columns are compared as integer codes
+        over the scored documents only.
+        """
+        if self._length_norm is None:
+            avg = self.meta['avg_doc_length'] or 1.0
+            self._length_norm = (self.k1 * (1 - self.b + self.b * np.asarray(self.doc_lengths) / avg)
+                                 ).astype(np.float32)
+        low, high, remaining = 0, self.n_docs, {}
+        for key, value in (where or {}).items():
+            partitions = self.partitions(key)
+            if partitions:
+                start, end = partitions.get(str(value), (0, 0))
+                low, high = max(low, start), max(low, min(high, end))
+            else:
+                remaining[key] = value
+
+        doc_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id < 0:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            df = end - start
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            if (low, high) != (0, self.n_docs):
+                first, last = np.searchsorted(self.doc_ids[start:end], [low, high])
+                start, end = start + int(first), start + int(last)
+            docs = np.asarray(self.doc_ids[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + self._length_norm[docs]))
+        if not doc_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(docs))
+        for key, value in remaining.items():
+            codes, lookup = self.codes(key)
+            keep = codes[docs] == lookup.get(value, -2)
+            docs, scores = docs[keep], scores[keep]
+        return docs, scores.astype(np.float32)
+
+    def search(self, query: str, k: int = 10, where: dict = None) -> tuple:
+        """Top-k ``(scores, doc_numbers)`` with a positive score, best first"""
+        docs, scores = self.scores(query, where)
+        positive = scores > 0
+        docs, scores = docs[positive], scores[positive]
+        if len(docs) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))
+        return scores[order], docs[order]
+
+    def query(self, query_texts: list, n_results: int = 10, where: dict = None) -> dict:
+        """Chroma-style results for a batch of query texts"""
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'scores': []}
+        metadata_columns = [col for col in self.sidecar.column_names if col != 'text']
+        for query in query_texts:
+            scores, docs = self.search(query, n_results, where)
+            # Slicing a few rows is constant time; ``take`` on the multi-chunk
+            # sidecar would materialize whole columns
+            taken = (pa.concat_tables([self.sidecar.slice(int(doc), 1) for doc in docs]).to_pydict()
+                     if len(docs) else self.sidecar.slice(0, 0).to_pydict())
+            results['ids'].append(taken['chunk_id'])
+            results['documents'].append(taken['text'])
+            results['metadatas'].append([{col: taken[col][i] for col in metadata_columns}
+                                         for i in range(len(docs))])
+            results['scores'].append(scores.tolist())
+        return results
+
+def fuse_results(dense: dict, lexical: dict, k: int, rrf_k: int = 60) -> dict:
+    """Merge single-query dense and lexical results with reciprocal rank fusion
+
+    Keeps the Chroma result layout; ``distances`` holds the dense distance of
+    each fused chunk (``None`` if only the lexical index found it) and
+    ``scores`` its fused score.
+    """
+    chunks = {}
+    for results in (lexical, dense):
+        distances = results.get('distances', [[None] * len(results['ids'][0])])[0]
+        for chunk_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], distances):
+            chunks[chunk_id] = (document, metadata, distance)
+    fused = reciprocal_rank_fusion([dense['ids'][0], lexical['ids'][0]], rrf_k)[:k]
+    return {
+        'ids': [[chunk_id for chunk_id, _ in fused]],
+        'documents': [[chunks[chunk_id][0] for chunk_id, _ in fused]],
+        'metadatas': [[chunks[chunk_id][1] for chunk_id, _ in fused]],
+        'distances': [[chunks[chunk_id][2] for chunk_id, _ in fused]],
+        'scores': [[score for _, score in fused]],
+    }
@@ -0,0 +1,266 @@
+import atexit
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+class TTLCache:
+    """Thread-safe LRU cache with optional per-entry time-to-live
+
+    ``maxsize`` bounds the number of entries (least recently used are evicted
+    first) and ``ttl`` is the lifetime of an entry in seconds (``None`` keeps
+    entries until evicted). Hit, miss and eviction counters are exposed through
+    ``stats``.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = None, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Insert or refresh an entry, evicting the least recently used if full"""
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, keeping the counters"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Current size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+def normalize_query(query: str) -> str:
+    """Canonical cache key for a query: lower-cased with collapsed whitespace"""
+    return " ".join(query.lower().split())
+
+class SemanticAnswerCache:
+    """LRU cache of generated answers keyed by query-embedding similarity
+
+    A lookup hits when a cached query with the same product scope and index
+    version has cosine similarity of at least ``threshold`` with the new query.
+    Entries expire after ``ttl`` seconds. With a ``path`` the cache is
+    reloaded on start-up and written by a background thread at most every
+    ``save_interval`` seconds after a change (and by ``flush``/``close`` and
+    at exit), so inserts never wait on disk I/O.
+    """
+    def __init__(self, maxsize: int = 512, ttl: float = 24 * 3600, threshold: float = 0.9,
+                 path: str = None, clock=time.time, save_interval: float = 5.0):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.save_interval = save_interval
+        self._version = 0
+        self._saved_version = 0
+        self._save_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._closed = False
+        self._saver = None
+        if path and os.path.exists(path):
+            self._load()
+        if path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and entry['created_at'] + self.ttl <= self._clock()
+
+    def _similarity_matrix(self):
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = (np.stack([self._entries[k]['embedding'] for k in self._keys])
+                            if self._keys else np.empty((0, 0), dtype=np.float32))
+        return self._keys, self._matrix
+
+    def lookup(self, embedding, product=None, index_version=None):
+        """Return ``(response, similarity)`` of the closest valid entry, or ``None``"""
+        query = self._normalize(embedding)
+        with self._lock:
+            keys, matrix = self._similarity_matrix()
+            if keys:
+                similarities = matrix @ query
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    entry = self._entries[keys[i]]
+                    if entry['product'] != product or entry['index_version'] != index_version:
+                        continue
+                    if self._expired(entry):
+                        continue
+                    self._entries.move_to_end(keys[i])
+                    self.hits += 1
+                    return entry['response'], float(similarities[i])
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding, response: dict, product=None, index_version=None):
+        """Store an answer, evicting expired and then least recently used entries"""
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if self._expired(entry)]:
+                del self._entries[key]
+            self._entries[self._next_key] = {
+                'query': query,
+                'embedding': self._normalize(embedding),
+                'response': response,
+                'product': product,
+                'index_version': index_version,
+                'created_at': self._clock(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+            self._mark_changed()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._mark_changed()
+
+    def _mark_changed(self):
+        """Schedule a background save; called with ``_lock`` held"""
+        if not self.path:
+            return
+        self._version += 1
+        if self._saver is None and not self._closed:
+            self._saver = threading.Thread(target=self._save_loop, name="answer-cache-save", daemon=True)
+            self._saver.start()
+        self._changed.set()
+
+    def _save_loop(self):
+        while not self._closed:
+            self._changed.wait()
+            self._changed.clear()
+            if self._closed:
+                return
+            # Coalesce bursts of inserts into one write
+            time.sleep(self.save_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to save answer cache {self.path}: {str(e)}")
+
+    def flush(self):
+        """Write pending changes now; the disk I/O happens outside the lookup lock"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if self._version == self._saved_version:
+                    return
+                version = self._version
+                entries = list(self._entries.values())
+            self._save(entries)
+            self._saved_version = version
+
+    def close(self):
+        """Flush and stop the background saver"""
+        self._closed = True
+        self._changed.set()
+        self.flush()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _save(self, entries: list):
+        """Atomically write entries in LRU order: embeddings as an array, the rest as JSON"""
+        embeddings = (np.stack([e['embedding'] for e in entries]) if entries
+                      else np.empty((0, 0), dtype=np.float32))
+        records = [{k: v for k, v in e.items() if k != 'embedding'} for e in entries]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, embeddings=embeddings, records=np.array(json.dumps(records, default=str)))
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                embeddings = data['embeddings']
+                records = json.loads(str(data['records']))
+        except Exception as e:
+            # A corrupt cache must never stop the service; start empty instead
+            logger.warning(f"Ignoring unreadable answer cache {self.path}: {e}")
+            return
+        for embedding, record in zip(embeddings, records):
+            record['embedding'] = embedding.astype(np.float32)
+            if not self._expired(record):
+                self._entries[self._next_key] = record
+                self._next_key += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
@@ -1,113 +1,215 @@
 import re
 import os
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from src.utils import configure_logging, get_data_path
+from src.artifacts import ArtifactWriter, artifact_columns, artifact_path, export_csv, iter_artifact
+from src.telemetry import span
 
 logger = configure_logging()
 
+_WORD_RE = re.compile(r'\S+')
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+SENTENCE_ENDINGS = r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s'
+
 class TextSplitter:
     """Custom text splitter to avoid LangChain dependencies"""
     def __init__(self, chunk_size=512, chunk_overlap=64):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.sentence_endings = r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s'
+        self.sentence_endings = SENTENCE_ENDINGS
+        self._sentence_re = re.compile(self.sentence_endings)
     
     def split_text(self, text: str) -> list:
-        """Recursively split text into chunks preserving sentence boundaries"""
-        # Base case: text is short enough
-        if len(text.split()) <= self.chunk_size:
-            return [text]
-        
-        # First try splitting by paragraphs
-        paragraphs = re.split(r'\n\s*\n', text)
-        if len(paragraphs) > 1:
-            result = []
-            current_chunk = ""
-            
-            for para in paragraphs:
-                if len(current_chunk.split()) + len(para.split()) <= self.chunk_size:
-                    current_chunk += "\n\n" + para if current_chunk else para
-                else:
-                    if current_chunk:
-                        result.append(current_chunk.strip())
-                    current_chunk = para
-                    
-                    # Add remaining text recursively
-                    if len(para.split()) > self.chunk_size:
-                        result.extend(self.split_text(para))
-            if current_chunk:
-                result.append(current_chunk.strip())
-            return result
-        
-        # Then try splitting by sentences
-        sentences = re.split(self.sentence_endings, text)
-        if len(sentences) > 1:
-            result = []
-            current_chunk = ""
-            
-            for sent in sentences:
-                if len(current_chunk.split()) + len(sent.split()) <= self.chunk_size:
-                    current_chunk += " " + sent if current_chunk else sent
-                else:
-                    if current_chunk:
-                        result.append(current_chunk.strip())
-                    current_chunk = sent[-self.chunk_overlap:] + " " + sent if current_chunk else sent
-            if current_chunk:
-                result.append(current_chunk.strip())
-            return result
-        
-        # Finally split by words
-        words = text.split()
-        return [' '.join(words[i:i+self.chunk_size]) for i in range(0, len(words), self.chunk_size - self.chunk_overlap)]
-
-def create_chunks(df: pd.DataFrame, chunk_size: int = 512, chunk_overlap: int = 64) -> pd.DataFrame:
-    """Split narratives into chunks with metadata"""
-    logger.info(f"Creating text chunks (size={chunk_size}, overlap={chunk_overlap})")
-    
+        """Split text into chunks preserving paragraph and sentence boundaries"""
+        return [chunk for chunk, _, _ in self.split_text_with_offsets(text)]
+
+    def split_text_with_offsets(self, text: str) -> list:
+        """Split text into ``(chunk, start, end)`` tuples with character offsets
+
+        The text is tokenized once. Each chunk holds at most ``chunk_size`` words
+        and ends at the latest paragraph break, then sentence break, found in the
+        second half of its window, falling back to a plain word boundary.
+        Consecutive chunks share ``chunk_overlap`` words. ``text[start:end]`` is
+        exactly the returned chunk.
+        """
+        spans = [m.span() for m in _WORD_RE.finditer(text)]
+        n_words = len(spans)
+        if n_words == 0:
+            return []
+        if n_words <= self.chunk_size:
+            start, end = spans[0][0], spans[-1][1]
+            return [(text[start:end], start, end)]
+
+        word_starts = [start for start, _ in spans]
+        paragraph_before = self._last_boundary(_PARAGRAPH_RE, text, word_starts)
+        sentence_before = self._last_boundary(self._sentence_re, text, word_starts)
+        min_words = self.chunk_size // 2
+
+        chunks = []
+        first = 0
+        while True:
+            last = min(first + self.chunk_size, n_words)
+            if last < n_words:
+                for boundary_before in (paragraph_before, sentence_before):
+                    if boundary_before[last] > first + min_words:
+                        last = boundary_before[last]
+                        break
+            start, end = spans[first][0], spans[last - 1][1]
+            chunks.append((text[start:end], start, end))
+            if last == n_words:
+                return chunks
+            first = max(last - self.chunk_overlap, first + 1)
+
+    @staticmethod
+    def _last_boundary(pattern, text: str, word_starts: list) -> list:
+        """For each word index, the latest index <= it that starts after a boundary"""
+        is_boundary = [False] * len(word_starts)
+        for match in pattern.finditer(text):
+            idx = bisect_left(word_starts, match.start())
+            if 0 < idx < len(word_starts):
+                is_boundary[idx] = True
+
+        last_boundary = [0] * len(word_starts)
+        for idx in range(1, len(word_starts)):
+            last_boundary[idx] = idx if is_boundary[idx] else last_boundary[idx - 1]
+        return last_boundary
+
+DEFAULT_CHUNK_SIZE = 512
+DEFAULT_CHUNK_OVERLAP = 64
+
+CHUNK_COLUMNS = ['text', 'complaint_id', 'product', 'start_index', 'end_index', 'chunk_id']
+
+# Columns of the processed complaints artifact needed for chunking
+INPUT_COLUMNS = ['Complaint ID', 'Product', 'clean_narrative']
+# Optional record columns (near-duplicate clusters) copied onto every chunk
+PASSTHROUGH_COLUMNS = ['duplicate_count', 'duplicate_ids']
+
+# Narratives per partition handed to a chunking worker
+PARTITION_ROWS = 10_000
+
+def _chunk_partition(complaint_ids: list, products: list, texts: list,
+                     chunk_size: int, chunk_overlap: int, extras: dict = None) -> pd.DataFrame:
+    """Chunk one partition of narratives given as parallel column lists
+
+    ``extras`` maps further column names to per-narrative values that every
+    chunk of that narrative inherits.
+    """
     splitter = TextSplitter(chunk_size, chunk_overlap)
-    chunks = []
-    metadata = []
-    
-    for _, row in df.iterrows():
-        text = row['clean_narrative']
+    extras = extras or {}
+    columns = {col: [] for col in [*CHUNK_COLUMNS, *extras]}
+
+    def add(chunk, complaint_id, product, start, end, i, row):
+        columns['text'].append(chunk)
+        columns['complaint_id'].append(complaint_id)
+        columns['product'].append(product)
+        columns['start_index'].append(start)
+        columns['end_index'].append(end)
+        columns['chunk_id'].append(f"{complaint_id}_{i}")
+        for col, values in extras.items():
+            columns[col].append(values[row])
+
+    for row, (complaint_id, product, text) in enumerate(zip(complaint_ids, products, texts)):
         if pd.isna(text) or not text.strip():
             continue
             
         # Skip splitting very short texts
         word_count = len(text.split())
         if word_count < chunk_size // 2:
-            chunks.append(text)
-            metadata.append({
-                'complaint_id': row['Complaint ID'],
-                'product': row['Product'],
-                'start_index': 0,
-                'chunk_id': f"{row['Complaint ID']}_0"
-            })
+            add(text, complaint_id, product, 0, len(text), 0, row)
         else:
-            text_chunks = splitter.split_text(text)
-            for i, chunk in enumerate(text_chunks):
-                chunks.append(chunk)
-                metadata.append({
-                    'complaint_id': row['Complaint ID'],
-                    'product': row['Product'],
-                    'start_index': i * (chunk_size - chunk_overlap),
-                    'chunk_id': f"{row['Complaint ID']}_{i}"
-                })
-    
-    logger.info(f"Created {len(chunks)} chunks from {len(df)} narratives")
-    return pd.DataFrame({'text': chunks, **pd.DataFrame(metadata)})
+            text_chunks = splitter.split_text_with_offsets(text)
+            for i, (chunk, start, end) in enumerate(text_chunks):
+                add(chunk, complaint_id, product, start, end, i, row)
+
+    return pd.DataFrame(columns)
+
+def _partition_args(df: pd.DataFrame, chunk_size: int, chunk_overlap: int) -> tuple:
+    extras = {col: df[col].tolist() for col in PASSTHROUGH_COLUMNS if col in df.columns}
+    return (df['Complaint ID'].tolist(), df['Product'].tolist(), df['clean_narrative'].tolist(),
+            chunk_size, chunk_overlap, extras)
+
+def create_chunks(df: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> pd.DataFrame:
+    """Split narratives into chunks with metadata"""
+    logger.info(f"Creating text chunks (size={chunk_size}, overlap={chunk_overlap})")
+    with span("create_chunks", narratives=len(df)) as attributes:
+        chunk_df = _chunk_partition(*_partition_args(df, chunk_size, chunk_overlap))
+        attributes['chunks'] = len(chunk_df)
+    logger.info(f"Created {len(chunk_df)} chunks from {len(df)} narratives")
+    return chunk_df
+
+def chunk_artifact(input_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, n_jobs: int = None,
+                   partition_rows: int = PARTITION_ROWS) -> int:
+    """Chunk a processed complaints artifact in parallel, streaming the output
+
+    Partitions are read lazily and chunked in worker processes. Finished
+    partitions are appended to ``output_path`` in input order, so the result is
+    identical to ``create_chunks`` on the whole frame while at most a few
+    partitions per worker are held in memory. Returns the number of chunks.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    logger.info(f"Creating text chunks (size={chunk_size}, overlap={chunk_overlap}) "
+                f"with {n_jobs} workers")
+    max_in_flight = 2 * n_jobs
+    pending = deque()
+    n_narratives = 0
+    extras = [col for col in PASSTHROUGH_COLUMNS if col in artifact_columns(input_path)]
+
+    with span("chunk_artifact", workers=n_jobs) as attributes, \
+            ProcessPoolExecutor(max_workers=n_jobs) as executor, \
+            ArtifactWriter(output_path, columns=CHUNK_COLUMNS + extras) as writer:
+        def drain(limit):
+            while len(pending) > limit:
+                chunk_df = pending.popleft().result()
+                if not chunk_df.empty:
+                    writer.write(chunk_df)
+
+        for partition in iter_artifact(input_path, columns=INPUT_COLUMNS + extras,
+                                       batch_size=partition_rows):
+            n_narratives += len(partition)
+            pending.append(executor.submit(
+                _chunk_partition, *_partition_args(partition, chunk_size, chunk_overlap)))
+            drain(max_in_flight)
+        drain(0)
+        attributes.update(narratives=n_narratives, chunks=writer.rows)
+
+    logger.info(f"Created {writer.rows} chunks from {n_narratives} narratives")
+    return writer.rows
 
 # Main execution guard with import protection
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Split processed narratives into chunks")
+    parser.add_argument("--csv", action="store_true",
+                        help="Also export the chunks artifact as CSV")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Chunking worker processes (default: all cores)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Chunk the near-duplicate-free records written by src.dedup")
+    args = parser.parse_args()
+
     # Use path helper
-    input_path = get_data_path("processed", "filtered_complaints.csv")
-    output_path = get_data_path("processed", "chunks.csv")
+    processed_path = artifact_path(get_data_path("processed"), "filtered_complaints")
+    input_path = (artifact_path(get_data_path("processed"), "deduplicated_complaints")
+                  if args.dedup else processed_path)
+    output_path = artifact_path(get_data_path("processed"), "chunks")
     
     if not os.path.exists(input_path):
         logger.error(f"Input file not found: {input_path}")
-        logger.info("Please run data processing first")
+        logger.info("Please run data processing first" if not args.dedup else "Please run src.dedup first")
+    elif (args.dedup and os.path.exists(processed_path)
+          and os.path.getmtime(input_path) < os.path.getmtime(processed_path)):
+        logger.error(f"{input_path} is older than {processed_path}")
+        logger.info("Please rerun src.dedup after data processing")
     else:
-        df = pd.read_csv(input_path)
-        chunk_df = create_chunks(df)
-        chunk_df.to_csv(output_path, index=False)
-        logger.info(f"Saved {len(chunk_df)} chunks to {output_path}")
\ No newline at end of file
+        n_chunks = chunk_artifact(input_path, output_path, n_jobs=args.jobs)
+        logger.info(f"Saved {n_chunks} chunks to {output_path}")
+        if args.csv:
+            export_csv(output_path)
\ No newline at end of file
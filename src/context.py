@@ -0,0 +1,117 @@
+import re
+from src.chunking import SENTENCE_ENDINGS
+
+_SENTENCE_RE = re.compile(SENTENCE_ENDINGS)
+
+# Prompt tokens FLAN-T5 was trained with
+MAX_INPUT_TOKENS = 512
+
+def token_counter(tokenizer):
+    """Batch token counter backed by a Hugging Face tokenizer"""
+    def count_tokens(texts: list) -> list:
+        return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+    return count_tokens
+
+def whitespace_counter(texts: list) -> list:
+    """Word counts; a tokenizer-free stand-in for tests and estimates"""
+    return [len(text.split()) for text in texts]
+
+def split_sentences(text: str) -> list:
+    """Split text at the same sentence boundaries the chunker uses"""
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+def merge_overlap(first: str, second: str) -> str:
+    """Join consecutive chunks of one complaint, dropping the words they share"""
+    a, b = first.split(), second.split()
+    for start in range(max(0, len(a) - len(b)), len(a)):
+        if a[start] == b[0] and a[start:] == b[:len(a) - start]:
+            return " ".join(a + b[len(a) - start:])
+    return f"{first} {second}"
+
+def _chunk_number(chunk_id) -> int:
+    try:
+        return int(str(chunk_id).rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+def group_by_complaint(results: dict) -> list:
+    """Merge retrieved chunks that share a complaint, ordered by best rank
+
+    Chunks of one complaint are joined in document order with their overlap
+    removed, so the same narrative is never packed twice.
+    """
+    groups = {}
+    for chunk_id, text, metadata in zip(results['ids'][0], results['documents'][0],
+                                        results['metadatas'][0]):
+        metadata = metadata or {}
+        complaint_id = str(metadata.get('complaint_id', str(chunk_id).rsplit("_", 1)[0]))
+        group = groups.setdefault(complaint_id, {
+            'complaint_id': complaint_id,
+            'product': metadata.get('product'),
+            'chunks': [],
+        })
+        if text and chunk_id not in (c for c, _ in group['chunks']):
+            group['chunks'].append((chunk_id, text))
+
+    merged = []
+    for group in groups.values():
+        if not group['chunks']:
+            continue
+        chunks = sorted(group['chunks'], key=lambda chunk: _chunk_number(chunk[0]))
+        text = chunks[0][1]
+        for _, next_text in chunks[1:]:
+            text = merge_overlap(text, next_text)
+        merged.append({'complaint_id': group['complaint_id'], 'product': group['product'],
+                       'chunk_ids': [chunk_id for chunk_id, _ in chunks], 'text': text})
+    return merged
+
+def fit_to_budget(text: str, budget: int, count_tokens) -> str:
+    """Longest prefix of whole sentences within ``budget`` tokens
+
+    Text with no sentence boundary at all (cleaned narratives lose most
+    punctuation) is cut between words instead.
+    """
+    if budget <= 0:
+        return ""
+    sentences = split_sentences(text)
+    if len(sentences) > 1:
+        taken, used = [], 0
+        for sentence, tokens in zip(sentences, count_tokens(sentences)):
+            if used + tokens > budget:
+                break
+            taken.append(sentence)
+            used += tokens
+        return " ".join(taken)
+
+    total = count_tokens([text])[0]
+    if total <= budget:
+        return text
+    words = text.split()
+    n_words = len(words) * budget // total
+    while n_words > 0:
+        candidate = " ".join(words[:n_words])
+        if count_tokens([candidate])[0] <= budget:
+            return candidate
+        n_words = n_words * 9 // 10
+    return ""
+
+def pack_context(results: dict, count_tokens, budget: int) -> tuple:
+    """Pack the best distinct sources into a token budget
+
+    Sources (retrieved chunks merged per complaint) are taken in rank order;
+    each gets an equal share of the tokens still unspent, so a short source
+    leaves more room for the ones after it. Returns the context string and
+    a list describing each packed source.
+    """
+    sources = group_by_complaint(results)
+    packed, remaining = [], budget
+    for i, source in enumerate(sources):
+        header = f"[Source {len(packed) + 1}] "
+        share = remaining // (len(sources) - i)
+        body = fit_to_budget(source['text'], share - count_tokens([header])[0], count_tokens)
+        if not body:
+            continue
+        tokens = count_tokens([header + body])[0]
+        remaining -= tokens
+        packed.append({**source, 'text': header + body, 'tokens': tokens})
+    return "\n".join(source['text'] for source in packed), packed
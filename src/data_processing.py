@@ -4,10 +4,15 @@ import os
 # Add the project root (parent of src) to sys.path
 sys.path.insert(0, os.path.abspath('..'))
 from src.utils import configure_logging, get_data_path
+from src.artifacts import (ARTIFACT_FORMAT, ArtifactWriter, artifact_path, export_csv,
+                           write_artifact)
+from src.telemetry import span
+from src.trends import RAW_CUBE_COLUMNS, CubeBuilder, aggregate, update_cube
 logger = configure_logging()
 
 import pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 PRODUCT_MAP = {
@@ -25,6 +30,29 @@ PRODUCT_MAP = {
     'Money Transfer': 'Money Transfer',
 }
 
+# Columns of the raw CFPB dump that the pipeline actually uses
+RAW_COLUMNS = ['Complaint ID', 'Product', 'Consumer complaint narrative']
+RAW_DTYPES = {'Product': str, 'Consumer complaint narrative': str,
+              'Date received': str, 'Issue': str, 'State': str}
+DEFAULT_CHUNKSIZE = 100_000
+
+PROCESSED_COLUMNS = ['Complaint ID', 'Product', 'clean_narrative', 'word_count']
+
+# Common boilerplate phrases, removed in this order
+BOILERPLATE_PATTERNS = [
+    r"\bi\s*am\s*writing\s*to\s*file\s*a\s*complaint\b",
+    r"\bdear\s*(sir|madam|consumer\s*financial\s*protection\s*bureau)\b",
+    r"\bregarding\s*my\s*account\s*[x\d]+\b",
+    r"\bplease\s*see\s*below\s*for\s*details\b",
+    r"\bto\s*whom\s*it\s*may\s*concern\b",
+    r"\bthis\s*is\s*a\s*complaint\s*regarding\b"
+]
+PUNCTUATION_PATTERN = r"(?<!\d)[^a-zA-Z0-9\s]|[^a-zA-Z0-9\s](?!\d)"
+WHITESPACE_PATTERN = r"\s+"
+
+# Narratives per block handed to a cleaning worker
+CLEAN_BLOCK_SIZE = 20_000
+
 def load_data(file_path: str) -> pd.DataFrame:
     """Load raw complaint data from CSV"""
     logger.info(f"Loading data from {file_path}")
@@ -36,6 +64,25 @@ def load_data(file_path: str) -> pd.DataFrame:
         logger.error(f"Error loading data: {str(e)}")
         raise
 
+def iter_raw_chunks(file_path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                    usecols: list = None):
+    """Stream raw complaint data from CSV in bounded-size chunks"""
+    usecols = usecols or RAW_COLUMNS
+    logger.info(f"Streaming {usecols} from {file_path} in chunks of {chunksize}")
+    dtypes = {col: dtype for col, dtype in RAW_DTYPES.items() if col in usecols}
+    try:
+        reader = pd.read_csv(file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize)
+        for chunk in reader:
+            yield chunk
+    except Exception as e:
+        logger.error(f"Error streaming data: {str(e)}")
+        raise
+
+def raw_columns(file_path: str) -> list:
+    """``RAW_COLUMNS`` plus the trend cube's source columns the file actually has"""
+    header = pd.read_csv(file_path, nrows=0).columns
+    return RAW_COLUMNS + [col for col in RAW_CUBE_COLUMNS if col in header]
+
 def filter_products(df: pd.DataFrame) -> pd.DataFrame:
     """Filter dataset to target products"""
     logger.info("Filtering target products")
@@ -52,64 +99,189 @@ def clean_narrative(text: str) -> str:
     text = text.lower()
     
     # Remove common boilerplate phrases with flexible matching
-    boilerplates = [
-        r"\bi\s*am\s*writing\s*to\s*file\s*a\s*complaint\b",
-        r"\bdear\s*(sir|madam|consumer\s*financial\s*protection\s*bureau)\b",
-        r"\bregarding\s*my\s*account\s*[x\d]+\b",
-        r"\bplease\s*see\s*below\s*for\s*details\b",
-        r"\bto\s*whom\s*it\s*may\s*concern\b",
-        r"\bthis\s*is\s*a\s*complaint\s*regarding\b"
-    ]
-    
-    for pattern in boilerplates:
+    for pattern in BOILERPLATE_PATTERNS:
         text = re.sub(pattern, "", text, flags=re.IGNORECASE)
     
     # Remove all punctuation and special characters except decimal points in numbers
     # Preserve decimal points between digits (e.g., 100.50)
-    text = re.sub(r"(?<!\d)[^a-zA-Z0-9\s]|[^a-zA-Z0-9\s](?!\d)", " ", text)
+    text = re.sub(PUNCTUATION_PATTERN, " ", text)
     
     # Remove extra whitespace and normalize
-    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(WHITESPACE_PATTERN, " ", text).strip()
     
     return text
 
-def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Main preprocessing pipeline"""
-    logger.info("Starting preprocessing")
-    
-    # Filter products
-    df = filter_products(df)
-    
-    # Handle missing narratives
+_BOILERPLATE_RES = [re.compile(p, flags=re.IGNORECASE) for p in BOILERPLATE_PATTERNS]
+# Single pass that tells whether any boilerplate occurs at all. Most narratives
+# contain none, so they skip the ordered per-pattern passes entirely.
+_ANY_BOILERPLATE_RE = re.compile("|".join(f"(?:{p})" for p in BOILERPLATE_PATTERNS),
+                                 flags=re.IGNORECASE)
+_PUNCTUATION_RE = re.compile(PUNCTUATION_PATTERN)
+_WHITESPACE_RE = re.compile(WHITESPACE_PATTERN)
+
+def _clean_block(texts: list) -> tuple:
+    """Clean a block of narratives, returning cleaned texts and word counts
+
+    Produces exactly the output of ``clean_narrative`` for every element.
+    """
+    cleaned, counts = [], []
+    for text in texts:
+        if not isinstance(text, str) or not text.strip():
+            cleaned.append("")
+            counts.append(0)
+            continue
+        text = text.lower()
+        # Overlapping phrases depend on removal order, so fall back to the
+        # ordered passes whenever the combined pattern finds anything
+        if _ANY_BOILERPLATE_RE.search(text):
+            for pattern in _BOILERPLATE_RES:
+                text = pattern.sub("", text)
+        text = _PUNCTUATION_RE.sub(" ", text)
+        text = _WHITESPACE_RE.sub(" ", text).strip()
+        cleaned.append(text)
+        counts.append(len(text.split()))
+    return cleaned, counts
+
+def clean_narratives(texts: pd.Series, n_jobs: int = None,
+                     block_size: int = CLEAN_BLOCK_SIZE,
+                     executor: ProcessPoolExecutor = None) -> pd.DataFrame:
+    """Clean a Series of narratives in blocks spread across worker processes
+
+    Returns a frame aligned with ``texts`` holding ``clean_narrative`` and
+    ``word_count``. Pass ``executor`` to reuse a pool across calls.
+    """
+    values = texts.tolist()
+    blocks = [values[i:i + block_size] for i in range(0, len(values), block_size)]
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    with tqdm(total=len(values), desc="Cleaning narratives") as pbar:
+        def consume(results):
+            cleaned, counts = [], []
+            for block_cleaned, block_counts in results:
+                cleaned.extend(block_cleaned)
+                counts.extend(block_counts)
+                pbar.update(len(block_cleaned))
+            return cleaned, counts
+
+        if executor is not None:
+            cleaned, counts = consume(executor.map(_clean_block, blocks))
+        elif n_jobs == 1 or len(blocks) <= 1:
+            cleaned, counts = consume(map(_clean_block, blocks))
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(blocks))) as pool:
+                cleaned, counts = consume(pool.map(_clean_block, blocks))
+
+    return pd.DataFrame({'clean_narrative': cleaned, 'word_count': counts},
+                        index=texts.index)
+
+def drop_empty_narratives(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop records without a complaint narrative"""
     initial_count = len(df)
     df = df[df['Consumer complaint narrative'].notna()]
     df = df[df['Consumer complaint narrative'].str.strip() != ""]
     logger.info(f"Removed {initial_count - len(df)} records with empty narratives")
-    
-    # Clean text
-    tqdm.pandas(desc="Cleaning narratives")
-    df['clean_narrative'] = df['Consumer complaint narrative'].progress_apply(clean_narrative)
+    return df
+
+def clean_records(df: pd.DataFrame, n_jobs: int = None,
+                  executor: ProcessPoolExecutor = None) -> pd.DataFrame:
+    """Clean narratives of already-filtered records and add metadata"""
+    # Clean text and add word count metadata
+    cleaned = clean_narratives(df['Consumer complaint narrative'], n_jobs=n_jobs,
+                               executor=executor)
+    df = df.assign(clean_narrative=cleaned['clean_narrative'],
+                   word_count=cleaned['word_count'])
     
     # Remove any narratives that became empty after cleaning
-    df = df[df['clean_narrative'].str.strip() != ""]
-    
-    # Add word count metadata
-    df['word_count'] = df['clean_narrative'].apply(lambda x: len(x.split()))
-    
+    df = df[df['clean_narrative'] != ""]
+    return df[PROCESSED_COLUMNS]
+
+def preprocess_data(df: pd.DataFrame, n_jobs: int = None) -> pd.DataFrame:
+    """Main preprocessing pipeline"""
+    logger.info("Starting preprocessing")
+    with span("preprocess_data", rows=len(df)) as attributes:
+        # Filter products
+        df = filter_products(df)
+
+        # Handle missing narratives
+        df = drop_empty_narratives(df)
+
+        df = clean_records(df, n_jobs=n_jobs)
+        attributes['records'] = len(df)
     logger.info(f"Final processed records: {len(df)}")
-    return df[['Complaint ID', 'Product', 'clean_narrative', 'word_count']]
+    return df
 
 # Modify the save function
-def save_processed_data(df: pd.DataFrame):
-    """Save processed data to CSV"""
-    output_path = get_data_path("processed", "filtered_complaints.csv")
+def get_processed_path(fmt: str = ARTIFACT_FORMAT) -> str:
+    """Get absolute path to the processed complaints artifact"""
+    return artifact_path(get_data_path("processed"), "filtered_complaints", fmt)
+
+def save_processed_data(df: pd.DataFrame, output_path: str = None):
+    """Save processed data as a columnar artifact"""
+    output_path = output_path or get_processed_path()
     logger.info(f"Saving processed data to {output_path}")
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
+    write_artifact(df, output_path)
+
+def preprocess_stream(input_path: str, output_path: str = None,
+                      chunksize: int = DEFAULT_CHUNKSIZE, n_jobs: int = None,
+                      cube_path: str = None, build_cube: bool = True) -> int:
+    """Preprocess the raw dump chunk by chunk, appending results to the artifact
+
+    Peak memory is bounded by ``chunksize`` rather than the size of the raw file.
+    Unless ``build_cube`` is off, every in-scope record (with or without a
+    narrative) is also counted into the trend cube, whose months covered by
+    this file are replaced; it sits next to ``output_path`` unless ``cube_path``
+    says otherwise. Returns the number of processed records written.
+    """
+    output_path = output_path or get_processed_path()
+    cube_path = cube_path or artifact_path(os.path.dirname(os.path.abspath(output_path)), "trend_cube")
+    logger.info(f"Streaming preprocessed data to {output_path}")
+    cube = CubeBuilder() if build_cube else None
+    usecols = raw_columns(input_path) if build_cube else RAW_COLUMNS
+
+    total_in = 0
+    # One pool for the whole stream instead of one per chunk
+    with span("preprocess_stream") as attributes, \
+            ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as executor, \
+            ArtifactWriter(output_path, columns=PROCESSED_COLUMNS) as writer:
+        for chunk in iter_raw_chunks(input_path, chunksize=chunksize, usecols=usecols):
+            total_in += len(chunk)
+            # Filters run first so cleaning only sees in-scope narratives
+            chunk = filter_products(chunk)
+            if cube is not None:
+                cube.add(chunk)
+            chunk = drop_empty_narratives(chunk)
+            if chunk.empty:
+                continue
+            writer.write(clean_records(chunk, executor=executor))
+        attributes.update(rows=total_in, records=writer.rows)
+
+    if cube is not None:
+        update_cube(cube.result(), cube_path)
+    logger.info(f"Streamed {total_in} raw records, wrote {writer.rows} processed records")
+    return writer.rows
 
 # Modify the main block
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Preprocess CFPB complaint data")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Load the whole raw file at once instead of streaming it")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Rows per chunk when streaming")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Cleaning worker processes (default: all cores)")
+    parser.add_argument("--csv", action="store_true",
+                        help="Also export the processed artifact as CSV")
+    args = parser.parse_args()
+
     input_path = get_data_path("raw", "cfpb_complaints.csv")
-    df = load_data(input_path)
-    processed_df = preprocess_data(df)
-    save_processed_data(processed_df)
\ No newline at end of file
+    if args.in_memory:
+        df = load_data(input_path)
+        update_cube(aggregate(filter_products(df.copy())))
+        processed_df = preprocess_data(df, n_jobs=args.jobs)
+        save_processed_data(processed_df)
+    else:
+        preprocess_stream(input_path, chunksize=args.chunksize, n_jobs=args.jobs)
+    if args.csv:
+        export_csv(get_processed_path())
\ No newline at end of file
@@ -0,0 +1,320 @@
+import os
+import re
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.utils import configure_logging, get_data_path
+from src.artifacts import ArtifactWriter, artifact_path, iter_artifact
+from src.chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, PASSTHROUGH_COLUMNS
+from src.telemetry import span
+
+logger = configure_logging()
+
+# 128 permutations in 16 bands of 8 rows: pairs above ~0.7 Jaccard become
+# candidates with high probability, which are then checked against THRESHOLD
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 5
+THRESHOLD = 0.8
+SEED = 1
+
+# Redaction placeholders ("xxxx", "xx xx xxxx") and amounts are what differ
+# between copies of one form letter, so they are left out of the shingles
+_PLACEHOLDER_RE = re.compile(r"^[x\d.]+$")
+
+# Columns added to deduplicated records; chunking copies them onto every chunk
+DEDUP_COLUMNS = PASSTHROUGH_COLUMNS
+INPUT_COLUMNS = ['Complaint ID', 'Product', 'clean_narrative', 'word_count']
+
+# Dropped complaint ids kept per representative; they are copied onto every
+# chunk's metadata, so large clusters only record their size in full
+MAX_DUPLICATE_IDS = 20
+
+# Narratives per partition handed to a signature worker
+PARTITION_ROWS = 10_000
+
+def _permutations(num_perm: int, seed: int) -> tuple:
+    """Multiply-shift hash parameters: odd 64-bit ``a`` and any 64-bit ``b``"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True)
+    return a, b
+
+# Odd multipliers that fold the word hashes of a shingle (up to 16 words) into one 64-bit hash
+_SHINGLE_MULTIPLIERS = np.random.default_rng(2).integers(
+    1, 1 << 62, size=16, dtype=np.uint64) | np.uint64(1)
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """64-bit hashes of the word ``size``-grams of a cleaned narrative
+
+    Redaction placeholders and amounts are skipped. Each word is hashed once
+    and consecutive word hashes are combined arithmetically, so no shingle
+    strings are built.
+    """
+    words = [word for word in text.split() if not _PLACEHOLDER_RE.match(word)]
+    if len(words) < size:
+        # Too short for a single shingle: the remaining words (or the raw text) are the shingle
+        return np.array([zlib.crc32((" ".join(words) or text).encode())], dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for word in words),
+                              dtype=np.uint64, count=len(words))
+    count = len(words) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes += word_hashes[offset:offset + count] * _SHINGLE_MULTIPLIERS[offset]
+    return hashes
+
+def minhash_signatures(texts: list, num_perm: int = NUM_PERM, seed: int = SEED,
+                       block_shingles: int = 1024) -> np.ndarray:
+    """MinHash signature (``num_perm`` uint32 values) of each text's shingle set
+
+    Shingle hashes of several texts are permuted in one array operation and
+    reduced per text, in blocks of about ``block_shingles`` shingles so the
+    ``block_shingles x num_perm`` temporaries stay in cache.
+    """
+    a, b = _permutations(num_perm, seed)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    start = 0
+    while start < len(texts):
+        blocks, offsets, n_shingles, end = [], [], 0, start
+        while end < len(texts) and (end == start or n_shingles < block_shingles):
+            hashes = shingle_hashes(texts[end])
+            offsets.append(n_shingles)
+            blocks.append(hashes)
+            n_shingles += len(hashes)
+            end += 1
+        hashes = np.concatenate(blocks)
+        with np.errstate(over="ignore"):
+            # Multiply-shift hashing: the top 32 bits of a*x + b (mod 2^64) need no division
+            permuted = ((hashes[:, None] * a + b) >> np.uint64(32)).astype(np.uint32)
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=0)
+        start = end
+    return signatures
+
+def _band_multipliers(rows: int) -> np.ndarray:
+    """Odd 64-bit multipliers that fold a band's rows into one key"""
+    return np.random.default_rng(0).integers(1, 1 << 62, size=rows, dtype=np.uint64) | np.uint64(1)
+
+def _find(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def find_clusters(signatures: np.ndarray, bands: int = BANDS, threshold: float = THRESHOLD,
+                  block_rows: int = 1_000_000, groups: np.ndarray = None) -> np.ndarray:
+    """Cluster root (lowest row index) of every row
+
+    Each band is processed on its own: its keys are sorted, and every run of
+    equal keys is a bucket whose members are compared to the bucket's first
+    row. Pairs whose estimated Jaccard similarity (the share of equal
+    signature values) reaches ``threshold`` are merged. ``groups`` (integer
+    codes, e.g. of the product) is folded into the band keys and only rows
+    of the same group are merged. Memory beyond the signatures, which may
+    be a disk-backed memmap, is a few integers per row.
+    """
+    n = signatures.shape[0]
+    parent = np.arange(n, dtype=np.int64)
+    rows = signatures.shape[1] // bands
+    multipliers = _band_multipliers(rows + 1)
+    groups = (np.zeros(n, dtype=np.int64) if groups is None
+              else np.asarray(groups, dtype=np.int64))
+    merges = 0
+    for band in range(bands):
+        keys = np.empty(n, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for start in range(0, n, block_rows):
+                block = signatures[start:start + block_rows, band * rows:(band + 1) * rows].astype(np.uint64)
+                keys[start:start + block_rows] = ((block * multipliers[:rows]).sum(axis=1)
+                                                  + groups[start:start + block_rows].astype(np.uint64)
+                                                  * multipliers[rows])
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        run_starts = np.flatnonzero(np.diff(sorted_keys) != 0) + 1
+        bounds = np.concatenate(([0], run_starts, [n]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if hi - lo < 2:
+                continue
+            members = order[lo:hi]
+            first = members[0]
+            similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+            # Keys of different groups can still collide
+            similar = (similarity >= threshold) & (groups[members[1:]] == groups[first])
+            for other in members[1:][similar]:
+                root_a, root_b = _find(parent, first), _find(parent, other)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+                    merges += 1
+    roots = np.array([_find(parent, i) for i in range(n)], dtype=np.int64) if merges else parent
+    logger.info(f"LSH over {n} signatures merged {merges} near-duplicate pairs")
+    return roots
+
+def estimate_chunks(word_counts, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> np.ndarray:
+    """Chunks ``create_chunks`` makes per narrative, ignoring boundary snapping"""
+    word_counts = np.asarray(word_counts, dtype=np.int64)
+    step = chunk_size - chunk_overlap
+    long_chunks = np.ceil(np.maximum(word_counts - chunk_overlap, 1) / step).astype(np.int64)
+    return np.where(word_counts <= chunk_size, 1, long_chunks)
+
+def shrink_report(word_counts, text_bytes, kept, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, dim: int = 384,
+                  bytes_per_value: int = 2) -> dict:
+    """How much dropping duplicates shrinks the chunk count and index size
+
+    Index size is estimated as one ``dim``-dimensional vector (float16 by
+    default, as in the flat index) plus the stored text per chunk.
+    """
+    kept = np.asarray(kept, dtype=bool)
+    chunks = estimate_chunks(word_counts, chunk_size, chunk_overlap)
+    text_bytes = np.asarray(text_bytes, dtype=np.int64)
+    vector_bytes = dim * bytes_per_value
+    before = int(chunks.sum())
+    after = int(chunks[kept].sum())
+    index_before = before * vector_bytes + int(text_bytes.sum())
+    index_after = after * vector_bytes + int(text_bytes[kept].sum())
+    return {
+        'narratives_in': int(len(kept)),
+        'narratives_out': int(kept.sum()),
+        'duplicates_removed': int((~kept).sum()),
+        'chunks_before': before,
+        'chunks_after': after,
+        'chunk_reduction': 1 - after / before if before else 0.0,
+        'index_bytes_before': index_before,
+        'index_bytes_after': index_after,
+        'index_reduction': 1 - index_after / index_before if index_before else 0.0,
+    }
+
+def _cluster_metadata(roots: np.ndarray, complaint_ids: np.ndarray) -> tuple:
+    """Cluster sizes per root and up to ``MAX_DUPLICATE_IDS`` ids of each root's other members"""
+    sizes = np.bincount(roots, minlength=len(roots))
+    members = {}
+    for row in np.flatnonzero(roots != np.arange(len(roots))):
+        ids = members.setdefault(int(roots[row]), [])
+        if len(ids) < MAX_DUPLICATE_IDS:
+            ids.append(str(complaint_ids[row]))
+    return sizes, members
+
+def _annotate(df: pd.DataFrame, rows: np.ndarray, roots: np.ndarray, sizes: np.ndarray,
+              members: dict) -> pd.DataFrame:
+    """Representative rows of a batch with their cluster metadata"""
+    keep = roots[rows] == rows
+    kept_rows = rows[keep]
+    return df[keep].assign(
+        duplicate_count=sizes[kept_rows],
+        duplicate_ids=[";".join(members.get(int(row), [])) for row in kept_rows])
+
+def deduplicate(df: pd.DataFrame, threshold: float = THRESHOLD, num_perm: int = NUM_PERM,
+                bands: int = BANDS) -> tuple:
+    """Keep one representative per near-duplicate cluster of processed records
+
+    Clusters never span products, so every product keeps its own copy of a
+    narrative filed under several. Returns the representatives, each with
+    ``duplicate_count`` (cluster size) and ``duplicate_ids`` (``;``-joined
+    complaint ids of up to ``MAX_DUPLICATE_IDS`` dropped members), and a
+    ``shrink_report``.
+    """
+    df = df.reset_index(drop=True)
+    with span("deduplicate", narratives=len(df)):
+        signatures = minhash_signatures(df['clean_narrative'].tolist(), num_perm)
+        roots = find_clusters(signatures, bands, threshold,
+                              groups=pd.factorize(df['Product'].astype(str))[0])
+        sizes, members = _cluster_metadata(roots, df['Complaint ID'].to_numpy())
+        kept = _annotate(df, np.arange(len(df)), roots, sizes, members)
+    report = shrink_report(df['word_count'], df['clean_narrative'].str.len(), roots == np.arange(len(df)))
+    return kept.reset_index(drop=True), report
+
+def deduplicate_artifact(input_path: str, output_path: str, threshold: float = THRESHOLD,
+                         num_perm: int = NUM_PERM, bands: int = BANDS, n_jobs: int = None,
+                         partition_rows: int = PARTITION_ROWS, work_dir: str = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> dict:
+    """Stream the processed artifact through near-duplicate removal
+
+    Pass one computes signatures partition by partition in worker processes
+    into a memmap in ``work_dir``; clustering then runs band by band over it.
+    Pass two re-reads the artifact and writes only representatives. Memory
+    holds one partition plus a few integers per narrative, so millions of
+    narratives fit. Returns the ``shrink_report``.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    num_rows = sum(len(batch) for batch in iter_artifact(input_path, columns=['Complaint ID'],
+                                                         batch_size=partition_rows))
+    logger.info(f"Deduplicating {num_rows} narratives with {num_perm} permutations "
+                f"in {bands} bands (threshold {threshold})")
+    with span("deduplicate_artifact", narratives=num_rows), \
+            tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        signatures = np.lib.format.open_memmap(os.path.join(tmp, "signatures.npy"), mode="w+",
+                                               dtype=np.uint32, shape=(num_rows, num_perm))
+        complaint_ids = np.empty(num_rows, dtype=object)
+        products = np.empty(num_rows, dtype=np.int64)
+        product_codes = {}
+        word_counts = np.empty(num_rows, dtype=np.int64)
+        text_bytes = np.empty(num_rows, dtype=np.int64)
+
+        offset = 0
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            pending = []
+            for batch in iter_artifact(input_path, columns=INPUT_COLUMNS, batch_size=partition_rows):
+                rows = slice(offset, offset + len(batch))
+                complaint_ids[rows] = batch['Complaint ID'].to_numpy()
+                products[rows] = [product_codes.setdefault(product, len(product_codes))
+                                  for product in batch['Product'].astype(str)]
+                word_counts[rows] = batch['word_count'].to_numpy()
+                text_bytes[rows] = batch['clean_narrative'].str.len().to_numpy()
+                pending.append((rows, executor.submit(
+                    minhash_signatures, batch['clean_narrative'].tolist(), num_perm, SEED)))
+                offset += len(batch)
+                # Bound the partitions held in flight
+                while len(pending) > 2 * n_jobs:
+                    done_rows, future = pending.pop(0)
+                    signatures[done_rows] = future.result()
+            for done_rows, future in pending:
+                signatures[done_rows] = future.result()
+        signatures.flush()
+
+        roots = find_clusters(signatures, bands, threshold, groups=products)
+        sizes, members = _cluster_metadata(roots, complaint_ids)
+        del signatures
+
+        offset = 0
+        with ArtifactWriter(output_path) as writer:
+            for batch in iter_artifact(input_path, batch_size=partition_rows):
+                rows = np.arange(offset, offset + len(batch))
+                kept = _annotate(batch, rows, roots, sizes, members)
+                if not kept.empty:
+                    writer.write(kept)
+                offset += len(batch)
+
+    report = shrink_report(word_counts, text_bytes, roots == np.arange(num_rows),
+                           chunk_size, chunk_overlap)
+    logger.info(f"Kept {report['narratives_out']} of {report['narratives_in']} narratives; "
+                f"chunks {report['chunks_before']} -> {report['chunks_after']} "
+                f"({report['chunk_reduction']:.1%} fewer), index ~{report['index_bytes_before'] / 1e6:.1f}MB "
+                f"-> {report['index_bytes_after'] / 1e6:.1f}MB")
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Drop near-duplicate narratives before chunking")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Estimated Jaccard similarity above which narratives are merged")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Signature worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    processed_dir = get_data_path("processed")
+    input_path = artifact_path(processed_dir, "filtered_complaints")
+    output_path = artifact_path(processed_dir, "deduplicated_complaints")
+    if not os.path.exists(input_path):
+        logger.error(f"Input file not found: {input_path}")
+        logger.info("Please run data processing first")
+    else:
+        report = deduplicate_artifact(input_path, output_path, threshold=args.threshold, n_jobs=args.jobs)
+        with open(os.path.join(processed_dir, "dedup_report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved deduplicated narratives to {output_path}")
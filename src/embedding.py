@@ -1,11 +1,18 @@
 import os
 import sys
+import hashlib
+import queue
+import threading
+import time
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
 import logging
 from tqdm import tqdm
+from src.artifacts import artifact_columns, artifact_path, read_artifact
+from src.bm25 import build_bm25_index
+from src.chunking import DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, PASSTHROUGH_COLUMNS
+from src.telemetry import BATCH_SIZE, span
+from src.vector_index import (COLLECTION_NAME, VECTOR_DTYPES, FlatIndexBuilder,
+                              FlatVectorIndex, get_index_dir, write_index_version)
 
 # Configure logging before other imports
 logging.basicConfig(
@@ -20,6 +27,12 @@ logger = logging.getLogger(__name__)
 
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
+# Encoded batches allowed to wait for the vector-store writer
+WRITE_QUEUE_SIZE = 8
+
+# Columns of the chunks artifact needed for embedding
+CHUNK_COLUMNS = ['text', 'complaint_id', 'product', 'chunk_id']
+
 def get_project_root():
     """Get absolute path to project root"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -33,10 +46,12 @@ def get_vector_dir():
 
 def get_chunks_path():
     """Get absolute path to chunks file"""
-    return os.path.join(get_project_root(), "data", "processed", "chunks.csv")
+    return artifact_path(os.path.join(get_project_root(), "data", "processed"), "chunks")
 
-def initialize_vector_db() -> chromadb.Collection:
+def initialize_vector_db() -> "chromadb.Collection":
     """Initialize ChromaDB vector database"""
+    import chromadb
+    from chromadb.config import Settings
     vector_dir = get_vector_dir()
     try:
         client = chromadb.PersistentClient(
@@ -45,7 +60,7 @@ def initialize_vector_db() -> chromadb.Collection:
         )
 
         return client.get_or_create_collection(
-            name="creditrust_complaints",
+            name=COLLECTION_NAME,
             metadata={"hnsw:space": "cosine"}
 )
     except Exception as e:
@@ -68,66 +83,197 @@ def load_chunk_data() -> pd.DataFrame:
     
     try:
         logger.info(f"Loading chunks from {chunks_path}")
-        return pd.read_csv(chunks_path)
+        # Near-duplicate cluster columns are stored as metadata when present
+        extras = [col for col in PASSTHROUGH_COLUMNS if col in artifact_columns(chunks_path)]
+        return read_artifact(chunks_path, columns=CHUNK_COLUMNS + extras)
     except Exception as e:
         logger.error(f"Failed to load chunks: {str(e)}")
         raise
 
-def generate_embeddings():
-    """Generate embeddings and persist to vector DB"""
+def chunk_content_hash(text: str, model_name: str = MODEL_NAME,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> str:
+    """Hash a chunk's text together with everything that shapes its embedding"""
+    key = f"{model_name}\x1f{chunk_size}\x1f{chunk_overlap}\x1f{text}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def fetch_stored_hashes(collection: "chromadb.Collection", page_size: int = 10_000) -> dict:
+    """Map every stored chunk id to its content hash (None for legacy entries)"""
+    stored = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+            stored[chunk_id] = (metadata or {}).get('content_hash')
+        if len(page['ids']) < page_size:
+            return stored
+        offset += page_size
+
+def plan_incremental_update(chunk_ids: list, hashes: list, stored: dict) -> tuple:
+    """Split chunks into positions to (re-)embed and stored ids to delete"""
+    to_embed = [i for i, (chunk_id, content_hash) in enumerate(zip(chunk_ids, hashes))
+                if stored.get(chunk_id) != content_hash]
+    current = set(chunk_ids)
+    to_delete = [chunk_id for chunk_id in stored if chunk_id not in current]
+    return to_embed, to_delete
+
+def length_sorted_batches(texts: list, positions: list, batch_size: int) -> list:
+    """Group positions into batches of similar text length to minimise padding"""
+    order = sorted(positions, key=lambda p: len(texts[p]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def run_embedding_pipeline(model, texts: list, positions: list, write_batch,
+                           batch_size: int = 256, queue_size: int = WRITE_QUEUE_SIZE) -> dict:
+    """Encode texts in length-bucketed batches while a writer thread stores them
+
+    ``write_batch(positions, embeddings)`` receives the original positions of
+    each batch next to its embedding array, so callers can restore file order.
+    The bounded queue applies backpressure when writing is the bottleneck.
+    Returns per-stage timings and throughput.
+    """
+    batches = length_sorted_batches(texts, positions, batch_size)
+    pending = queue.Queue(maxsize=queue_size)
+    stats = {'chunks': len(positions), 'encode_seconds': 0.0, 'write_seconds': 0.0}
+    writer_error = []
+
+    def writer():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if writer_error:
+                continue  # keep draining so the encoder never blocks
+            start = time.perf_counter()
+            try:
+                with span("corpus_write", batch=len(item[0])):
+                    write_batch(*item)
+            except Exception as e:
+                writer_error.append(e)
+            stats['write_seconds'] += time.perf_counter() - start
+
+    def put(item):
+        while True:
+            if writer_error:
+                raise writer_error[0]
+            try:
+                pending.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    wall_start = time.perf_counter()
+    writer_thread = threading.Thread(target=writer, name="embedding-writer", daemon=True)
+    writer_thread.start()
     try:
-        logger.info(f"Loading embedding model: {MODEL_NAME}")
-        model = SentenceTransformer(MODEL_NAME)
-        collection = initialize_vector_db()
+        with tqdm(total=len(positions), desc="Embedding chunks") as pbar:
+            for i, batch in enumerate(batches):
+                start = time.perf_counter()
+                BATCH_SIZE.observe(len(batch), stage="corpus_encode")
+                with span("corpus_encode", batch=len(batch)):
+                    embeddings = model.encode(
+                        [texts[p] for p in batch],
+                        batch_size=len(batch),
+                        show_progress_bar=False,
+                        convert_to_numpy=True
+                    )
+                stats['encode_seconds'] += time.perf_counter() - start
+                put((batch, embeddings))
+                pbar.update(len(batch))
+                logger.debug(f"Encoded batch {i+1}: {len(batch)} embeddings")
+    finally:
+        pending.put(None)
+        writer_thread.join()
+    if writer_error:
+        raise writer_error[0]
+
+    stats['wall_seconds'] = time.perf_counter() - wall_start
+    for stage in ('encode', 'write', 'wall'):
+        seconds = stats[f'{stage}_seconds']
+        stats[f'{stage}_chunks_per_second'] = len(positions) / seconds if seconds else 0.0
+    logger.info(f"Encoding: {stats['encode_chunks_per_second']:.1f} chunks/s, "
+                f"writing: {stats['write_chunks_per_second']:.1f} chunks/s, "
+                f"overall: {stats['wall_chunks_per_second']:.1f} chunks/s")
+    return stats
+
+def reset_collection(collection: "chromadb.Collection") -> "chromadb.Collection":
+    """Delete and recreate the collection to clear all data"""
+    client = collection._client  # get the client from the collection
+    client.delete_collection(collection.name)
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"}
+    )
+    logger.info("Existing vector data cleared")
+    return collection
+
+def generate_embeddings(rebuild: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, batch_size: int = 256,
+                        model=None, collection=None):
+    """Generate embeddings and persist to vector DB
+
+    By default only chunks whose content hash (text, model and chunking
+    parameters) is new or changed are embedded and upserted, and stored chunks
+    that no longer exist are deleted. Each batch is committed with its hash, so
+    an interrupted run resumes where it stopped. ``rebuild`` drops the
+    collection and embeds everything from scratch. ``model`` and
+    ``collection`` default to the sentence-transformer and the persistent
+    Chroma collection.
+    """
+    try:
+        if model is None:
+            logger.info(f"Loading embedding model: {MODEL_NAME}")
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(MODEL_NAME)
+        if collection is None:
+            collection = initialize_vector_db()
         
         # Load data
         chunk_df = load_chunk_data()
         
         # Check required columns
-        required_columns = ['text', 'complaint_id', 'product', 'chunk_id']
-        missing = [col for col in required_columns if col not in chunk_df.columns]
+        missing = [col for col in CHUNK_COLUMNS if col not in chunk_df.columns]
         if missing:
             raise ValueError(f"Missing columns in chunks data: {', '.join(missing)}")
         
-        # Delete and recreate the collection to clear all data
-        client = collection._client  # get the client from the collection
-        client.delete_collection(collection.name)
-        collection = client.get_or_create_collection(
-            name="creditrust_complaints",
-            metadata={"hnsw:space": "cosine"}
-        )
-        logger.info("Existing vector data cleared")
-        
-        logger.info("Generating embeddings...")
-        batch_size = 256
         texts = chunk_df['text'].tolist()
-        metadatas = chunk_df[['complaint_id', 'product', 'chunk_id']].to_dict('records')
         ids = chunk_df['chunk_id'].tolist()
+        hashes = [chunk_content_hash(text, MODEL_NAME, chunk_size, chunk_overlap)
+                  for text in texts]
+
+        if rebuild:
+            collection = reset_collection(collection)
+            to_embed, to_delete = list(range(len(ids))), []
+        else:
+            stored = fetch_stored_hashes(collection)
+            to_embed, to_delete = plan_incremental_update(ids, hashes, stored)
+            logger.info(f"Incremental update: {len(stored)} stored, {len(to_embed)} new or changed, "
+                        f"{len(to_delete)} removed, {len(ids) - len(to_embed)} unchanged")
+
+        for batch_ids in batch_generator(to_delete, batch_size * 16):
+            collection.delete(ids=batch_ids)
         
-        total_chunks = len(texts)
-        logger.info(f"Processing {total_chunks} chunks in batches of {batch_size}")
+        logger.info("Generating embeddings...")
+        metadata_columns = ['complaint_id', 'product', 'chunk_id',
+                            *[col for col in PASSTHROUGH_COLUMNS if col in chunk_df.columns]]
+        metadatas = chunk_df[metadata_columns].to_dict('records')
         
-        with tqdm(total=total_chunks, desc="Embedding chunks") as pbar:
-            for i, (batch_texts, batch_metadatas, batch_ids) in enumerate(
-                zip(
-                    batch_generator(texts, batch_size),
-                    batch_generator(metadatas, batch_size),
-                    batch_generator(ids, batch_size)
-                )
-            ):
-                batch_embeddings = model.encode(
-                    batch_texts, 
-                    show_progress_bar=False,
-                    convert_to_numpy=True
-                ).tolist()
-                
-                collection.add(
-                    embeddings=batch_embeddings,
-                    metadatas=batch_metadatas,
-                    ids=batch_ids
-                )
-                pbar.update(len(batch_ids))
-                logger.debug(f"Processed batch {i+1}: {len(batch_ids)} embeddings")
+        total_chunks = len(to_embed)
+        logger.info(f"Processing {total_chunks} chunks in batches of {batch_size}")
+
+        def write_batch(positions, embeddings):
+            # The pinned chromadb 0.4.15 rejects ndarray embeddings, so this is
+            # the one list conversion left; it runs on the writer thread, off
+            # the encoding path. The flat index takes the arrays as they are.
+            collection.upsert(
+                embeddings=embeddings.tolist(),
+                documents=[texts[p] for p in positions],
+                metadatas=[{**metadatas[p], 'content_hash': hashes[p]} for p in positions],
+                ids=[ids[p] for p in positions]
+            )
+
+        with span("generate_embeddings", backend="chroma", chunks=total_chunks):
+            run_embedding_pipeline(model, texts, to_embed, write_batch, batch_size=batch_size)
+        write_index_version("chroma")
         
         logger.info(f"✅ Persisted {total_chunks} embeddings to vector store")
         return True
@@ -135,6 +281,52 @@ def generate_embeddings():
         logger.error(f"Embedding generation failed: {str(e)}", exc_info=True)
         return False
 
+def generate_flat_index(rebuild: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, dtype: str = "float16",
+                        index_dir: str = None):
+    """Generate embeddings into the memory-mapped flat vector index
+
+    Rows of the current index whose content hash is unchanged are copied
+    instead of re-embedded unless ``rebuild`` is set.
+    """
+    try:
+        index_dir = index_dir or get_index_dir()
+        # Sorting by product stores each product as a contiguous partition
+        chunk_df = load_chunk_data().sort_values('product', kind='stable').reset_index(drop=True)
+        texts = chunk_df['text'].tolist()
+        hashes = [chunk_content_hash(text, MODEL_NAME, chunk_size, chunk_overlap)
+                  for text in texts]
+
+        existing, reuse = None, {}
+        if not rebuild and os.path.exists(index_dir):
+            existing = FlatVectorIndex.load(index_dir)
+            if 'content_hash' in existing.sidecar.column_names:
+                reuse = {h: row for row, h in enumerate(existing.column('content_hash'))}
+        reused = [(i, reuse[h]) for i, h in enumerate(hashes) if h in reuse]
+        to_embed = [i for i, h in enumerate(hashes) if h not in reuse]
+        logger.info(f"Flat index: {len(reused)} reused, {len(to_embed)} to embed")
+
+        logger.info(f"Loading embedding model: {MODEL_NAME}")
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME)
+        builder = FlatIndexBuilder(index_dir, len(texts),
+                                   model.get_sentence_embedding_dimension(), dtype)
+        if reused:
+            positions, source_rows = map(list, zip(*reused))
+            builder.copy_from(positions, existing, source_rows)
+        with span("generate_embeddings", backend="flat", chunks=len(to_embed)):
+            run_embedding_pipeline(model, texts, to_embed, builder.add)
+
+        extras = [col for col in PASSTHROUGH_COLUMNS if col in chunk_df.columns]
+        records = chunk_df[['chunk_id', 'complaint_id', 'product', 'text', *extras]].assign(content_hash=hashes)
+        builder.finalize(records, MODEL_NAME)
+        write_index_version("flat")
+        logger.info(f"✅ Persisted {len(texts)} embeddings to flat index")
+        return True
+    except Exception as e:
+        logger.error(f"Flat index generation failed: {str(e)}", exc_info=True)
+        return False
+
 if __name__ == "__main__":
     logger.info("Starting embedding process...")
     
@@ -143,7 +335,26 @@ if __name__ == "__main__":
         logger.info("Execute: python -m src.chunking")
         sys.exit(1)
     
-    success = generate_embeddings()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embed chunks into the vector store")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Drop the collection and re-embed every chunk")
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma",
+                        help="Vector store to write")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default="float16",
+                        help="Storage precision of the flat index")
+    parser.add_argument("--skip-lexical", action="store_true",
+                        help="Do not rebuild the BM25 index used by hybrid retrieval")
+    args = parser.parse_args()
+
+    # Built before the vectors so the version stamp covers both indexes
+    if not args.skip_lexical:
+        build_bm25_index(get_chunks_path())
+    if args.backend == "flat":
+        success = generate_flat_index(rebuild=args.rebuild, dtype=args.dtype)
+    else:
+        success = generate_embeddings(rebuild=args.rebuild)
     if success:
         logger.info("Embedding process completed successfully!")
     else:
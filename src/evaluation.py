@@ -1,4 +1,8 @@
 from .rag_logic import RAGSystem
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from .utils import configure_logging
 import os
@@ -51,16 +55,222 @@ def evaluate_rag_system(rag: RAGSystem) -> pd.DataFrame:
     
     return pd.DataFrame(results)
 
+STAGES = ("embed", "retrieve", "generate")
+PERCENTILES = (50, 95, 99)
+
+def _parse_ids(value) -> list:
+    """Complaint ids from a list or a ``;``/``,``/``|`` separated string"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    text = str(value)
+    for separator in ("|", ","):
+        text = text.replace(separator, ";")
+    return [part.strip() for part in text.split(";") if part.strip()]
+
+def load_questions(path: str) -> pd.DataFrame:
+    """Labelled questions from CSV, JSONL or Parquet
+
+    Needs a ``question`` column; ``complaint_ids`` (relevant complaints) and
+    ``product`` (relevant product) are the labels, and either may be missing
+    for a given row.
+    """
+    if path.endswith((".jsonl", ".json")):
+        df = pd.read_json(path, lines=path.endswith(".jsonl"))
+    elif path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    if 'question' not in df.columns:
+        raise ValueError(f"{path} has no 'question' column")
+    df['complaint_ids'] = [_parse_ids(v) for v in df['complaint_ids']] \
+        if 'complaint_ids' in df.columns else [[] for _ in range(len(df))]
+    if 'product' not in df.columns:
+        df['product'] = None
+    df['product'] = df['product'].where(df['product'].notna(), None)
+    logger.info(f"Loaded {len(df)} evaluation questions from {path}")
+    return df.reset_index(drop=True)
+
+def default_questions() -> pd.DataFrame:
+    """The built-in product-labelled questions"""
+    return pd.DataFrame({'question': [q for q, _ in EVAL_QUESTIONS],
+                         'complaint_ids': [[] for _ in EVAL_QUESTIONS],
+                         'product': [p for _, p in EVAL_QUESTIONS]})
+
+def retrieved_complaints(results: dict) -> list:
+    """Distinct ``(complaint_id, product)`` pairs in rank order"""
+    ranked, seen = [], set()
+    for chunk_id, metadata in zip(results['ids'][0], results['metadatas'][0]):
+        metadata = metadata or {}
+        complaint_id = str(metadata.get('complaint_id', str(chunk_id).rsplit("_", 1)[0]))
+        if complaint_id not in seen:
+            seen.add(complaint_id)
+            ranked.append((complaint_id, metadata.get('product')))
+    return ranked
+
+def retrieval_metrics(results: dict, complaint_ids: list = None, product: str = None,
+                      k: int = 5) -> dict:
+    """recall@k, hit@k and reciprocal rank of one retrieval
+
+    With complaint-id labels a retrieved complaint is relevant when it is
+    labelled; with only a product label, when its product matches. Recall
+    against a product is the hit rate, since the product has far more
+    relevant complaints than ``k``.
+    """
+    ranked = retrieved_complaints(results)[:k]
+    if complaint_ids:
+        relevant = set(map(str, complaint_ids))
+        flags = [complaint_id in relevant for complaint_id, _ in ranked]
+        recall = sum(flags) / len(relevant)
+    elif product:
+        flags = [retrieved_product == product for _, retrieved_product in ranked]
+        recall = float(any(flags))
+    else:
+        return {'recall_at_k': None, 'hit_at_k': None, 'reciprocal_rank': None}
+    first = next((rank for rank, flag in enumerate(flags, 1) if flag), None)
+    return {'recall_at_k': recall, 'hit_at_k': float(first is not None),
+            'reciprocal_rank': 1.0 / first if first else 0.0}
+
+def latency_percentiles(seconds) -> dict:
+    seconds_ms = np.asarray(seconds, dtype=np.float64) * 1e3
+    if not len(seconds_ms):
+        return {f"p{q}_ms": None for q in PERCENTILES}
+    return {f"p{q}_ms": float(np.percentile(seconds_ms, q)) for q in PERCENTILES}
+
+def _run_batch(rag: RAGSystem, batch: pd.DataFrame, k: int, generate: bool, max_length: int,
+               filter_products: bool) -> dict:
+    """Embed, retrieve and generate for one batch, timing each stage"""
+    queries = batch['question'].tolist()
+    products = batch['product'].tolist() if filter_products else None
+    timings, answers, error = {}, [None] * len(queries), None
+    start = time.perf_counter()
+    try:
+        rag.embed_queries(queries)
+        timings['embed'] = time.perf_counter() - start
+        start = time.perf_counter()
+        # Embeddings are cached now, so this times the index search alone
+        results = rag.retrieve_batch(queries, k, products)
+        timings['retrieve'] = time.perf_counter() - start
+        if generate:
+            start = time.perf_counter()
+            answers = rag.generate_answers(queries, results, max_length)
+            timings['generate'] = time.perf_counter() - start
+    except Exception as e:
+        logger.error(f"Evaluation batch failed: {str(e)}")
+        results = [None] * len(queries)
+        error = str(e)
+    return {'results': results, 'answers': answers, 'timings': timings, 'error': error}
+
+def evaluate_parallel(rag: RAGSystem, questions: pd.DataFrame, k: int = 5, batch_size: int = 16,
+                      workers: int = 4, generate: bool = True, max_length: int = 512,
+                      filter_products: bool = False) -> tuple:
+    """Run labelled questions through the pipeline in concurrent batches
+
+    Each batch gets one embedding call, one batched retrieval and one padded
+    generate call; ``workers`` batches are in flight at once. Retrieval is
+    unfiltered unless ``filter_products`` is set, since filtering by the
+    labelled product would make product metrics trivially perfect. Returns
+    a per-question DataFrame and a summary with mean metrics, per-stage
+    latency percentiles and throughput. A question's stage latency is the
+    time its batch spent in that stage.
+    """
+    questions = questions.reset_index(drop=True)
+    batches = [questions.iloc[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    logger.info(f"Evaluating {len(questions)} questions in {len(batches)} batches "
+                f"with {workers} workers")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-eval") as executor:
+        outcomes = list(executor.map(
+            lambda batch: _run_batch(rag, batch, k, generate, max_length, filter_products), batches))
+    wall_seconds = time.perf_counter() - start
+
+    rows, latencies = [], {stage: [] for stage in (*STAGES, "total")}
+    for batch, outcome in zip(batches, outcomes):
+        for stage, seconds in outcome['timings'].items():
+            latencies[stage].extend([seconds] * len(batch))
+        if not outcome['error']:
+            latencies['total'].extend([sum(outcome['timings'].values())] * len(batch))
+        for (_, question), results, answer in zip(batch.iterrows(), outcome['results'],
+                                                  outcome['answers']):
+            metrics = (retrieval_metrics(results, question['complaint_ids'], question['product'], k)
+                       if results is not None else
+                       {'recall_at_k': None, 'hit_at_k': None, 'reciprocal_rank': None})
+            rows.append({
+                'question': question['question'],
+                'product': question['product'],
+                'complaint_ids': question['complaint_ids'],
+                'retrieved': [c for c, _ in retrieved_complaints(results)[:k]] if results else [],
+                'answer': answer,
+                'error': outcome['error'],
+                **metrics,
+            })
+    report = pd.DataFrame(rows)
+
+    answered = len(questions) - int(report['error'].notna().sum()) if len(report) else 0
+    summary = {
+        'questions': len(questions),
+        'failed': len(questions) - answered,
+        'k': k,
+        'batch_size': batch_size,
+        'workers': workers,
+        f'recall@{k}': _mean(report, 'recall_at_k'),
+        f'hit@{k}': _mean(report, 'hit_at_k'),
+        'mrr': _mean(report, 'reciprocal_rank'),
+        'wall_seconds': wall_seconds,
+        'throughput_qps': answered / wall_seconds if wall_seconds else 0.0,
+        'latency': {stage: latency_percentiles(seconds) for stage, seconds in latencies.items()
+                    if seconds},
+        'cache': rag.cache_stats(),
+    }
+    logger.info(f"recall@{k}={summary[f'recall@{k}']}, MRR={summary['mrr']}, "
+                f"{summary['throughput_qps']:.1f} questions/s")
+    return report, summary
+
+def _mean(report: pd.DataFrame, column: str):
+    if column not in report or report[column].notna().sum() == 0:
+        return None
+    return float(report[column].dropna().mean())
+
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency")
+    parser.add_argument("--questions", default=None,
+                        help="CSV/JSONL/Parquet of labelled questions (default: built-in set)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=("dense", "hybrid"), default="dense")
+    parser.add_argument("--backend", choices=("chroma", "flat"), default="chroma")
+    parser.add_argument("--no-generate", action="store_true",
+                        help="Measure retrieval only and skip the LLM")
+    parser.add_argument("--filter-products", action="store_true",
+                        help="Restrict retrieval to each question's labelled product")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Run the original five-question answer review instead")
+    args = parser.parse_args()
+
+    docs_dir = os.path.join(os.path.dirname(__file__), "..", "docs")
+    os.makedirs(docs_dir, exist_ok=True)
     try:
         logger.info("Starting RAG evaluation...")
-        rag = RAGSystem()
-        eval_results = evaluate_rag_system(rag)
-        
-        # Save results
-        output_path = os.path.join(os.path.dirname(__file__), "..", "docs", "evaluation_report.csv")
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        eval_results.to_csv(output_path, index=False)
+        rag = RAGSystem(vector_backend=args.backend, retrieval_mode=args.mode,
+                        answer_cache=False, warmup=False)
+        if args.legacy:
+            eval_results = evaluate_rag_system(rag)
+            output_path = os.path.join(docs_dir, "evaluation_report.csv")
+            eval_results.to_csv(output_path, index=False)
+        else:
+            questions = load_questions(args.questions) if args.questions else default_questions()
+            report, summary = evaluate_parallel(
+                rag, questions, k=args.k, batch_size=args.batch_size, workers=args.workers,
+                generate=not args.no_generate, filter_products=args.filter_products)
+            summary['config'] = {'mode': args.mode, 'backend': args.backend}
+            report.to_csv(os.path.join(docs_dir, "evaluation_report.csv"), index=False)
+            output_path = os.path.join(docs_dir, "evaluation_summary.json")
+            with open(output_path, "w") as f:
+                json.dump(summary, f, indent=2, default=str)
         logger.info(f"Evaluation results saved to {output_path}")
     except Exception as e:
-        logger.error(f"Evaluation process failed: {str(e)}")
\ No newline at end of file
+        logger.error(f"Evaluation process failed: {str(e)}")
@@ -0,0 +1,144 @@
+import os
+import numpy as np
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+def configure_torch_threads(num_threads: int = None, interop_threads: int = None):
+    """Set torch intra-op and inter-op thread counts (intra-op defaults to the core count)"""
+    import torch
+    num_threads = num_threads or os.cpu_count() or 1
+    torch.set_num_threads(num_threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only allowed before the first parallel op runs
+            logger.warning("Inter-op threads already fixed for this process; keeping current setting")
+    logger.info(f"torch using {torch.get_num_threads()} intra-op and "
+                f"{torch.get_num_interop_threads()} inter-op threads")
+
+def quantize_linear_int8(model):
+    """Swap every ``nn.Linear`` for a dynamic int8 one in place, one submodule at a time
+
+    Each float32 weight is freed as soon as its layer is converted, so the
+    conversion adds at most one block's int8 weights on top of the loaded
+    model instead of a full quantized copy.
+    """
+    import gc
+    import torch
+    for child in list(model.children()):
+        if not isinstance(child, torch.nn.Linear):
+            torch.quantization.quantize_dynamic(child, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            gc.collect()
+    # Linear layers directly on the model, such as a language-model head
+    torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    gc.collect()
+    return model
+
+def load_generator(model_name: str, device: str = "cpu", cpu_int8: bool = False) -> tuple:
+    """Load tokenizer and generator model, seq2seq or decoder-only per its config
+
+    ``cpu_int8`` applies dynamic int8 quantization to every ``nn.Linear``:
+    weights are stored as int8 and activations quantized on the fly, which
+    shrinks the model roughly 4x and uses the CPU's int8 matrix kernels.
+    Weights are loaded once (``low_cpu_mem_usage``) and quantized in place,
+    so the load peak stays near the float32 model size while the resident
+    size afterwards is the int8 model's.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoModelForSeq2SeqLM, AutoTokenizer
+    if cpu_int8 and device != "cpu":
+        raise ValueError("int8 dynamic quantization is only supported on CPU")
+    config = AutoConfig.from_pretrained(model_name)
+    model_class = AutoModelForSeq2SeqLM if config.is_encoder_decoder else AutoModelForCausalLM
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = model_class.from_pretrained(
+        model_name,
+        device_map="auto" if device == "cuda" else None,
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+        low_cpu_mem_usage=True
+    )
+    model.eval()
+    if cpu_int8:
+        quantize_linear_int8(model)
+        logger.info(f"Applied dynamic int8 quantization to {model_name}")
+    # Batched generation pads prompts; decoder-only models must pad on the left
+    if not config.is_encoder_decoder:
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer, model
+
+class PrefixKVCache:
+    """Attention key/value state of a fixed prompt prefix, computed once
+
+    Every prompt starts with the same instructions, so a decoder-only model
+    can resume from the cached prefix state instead of re-encoding it. An
+    encoder-decoder model attends bidirectionally over the whole prompt, so
+    its encoder states depend on the suffix and cannot be reused;
+    ``enabled`` is ``False`` there.
+    """
+    def __init__(self, model, tokenizer, prefix: str):
+        self.prefix = prefix
+        self.enabled = bool(prefix) and not model.config.is_encoder_decoder
+        if not self.enabled:
+            return
+        import torch
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt")['input_ids'].to(model.device)
+        with torch.no_grad():
+            output = model(input_ids=self.prefix_ids, use_cache=True)
+        # Generation builds new cache tensors at every step, so this state is never mutated
+        self.past_key_values = output.past_key_values
+        self._tokenizer = tokenizer
+        logger.info(f"Cached KV state for {self.prefix_ids.shape[1]} prompt prefix tokens")
+
+    def inputs_for(self, prompt: str, max_length: int):
+        """``generate`` kwargs resuming from the prefix, or ``None`` if the prompt does not start with it"""
+        if not self.enabled or not prompt.startswith(self.prefix):
+            return None
+        import torch
+        suffix_ids = self._tokenizer(prompt[len(self.prefix):], add_special_tokens=False,
+                                     return_tensors="pt")['input_ids'].to(self.prefix_ids.device)
+        input_ids = torch.cat([self.prefix_ids, suffix_ids], dim=1)[:, :max_length]
+        return {
+            'input_ids': input_ids,
+            'attention_mask': torch.ones_like(input_ids),
+            'past_key_values': self.past_key_values,
+        }
+
+class BatchTextStreamer:
+    """``generate`` streamer that decodes each row of a padded batch on its own
+
+    transformers' text streamers only accept a batch of one. ``generate``
+    first puts the prompt ids, which are skipped; after that every step's new
+    token per row is appended and the row's newly decoded text is passed to
+    ``on_text(row, text)``. Text ending in an incomplete character is held
+    back until the next token completes it.
+    """
+    def __init__(self, tokenizer, batch_size: int, on_text):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.tokens = [[] for _ in range(batch_size)]
+        self.texts = [""] * batch_size
+        self._prompt_skipped = False
+
+    def put(self, value):
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        for row, new_tokens in enumerate(np.asarray(value).reshape(len(self.tokens), -1)):
+            self.tokens[row].extend(int(token) for token in new_tokens)
+            self._flush(row)
+
+    def end(self):
+        for row in range(len(self.tokens)):
+            self._flush(row, final=True)
+
+    def _flush(self, row: int, final: bool = False):
+        text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+        if text.endswith("�") and not final:
+            return
+        if len(text) > len(self.texts[row]):
+            self.on_text(row, text[len(self.texts[row]):])
+            self.texts[row] = text
@@ -0,0 +1,258 @@
+"""Offline pipeline runner that only redoes stages whose inputs changed
+
+Run from the project root:
+    python -m src.pipeline                 # preprocess -> dedup -> chunk -> lexical -> embed
+    python -m src.pipeline --force chunk   # rerun chunking and whatever it changes
+    python -m src.pipeline --dry-run
+"""
+import hashlib
+import inspect
+import json
+import os
+import time
+from src.utils import configure_logging, get_data_path, get_project_root
+
+logger = configure_logging()
+
+MANIFEST_NAME = "pipeline_manifest.json"
+MANIFEST_VERSION = 1
+HASH_BLOCK_BYTES = 1 << 20
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_digest(modules: list) -> str:
+    """Hash of the source of the modules a stage runs"""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+class Manifest:
+    """Stage records and a content-hash cache, persisted as JSON
+
+    File hashes are cached by size and modification time, so an unchanged
+    multi-gigabyte raw dump is hashed once rather than on every run.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.data = {'version': MANIFEST_VERSION, 'stages': {}, 'files': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.data = data
+
+    @property
+    def stages(self) -> dict:
+        return self.data['stages']
+
+    def digest(self, path: str) -> str:
+        """Content hash of a file, or of every file under a directory"""
+        if os.path.isdir(path):
+            digest = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    digest.update(os.path.relpath(file_path, path).encode())
+                    digest.update(self.digest(file_path).encode())
+            return digest.hexdigest()
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.data['files'].get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+        sha256 = file_sha256(path)
+        self.data['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return sha256
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+class Stage:
+    """One pipeline step: what it reads, writes and depends on
+
+    ``run()`` must (re)create every path in ``outputs``. ``params`` holds
+    everything besides input files and ``code`` modules that affects the
+    outputs; values must be JSON-serializable.
+    """
+    def __init__(self, name: str, run, inputs: list, outputs: list, params: dict = None,
+                 code: list = (), manifest_dir: str = None):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.code = list(code)
+        self.manifest_dir = manifest_dir or os.path.dirname(self.outputs[0])
+
+    def fingerprint(self, manifest: Manifest) -> str:
+        """Hash of input contents, code and parameters"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({
+            'stage': self.name,
+            'params': self.params,
+            'code': code_digest(self.code),
+            'inputs': {os.path.basename(path): manifest.digest(path) for path in self.inputs},
+        }, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+def run_pipeline(stages: list, force: tuple = (), dry_run: bool = False) -> dict:
+    """Run stages in order, skipping those whose fingerprint is unchanged
+
+    A stage is up to date when its recorded fingerprint matches and all its
+    outputs exist. Downstream stages fingerprint their input files by
+    content, so a stage that reruns but writes byte-identical outputs leaves
+    everything after it skipped. Returns each stage's outcome:
+    ``ran``, ``skipped`` or, with ``dry_run``, ``stale``.
+    """
+    manifests, outcomes = {}, {}
+    for stage in stages:
+        manifest_path = os.path.join(stage.manifest_dir, MANIFEST_NAME)
+        if manifest_path not in manifests:
+            manifests[manifest_path] = Manifest(manifest_path)
+        manifest = manifests[manifest_path]
+        missing = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing and not dry_run:
+            raise FileNotFoundError(f"{stage.name} stage input not found: {', '.join(missing)}")
+        fingerprint = stage.fingerprint(manifest) if not missing else None
+        record = manifest.stages.get(stage.name, {})
+        up_to_date = (fingerprint is not None and record.get('fingerprint') == fingerprint
+                      and all(os.path.exists(path) for path in stage.outputs))
+        if up_to_date and stage.name not in force:
+            logger.info(f"{stage.name}: up to date, skipping")
+            outcomes[stage.name] = "skipped"
+            continue
+        if dry_run:
+            logger.info(f"{stage.name}: would run")
+            outcomes[stage.name] = "stale"
+            continue
+
+        logger.info(f"{stage.name}: running")
+        start = time.perf_counter()
+        try:
+            stage.run()
+        except Exception as e:
+            logger.error(f"{stage.name} stage failed: {str(e)}")
+            manifest.save()
+            raise
+        seconds = time.perf_counter() - start
+        outputs = {os.path.basename(path): manifest.digest(path) for path in stage.outputs}
+        unchanged = outputs == record.get('outputs')
+        manifest.stages[stage.name] = {
+            'fingerprint': fingerprint,
+            'params': stage.params,
+            'outputs': outputs,
+            'seconds': seconds,
+            'completed_at': time.time(),
+        }
+        manifest.save()
+        logger.info(f"{stage.name}: done in {seconds:.1f}s"
+                    f"{' (outputs unchanged)' if unchanged else ''}")
+        outcomes[stage.name] = "ran"
+    if not dry_run:
+        for manifest in manifests.values():
+            manifest.save()
+    return outcomes
+
+def default_stages(backend: str = "chroma", chunk_size: int = None, chunk_overlap: int = None,
+                   dtype: str = "float16", jobs: int = None, dedup: bool = True,
+                   dedup_threshold: float = None) -> list:
+    """preprocess -> dedup -> chunk -> lexical -> embed over the project's data and vector store
+
+    Only embedding-side settings enter the fingerprints, so changing the LLM
+    or prompt settings in ``rag_logic`` reruns nothing.
+    """
+    from src import (artifacts, bm25, chunking, data_processing, dedup as near_duplicates, embedding,
+                     trends, vector_index)
+    chunk_size = chunk_size or chunking.DEFAULT_CHUNK_SIZE
+    chunk_overlap = chunk_overlap or chunking.DEFAULT_CHUNK_OVERLAP
+    processed_dir = get_data_path("processed")
+    vector_dir = os.path.join(get_project_root(), "vectorstore")
+    raw_path = get_data_path("raw", "cfpb_complaints.csv")
+    processed_path = data_processing.get_processed_path()
+    chunks_path = artifacts.artifact_path(processed_dir, "chunks")
+    deduplicated_path = artifacts.artifact_path(processed_dir, "deduplicated_complaints")
+    chunk_input = deduplicated_path if dedup else processed_path
+    dedup_threshold = dedup_threshold or near_duplicates.THRESHOLD
+
+    def deduplicate():
+        report = near_duplicates.deduplicate_artifact(
+            processed_path, deduplicated_path, threshold=dedup_threshold, n_jobs=jobs,
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        with open(os.path.join(processed_dir, "dedup_report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+    bm25_dir = bm25.get_bm25_dir()
+
+    def lexical():
+        bm25.build_bm25_index(chunks_path)
+        # Hybrid retrieval caches depend on the lexical index too
+        vector_index.write_index_version(backend)
+
+    def embed():
+        if backend == "flat":
+            success = embedding.generate_flat_index(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                    dtype=dtype)
+        else:
+            success = embedding.generate_embeddings(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        if not success:
+            raise RuntimeError("Embedding generation failed; see embedding_errors.log")
+
+    embed_outputs = ([vector_index.get_index_dir()] if backend == "flat"
+                     else [os.path.join(vector_dir, "chroma.sqlite3")])
+    stages = [
+        Stage("preprocess",
+              lambda: data_processing.preprocess_stream(raw_path, processed_path, n_jobs=jobs),
+              inputs=[raw_path], outputs=[processed_path, trends.get_cube_path()],
+              params={'product_map': data_processing.PRODUCT_MAP,
+                      'columns': data_processing.PROCESSED_COLUMNS},
+              code=[data_processing, trends, artifacts], manifest_dir=processed_dir),
+        Stage("dedup", deduplicate, inputs=[processed_path], outputs=[deduplicated_path],
+              params={'threshold': dedup_threshold, 'num_perm': near_duplicates.NUM_PERM,
+                      'bands': near_duplicates.BANDS, 'shingle_size': near_duplicates.SHINGLE_SIZE},
+              code=[near_duplicates, artifacts], manifest_dir=processed_dir),
+        Stage("chunk",
+              lambda: chunking.chunk_artifact(chunk_input, chunks_path, chunk_size, chunk_overlap,
+                                              n_jobs=jobs),
+              inputs=[chunk_input], outputs=[chunks_path],
+              params={'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap},
+              code=[chunking, artifacts], manifest_dir=processed_dir),
+        Stage("lexical", lexical, inputs=[chunks_path], outputs=[bm25_dir],
+              params={'collection': bm25.COLLECTION_NAME, 'max_term_length': bm25.MAX_TERM_LENGTH},
+              code=[bm25], manifest_dir=vector_dir),
+        Stage("embed", embed, inputs=[chunks_path], outputs=embed_outputs,
+              params={'model_name': embedding.MODEL_NAME, 'backend': backend, 'dtype': dtype,
+                      'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap},
+              code=[embedding, vector_index], manifest_dir=vector_dir),
+    ]
+    return [stage for stage in stages if dedup or stage.name != "dedup"]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the offline pipeline, skipping up-to-date stages")
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--force", nargs="*", default=[], help="Stages to rerun regardless")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Chunk every narrative instead of one per near-duplicate cluster")
+    parser.add_argument("--dedup-threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    stages = default_stages(args.backend, args.chunk_size, args.chunk_overlap, args.dtype, args.jobs,
+                            dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold)
+    outcomes = run_pipeline(stages, force=tuple(args.force), dry_run=args.dry_run)
+    logger.info("Pipeline: " + ", ".join(f"{name} {outcome}" for name, outcome in outcomes.items()))
@@ -1,10 +1,17 @@
 import os
-import torch
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-from src.utils import configure_logging
+import threading
+import time
+from collections import deque
+import numpy as np
+from src.utils import configure_logging, get_project_root
+from src.bm25 import BM25Index, fuse_results, get_bm25_dir
+from src.inference import BatchTextStreamer, PrefixKVCache, configure_torch_threads, load_generator
+from src.context import MAX_INPUT_TOKENS, pack_context, token_counter
+from src.cache import SemanticAnswerCache, TTLCache, normalize_query
+from src.telemetry import BATCH_SIZE, STAGE_SECONDS, record_cache, record_tokens, span
+from src.trends import TrendCube, get_cube_path, parse_aggregate_question, render_facts
+from src.vector_index import (COLLECTION_NAME, FlatVectorIndex, get_index_dir,
+                              get_version_path, read_index_version)
 
 logger = configure_logging()
 
@@ -12,92 +19,745 @@ logger = configure_logging()
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 LLM_MODEL = "google/flan-t5-large"  # Open-access alternative
 
+# Vector store backends: Chroma HNSW or the memory-mapped flat index
+VECTOR_BACKENDS = ("chroma", "flat")
+# Dense only, or dense fused with the BM25 index by reciprocal rank fusion
+RETRIEVAL_MODES = ("dense", "hybrid")
+# Lexical candidates fused per query; BM25 candidates are cheap, dense ones are not
+LEXICAL_CANDIDATES = 20
+
+# Phrases that scope a question to a single product partition
+PRODUCT_KEYWORDS = {
+    'BNPL': ["bnpl", "buy now pay later", "buy now, pay later", "pay in 4", "installment plan"],
+    'Credit Card': ["credit card", "card billing", "card statement", "credit limit", "annual fee"],
+    'Personal Loan': ["personal loan", "payday loan", "vehicle loan", "car loan", "loan application"],
+    'Savings Account': ["savings account", "savings", "interest rate on my account"],
+    'Money Transfer': ["money transfer", "wire transfer", "remittance", "zelle", "western union",
+                       "sending money", "transfers"],
+}
+
+# Prompt template optimized for FLAN-T5
+PROMPT_TEMPLATE = """Answer the question based on the context below. If you don't know the answer, say "I don't have enough information".
+
+Context: {context}
+
+Question: {question}
+
+Answer: """
+
+# Count and trend questions are answered from the trend cube; the LLM only phrases the numbers
+AGGREGATE_TEMPLATE = """Summarize these complaint statistics to answer the question. Use only the numbers given.
+
+Statistics:
+{facts}
+
+Question: {question}
+
+Answer: """
+
+def get_answer_cache_path() -> str:
+    """Get absolute path to the persisted semantic answer cache"""
+    return os.path.join(get_project_root(), "vectorstore", "answer_cache.npz")
+
+def detect_product(question: str):
+    """Infer the product a question is about, or ``None`` if it names none or several"""
+    text = question.lower()
+    matches = [product for product, phrases in PRODUCT_KEYWORDS.items()
+               if any(phrase in text for phrase in phrases)]
+    return matches[0] if len(matches) == 1 else None
+
+def select_device() -> str:
+    """CUDA if available, else CPU (imports torch on first use)"""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+# Components loaded at start-up; "warmup" runs once all of them are ready
+COMPONENTS = ("embedder", "index", "llm")
+
 class RAGSystem:
-    def __init__(self, model_name: str = EMBEDDING_MODEL):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"Initializing RAG system on {self.device.upper()}")
-        
-        # Initialize components
-        self.embedder = SentenceTransformer(model_name, device=self.device)
+    """Retrieval-augmented answering over the complaint index
+
+    torch, transformers, sentence-transformers and chromadb are imported
+    only when a component is loaded. With ``background=True`` the
+    constructor returns at once and the embedder, index and LLM load in
+    parallel threads, followed by a warm-up pass. ``status`` reports
+    progress, and each method waits only for the components it uses.
+    ``cpu_optimized=True`` quantizes the generator's linear layers to int8
+    on CPU and, for decoder-only models, reuses the KV state of the fixed
+    prompt prefix; ``torch_threads`` sets torch's thread count. Count, trend
+    and top-N questions are answered from the trend cube when it exists
+    (``aggregates=False`` sends everything through retrieval). At most
+    ``max_concurrent_generations`` ``generate`` calls (streamed or batched)
+    run on the model at once; further callers wait for a slot.
+    """
+    def __init__(self, model_name: str = EMBEDDING_MODEL, vector_backend: str = "chroma",
+                 embedding_cache_size: int = 1024, embedding_cache_ttl: float = 24 * 3600,
+                 retrieval_cache_size: int = 1024, retrieval_cache_ttl: float = 600,
+                 answer_cache: bool = True, answer_cache_size: int = 512,
+                 answer_cache_ttl: float = 24 * 3600, answer_cache_threshold: float = 0.9,
+                 answer_cache_path: str = None, retrieval_mode: str = "dense",
+                 background: bool = False, warmup: bool = True,
+                 max_input_tokens: int = MAX_INPUT_TOKENS, cpu_optimized: bool = False,
+                 torch_threads: int = None, aggregates: bool = True, trend_cube_path: str = None,
+                 max_concurrent_generations: int = 1):
+        if vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend {vector_backend}; expected one of {VECTOR_BACKENDS}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval_mode}; expected one of {RETRIEVAL_MODES}")
+        self.model_name = model_name
+        self.vector_backend = vector_backend
+        self.retrieval_mode = retrieval_mode
+        self.max_input_tokens = max_input_tokens
+        self.cpu_optimized = cpu_optimized
+        self.torch_threads = torch_threads
+        self.prefix_cache = None
+        self.embedder = None
+        self.vector_db = None
+        self.lexical_index = None
+        self.tokenizer = None
+        self.llm_model = None
+        self._device = None
+        self._device_lock = threading.Lock()
+        # Concurrent generate calls on one model only contend for the same
+        # cores or GPU; batching (GenerationScheduler, StreamingScheduler) is
+        # how to share them
+        self.max_concurrent_generations = max_concurrent_generations
+        self._generation_slots = threading.BoundedSemaphore(max_concurrent_generations)
+
+        # Level 1: normalized query -> embedding; level 2: top-k results,
+        # cleared whenever the embedding job stamps a new index version
+        self.embedding_cache = TTLCache(embedding_cache_size, embedding_cache_ttl)
+        self.retrieval_cache = TTLCache(retrieval_cache_size, retrieval_cache_ttl)
+        self._index_version_mtime = self._version_mtime()
+        self.index_version = read_index_version()
+        self.answer_cache = SemanticAnswerCache(
+            maxsize=answer_cache_size,
+            ttl=answer_cache_ttl,
+            threshold=answer_cache_threshold,
+            path=answer_cache_path or get_answer_cache_path()
+        ) if answer_cache else None
+
+        self.prompt_template = PROMPT_TEMPLATE
+        self.aggregates = aggregates
+        self.trend_cube_path = trend_cube_path or get_cube_path()
+        self._trend_cube = None
+        self._trend_cube_mtime = None
+        self._trend_cube_lock = threading.Lock()
+
+        stages = COMPONENTS + (("warmup",) if warmup else ())
+        self.load_state = {name: "pending" for name in stages}
+        self.load_seconds = {}
+        self.load_errors = {}
+        self._loaded = {name: threading.Event() for name in stages}
+        self.ttft_seconds = deque(maxlen=1000)
+        self._created_at = time.perf_counter()
+        if background:
+            self.start_background_loading()
+        else:
+            for name in COMPONENTS:
+                self._load_component(name, reraise=True)
+            if warmup:
+                self._load_component("warmup", reraise=True)
+
+    @property
+    def device(self) -> str:
+        with self._device_lock:
+            if self._device is None:
+                self._device = select_device()
+                logger.info(f"Initializing RAG system on {self._device.upper()}")
+            return self._device
+
+    def _load_embedder(self):
+        from sentence_transformers import SentenceTransformer
+        self.embedder = SentenceTransformer(self.model_name, device=self.device)
+
+    def _load_index(self):
         self.vector_db = self._init_vector_db()
-        
-        # Initialize text generation model
+        if self.retrieval_mode == "hybrid":
+            self.lexical_index = BM25Index.load(get_bm25_dir())
+
+    def _load_llm(self):
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL)
-            self.llm_model = AutoModelForCausalLM.from_pretrained(
-                LLM_MODEL,
-                device_map="auto" if self.device == "cuda" else None,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-            )
+            if self.cpu_optimized or self.torch_threads:
+                configure_torch_threads(self.torch_threads)
+            cpu_optimized = self.cpu_optimized and self.device == "cpu"
+            if self.cpu_optimized and not cpu_optimized:
+                logger.warning("CPU inference mode ignored on GPU")
+            self.tokenizer, self.llm_model = load_generator(LLM_MODEL, self.device, cpu_int8=cpu_optimized)
+            if cpu_optimized:
+                self.prefix_cache = PrefixKVCache(self.llm_model, self.tokenizer,
+                                                  self.prompt_template.split("{context}")[0])
         except Exception as e:
             logger.error(f"Failed to load LLM: {str(e)}")
             raise
-        
-        # Prompt template optimized for FLAN-T5
-        self.prompt_template = """Answer the question based on the context below. If you don't know the answer, say "I don't have enough information".
 
-Context: {context}
+    def _generation_inputs(self, prompts: list) -> dict:
+        """Tokenized prompts; a single prompt resumes from the cached prefix state if enabled"""
+        if len(prompts) == 1 and self.prefix_cache is not None:
+            inputs = self.prefix_cache.inputs_for(prompts[0], self.max_input_tokens)
+            if inputs is not None:
+                return inputs
+        inputs = self.tokenizer(prompts, return_tensors="pt", max_length=self.max_input_tokens,
+                                truncation=True, padding=True)
+        if self.device == "cuda":
+            inputs = inputs.to("cuda")
+        return inputs
 
-Question: {question}
+    def _warm_up(self):
+        """Run one tiny query through every component to pay first-call costs"""
+        for name in COMPONENTS:
+            self.wait_for(name)
+        embedding = self.embedder.encode(["warm up"], convert_to_numpy=True)
+        self.vector_db.query(query_embeddings=[embedding[0].tolist()], n_results=1,
+                             include=["documents", "metadatas", "distances"])
+        if self.lexical_index is not None:
+            self.lexical_index.query(["warm up"], n_results=1)
+        inputs = self.tokenizer("warm up", return_tensors="pt")
+        if self.device == "cuda":
+            inputs = inputs.to("cuda")
+        self.llm_model.generate(**inputs, max_new_tokens=1)
 
-Answer: """
+    def _load_component(self, name: str, reraise: bool = False):
+        self.load_state[name] = "loading"
+        start = time.perf_counter()
+        try:
+            getattr(self, f"_load_{name}" if name != "warmup" else "_warm_up")()
+            self.load_state[name] = "ready"
+        except Exception as e:
+            logger.error(f"Loading {name} failed: {str(e)}", exc_info=True)
+            self.load_state[name] = "failed"
+            self.load_errors[name] = str(e)
+            if reraise:
+                raise
+        finally:
+            self.load_seconds[name] = time.perf_counter() - start
+            self._loaded[name].set()
+        logger.info(f"{name} {self.load_state[name]} in {self.load_seconds[name]:.2f}s "
+                    f"({time.perf_counter() - self._created_at:.2f}s since start)")
 
-    def _init_vector_db(self) -> chromadb.Collection:
+    def start_background_loading(self):
+        """Load every component in its own daemon thread, then warm up"""
+        threads = [threading.Thread(target=self._load_component, args=(name,),
+                                    name=f"rag-load-{name}", daemon=True)
+                   for name in self._loaded]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def wait_for(self, name: str, timeout: float = None):
+        """Block until a component has loaded; raise if it failed or timed out"""
+        if not self._loaded[name].wait(timeout):
+            raise TimeoutError(f"{name} still loading after {timeout}s")
+        if self.load_state[name] == "failed":
+            raise RuntimeError(f"{name} failed to load: {self.load_errors.get(name)}")
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """Wait for every component and the warm-up; ``False`` on timeout"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for event in self._loaded.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not event.wait(remaining):
+                return False
+        return self.is_ready
+
+    @property
+    def is_ready(self) -> bool:
+        return all(state == "ready" for state in self.load_state.values())
+
+    def status(self) -> dict:
+        """Load state and seconds spent per component"""
+        return {
+            'ready': self.is_ready,
+            'components': {name: {'state': state, 'seconds': self.load_seconds.get(name),
+                                  'error': self.load_errors.get(name)}
+                           for name, state in self.load_state.items()},
+        }
+
+    def _init_vector_db(self):
+        if self.vector_backend == "flat":
+            return FlatVectorIndex.load(get_index_dir())
+        import chromadb
+        from chromadb.config import Settings
         try:
             client = chromadb.PersistentClient(
                 # Correct path to vector store
                 path=os.path.join(os.path.dirname(__file__), "..", "vectorstore"),
                 settings=Settings(allow_reset=True)
             )
-            # Use correct collection name
-            return client.get_collection("complaint_vectors")
+            # Same collection the embedding job writes
+            return client.get_collection(COLLECTION_NAME)
         except Exception as e:
             logger.error(f"Vector DB initialization failed: {str(e)}")
             # Try to create collection if it doesn't exist
             try:
                 logger.warning("Attempting to create collection")
-                collection = client.create_collection("complaint_vectors")
-                logger.info("Created new collection 'complaint_vectors'")
+                collection = client.create_collection(
+                    COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+                logger.info(f"Created new collection '{COLLECTION_NAME}'")
                 return collection
             except Exception as create_error:
                 logger.critical(f"Failed to create collection: {str(create_error)}")
                 raise
 
 
-    def generate_response(self, query: str, max_length=512) -> dict:
-        """Generate answer using RAG pipeline"""
+    @staticmethod
+    def _version_mtime():
+        try:
+            return os.stat(get_version_path()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh_index_version(self):
+        """Invalidate cached retrievals (and reopen a flat index) after a rebuild"""
+        mtime = self._version_mtime()
+        if mtime == self._index_version_mtime:
+            return
+        self._index_version_mtime = mtime
+        version = read_index_version()
+        if version != self.index_version:
+            logger.info(f"Index version changed to {version}; clearing retrieval cache")
+            self.index_version = version
+            self.retrieval_cache.clear()
+            if self.vector_backend == "flat":
+                self.vector_db = self._init_vector_db()
+            if self.lexical_index is not None:
+                self.lexical_index = BM25Index.load(get_bm25_dir())
+
+    def embed_query(self, query: str):
+        """Embed a query, reusing the cached embedding of its normalized text"""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        """Embed queries with one ``encode`` call for all cache misses"""
+        keys = [normalize_query(query) for query in queries]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, emb in zip(keys, embeddings) if emb is None))
+        record_cache("embedding", len(keys) - sum(emb is None for emb in embeddings),
+                     sum(emb is None for emb in embeddings))
+        if missing:
+            self.wait_for("embedder")
+            BATCH_SIZE.observe(len(missing), stage="embed")
+            with span("embed", queries=len(missing)):
+                # MiniLM is uncased, so embedding the normalized text loses nothing
+                encoded = dict(zip(missing, self.embedder.encode(missing, convert_to_numpy=True)))
+            for key, embedding in encoded.items():
+                self.embedding_cache.put(key, embedding)
+            embeddings = [encoded[key] if emb is None else emb for key, emb in zip(keys, embeddings)]
+        return np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+    def retrieve(self, query: str, k: int = 5, product: str = None, mode: str = None) -> dict:
+        """Retrieve the top-k chunks for a query, optionally within one product
+
+        A product filter only searches that product's partition of the index.
+        In ``hybrid`` mode the k dense results are fused with the BM25 top
+        ``LEXICAL_CANDIDATES``, so exact terms can surface without asking the
+        vector store for more candidates. Results are cached per normalized
+        query, ``k``, product and mode until the index version changes;
+        callers must not mutate them.
+        """
+        return self.retrieve_batch([query], k, [product], mode)[0]
+
+    def retrieve_batch(self, queries: list, k: int = 5, products: list = None,
+                       mode: str = None) -> list:
+        """``retrieve`` for several queries, one vector store call per product"""
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode}; expected one of {RETRIEVAL_MODES}")
+        products = products or [None] * len(queries)
+        self._refresh_index_version()
+        cache_keys = [(normalize_query(query), k, product, mode)
+                      for query, product in zip(queries, products)]
+        results = [self.retrieval_cache.get(key) for key in cache_keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        record_cache("retrieval", len(results) - len(pending), len(pending))
+        if not pending:
+            return results
+
+        embeddings = self.embed_queries([queries[i] for i in pending])
+        self.wait_for("index")
+        BATCH_SIZE.observe(len(pending), stage="retrieve")
+        groups = {}
+        for position, i in enumerate(pending):
+            groups.setdefault(products[i], []).append((position, i))
+        for product, members in groups.items():
+            where = {'product': product} if product else None
+            with span("vector_search", queries=len(members), product=product, k=k):
+                batch = self.vector_db.query(
+                    query_embeddings=embeddings[[position for position, _ in members]].tolist(),
+                    n_results=k,
+                    where=where,
+                    include=["documents", "metadatas", "distances"]
+                )
+            for j, (_, i) in enumerate(members):
+                result = {key: [values[j]] for key, values in batch.items()
+                          if isinstance(values, list) and values}
+                if mode == "hybrid":
+                    if self.lexical_index is None:
+                        self.lexical_index = BM25Index.load(get_bm25_dir())
+                    with span("lexical_search", product=product):
+                        lexical = self.lexical_index.query([queries[i]], max(k, LEXICAL_CANDIDATES), where)
+                    result = fuse_results(result, lexical, k)
+                results[i] = result
+                self.retrieval_cache.put(cache_keys[i], result)
+        return results
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of every cache level"""
+        return {
+            'embedding': self.embedding_cache.stats(),
+            'retrieval': self.retrieval_cache.stats(),
+            'answer': self.answer_cache.stats() if self.answer_cache is not None else None,
+            'index_version': self.index_version,
+        }
+
+    def _build_prompt(self, query: str, results: dict) -> str:
+        """Prompt with retrieved sources packed into the tokens the question leaves free"""
+        count_tokens = token_counter(self.tokenizer)
+        with span("prompt_build") as attributes:
+            frame = self.prompt_template.format(context="", question=query)
+            budget = self.max_input_tokens - count_tokens([frame])[0] - 1  # end-of-sequence token
+            context, packed = pack_context(results, count_tokens, budget)
+            attributes['sources'] = len(packed)
+        logger.info(f"Packed {len(packed)} sources into {sum(p['tokens'] for p in packed)} "
+                    f"of {budget} context tokens")
+        return self.prompt_template.format(context=context, question=query)
+
+    def lookup_cached_answer(self, query: str, product: str = None):
+        """Answer-cache hit for a query as ``(response, embedding)``; response is ``None`` on a miss"""
+        self._refresh_index_version()
+        query_embedding = self.embed_query(query)
+        hit = self.answer_cache.lookup(query_embedding, product, self.index_version)
+        record_cache("answer", hit is not None, hit is None)
+        if hit is None:
+            return None, query_embedding
+        logger.info(f"Answer cache hit (similarity {hit[1]:.3f})")
+        return hit[0], query_embedding
+
+    def stream_response(self, query: str, max_length=512, product: str = None,
+                        use_cache: bool = True, aggregates: bool = None):
+        """Generate an answer incrementally
+
+        Yields event dicts: ``sources`` as soon as retrieval finishes, one
+        ``token`` per piece of text the model produces, then ``done`` with the
+        full answer and time to first token (or ``error``). Closing the
+        generator early stops generation. ``aggregates=False`` skips the
+        trend cube for this call.
+        """
+        start = time.perf_counter()
+        stop = threading.Event()
         try:
-            # Retrieve context
-            retrieval_results = self.retrieve(query)
-            context = "\n".join([
-                f"[Source {i+1}] {text[:200]}..." 
-                for i, text in enumerate(retrieval_results['documents'][0])
-            ])
-            
-            # Format prompt
-            prompt = self.prompt_template.format(context=context, question=query)
-            
-            # Generate response
-            inputs = self.tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
-            if self.device == "cuda":
-                inputs = inputs.to("cuda")
-            
+            response = self.answer_aggregate(query, product, max_length, aggregates=aggregates)
+            if response is not None:
+                yield {'type': 'sources', 'sources': response['sources']}
+                yield {'type': 'token', 'text': response['answer']}
+                yield {'type': 'done', **response, 'cached': False,
+                       'ttft_seconds': time.perf_counter() - start,
+                       'total_seconds': time.perf_counter() - start}
+                return
+
+            use_cache = use_cache and self.answer_cache is not None
+            if use_cache:
+                response, query_embedding = self.lookup_cached_answer(query, product)
+                if response is not None:
+                    yield {'type': 'sources', 'sources': response['sources']}
+                    yield {'type': 'token', 'text': response['answer']}
+                    yield {'type': 'done', **response, 'cached': True,
+                           'ttft_seconds': time.perf_counter() - start}
+                    return
+
+            retrieval_results = self.retrieve(query, product=product)
+            yield {'type': 'sources', 'sources': retrieval_results}
+
+            from transformers import StoppingCriteriaList, TextIteratorStreamer
+            self.wait_for("llm")
+            inputs = self._generation_inputs([self._build_prompt(query, retrieval_results)])
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            failures = []
+
+            record_tokens("in", inputs['attention_mask'].sum(dim=1).tolist())
+
+            def generate():
+                try:
+                    with self._generation_slots, span("generate", batch=1, streamed=True):
+                        if stop.is_set():
+                            # The consumer left while waiting for a slot
+                            streamer.end()
+                            return
+                        self.llm_model.generate(
+                            **inputs, max_length=max_length, temperature=0.7, streamer=streamer,
+                            stopping_criteria=StoppingCriteriaList(
+                                [lambda input_ids, scores, **kwargs: stop.is_set()]))
+                except Exception as e:
+                    # Unblock the consumer; the error is re-raised below
+                    failures.append(e)
+                    streamer.end()
+
+            generation = threading.Thread(target=generate, name="rag-generate", daemon=True)
+            generation.start()
+
+            pieces, ttft = [], None
+            for text in streamer:
+                if not text:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    self.ttft_seconds.append(ttft)
+                    STAGE_SECONDS.observe(ttft, stage="first_token")
+                    logger.info(f"First token after {ttft:.3f}s")
+                pieces.append(text)
+                yield {'type': 'token', 'text': text}
+            generation.join()
+            if failures:
+                raise failures[0]
+
+            response = {"answer": "".join(pieces), "sources": retrieval_results}
+            record_tokens("out", [len(self.tokenizer(response['answer'], add_special_tokens=False)['input_ids'])])
+            if use_cache:
+                self.answer_cache.put(query, query_embedding, response, product, self.index_version)
+            yield {'type': 'done', **response, 'cached': False, 'ttft_seconds': ttft,
+                   'total_seconds': time.perf_counter() - start}
+        except Exception as e:
+            logger.error(f"Streaming generation failed: {str(e)}")
+            yield {'type': 'error', 'answer': "Error processing your request",
+                   'sources': {'documents': [], 'metadatas': []}}
+        finally:
+            stop.set()
+
+    def stream_batch(self, queries: list, emit, max_length=512, products: list = None,
+                     use_cache: bool = True, aggregates: bool = None, started: list = None):
+        """Stream answers to several queries from one padded ``generate``
+
+        Calls ``emit(i, event)`` with the ``stream_response`` events of query
+        ``i``: ``sources`` once the batch's retrieval finishes, ``token``
+        pieces as its row of the batch decodes, then ``done`` (or ``error``).
+        Trend cube answers and answer-cache hits finish before the model runs.
+        ``started`` holds each query's ``perf_counter`` arrival time, from
+        which time to first token is measured.
+        """
+        products = products or [None] * len(queries)
+        started = started or [time.perf_counter()] * len(queries)
+        finished = [False] * len(queries)
+        ttft = {}
+
+        def finish(i, response, cached):
+            emit(i, {'type': 'done', **response, 'cached': cached,
+                     'ttft_seconds': ttft.get(i, time.perf_counter() - started[i]),
+                     'total_seconds': time.perf_counter() - started[i]})
+            finished[i] = True
+
+        def answer_at_once(i, response, cached):
+            emit(i, {'type': 'sources', 'sources': response['sources']})
+            emit(i, {'type': 'token', 'text': response['answer']})
+            finish(i, response, cached)
+
+        with span("request", queries=len(queries), streamed=True):
+            try:
+                for i, (query, product) in enumerate(zip(queries, products)):
+                    response = self.answer_aggregate(query, product, max_length, aggregates=aggregates)
+                    if response is not None:
+                        answer_at_once(i, response, False)
+                use_cache = use_cache and self.answer_cache is not None
+                if use_cache:
+                    self._refresh_index_version()
+                    query_embeddings = self.embed_queries(queries)
+                    for i, (embedding, product) in enumerate(zip(query_embeddings, products)):
+                        if finished[i]:
+                            continue
+                        hit = self.answer_cache.lookup(embedding, product, self.index_version)
+                        record_cache("answer", hit is not None, hit is None)
+                        if hit is not None:
+                            logger.info(f"Answer cache hit (similarity {hit[1]:.3f})")
+                            answer_at_once(i, hit[0], True)
+                pending = [i for i, done in enumerate(finished) if not done]
+                if not pending:
+                    return
+
+                retrieval_results = self.retrieve_batch(
+                    [queries[i] for i in pending], products=[products[i] for i in pending])
+                for i, results in zip(pending, retrieval_results):
+                    emit(i, {'type': 'sources', 'sources': results})
+
+                self.wait_for("llm")
+                inputs = self._generation_inputs([self._build_prompt(queries[i], results)
+                                                  for i, results in zip(pending, retrieval_results)])
+                BATCH_SIZE.observe(len(pending), stage="generate")
+                record_tokens("in", inputs['attention_mask'].sum(dim=1).tolist())
+
+                def on_text(row, text):
+                    i = pending[row]
+                    if i not in ttft:
+                        ttft[i] = time.perf_counter() - started[i]
+                        self.ttft_seconds.append(ttft[i])
+                        STAGE_SECONDS.observe(ttft[i], stage="first_token")
+                    emit(i, {'type': 'token', 'text': text})
+
+                streamer = BatchTextStreamer(self.tokenizer, len(pending), on_text)
+                with self._generation_slots, span("generate", batch=len(pending), streamed=True):
+                    self.llm_model.generate(**inputs, max_length=max_length, temperature=0.7,
+                                            streamer=streamer)
+                record_tokens("out", [sum(token != self.tokenizer.pad_token_id for token in tokens)
+                                      for tokens in streamer.tokens])
+                for row, (i, results) in enumerate(zip(pending, retrieval_results)):
+                    response = {"answer": streamer.texts[row], "sources": results}
+                    if use_cache:
+                        self.answer_cache.put(queries[i], query_embeddings[i], response,
+                                              products[i], self.index_version)
+                    finish(i, response, False)
+            except Exception as e:
+                logger.error(f"Streaming batch generation failed: {str(e)}")
+                for i, done in enumerate(finished):
+                    if not done:
+                        emit(i, {'type': 'error', 'answer': "Error processing your request",
+                                 'sources': {'documents': [], 'metadatas': []}})
+
+    def streaming_stats(self) -> dict:
+        """Time-to-first-token percentiles over recent streamed answers"""
+        ttft = np.asarray(self.ttft_seconds, dtype=np.float64)
+        return {
+            'streams': len(ttft),
+            'ttft_p50_s': float(np.percentile(ttft, 50)) if len(ttft) else None,
+            'ttft_p95_s': float(np.percentile(ttft, 95)) if len(ttft) else None,
+        }
+
+    def trend_cube(self):
+        """The trend cube, reloaded when the file changes; ``None`` if it was never built"""
+        try:
+            mtime = os.path.getmtime(self.trend_cube_path)
+        except OSError:
+            return None
+        with self._trend_cube_lock:
+            if mtime != self._trend_cube_mtime:
+                self._trend_cube = TrendCube.load(self.trend_cube_path)
+                self._trend_cube_mtime = mtime
+                logger.info(f"Loaded trend cube with {len(self._trend_cube.df)} cells")
+            return self._trend_cube
+
+    def answer_aggregate(self, query: str, product: str = None, max_length=256,
+                         summarize: bool = True, aggregates: bool = None):
+        """Answer a count, trend or top-N question from the trend cube, or ``None``
+
+        The numbers come from the cube in milliseconds; the LLM only writes
+        them up (``summarize=False``, or a generation failure, returns the
+        plain statistics). Sources carry the statistics under ``aggregate``.
+        """
+        facts = self.aggregate_facts(query, product, aggregates)
+        if facts is None:
+            return None
+        return self.summarize_aggregate(query, facts, max_length, summarize)
+
+    def aggregate_facts(self, query: str, product: str = None, aggregates: bool = None):
+        """Trend cube statistics answering ``query``, or ``None`` if it is not an aggregate question
+
+        ``aggregates`` overrides the instance setting for this call.
+        """
+        if not (self.aggregates if aggregates is None else aggregates):
+            return None
+        cube = self.trend_cube()
+        if cube is None:
+            return None
+        with span("aggregate") as attributes:
+            request = parse_aggregate_question(query, cube, product or detect_product(query))
+            if request is None:
+                return None
+            facts = cube.facts(request)
+            attributes.update(kind=request['kind'], total=facts['total'])
+        logger.info(f"Answering {request['kind']} question from the trend cube")
+        return facts
+
+    def summarize_aggregate(self, query: str, facts: dict, max_length=256, summarize: bool = True) -> dict:
+        """Response for ``aggregate_facts``, with the LLM's write-up of the statistics"""
+        statistics = render_facts(facts)
+        answer = statistics
+        if summarize:
+            try:
+                summary = self._generate([AGGREGATE_TEMPLATE.format(facts=statistics, question=query)],
+                                         max_length)[0]
+                answer = f"{summary}\n\n{statistics}"
+            except Exception as e:
+                logger.error(f"Trend summary generation failed: {str(e)}")
+        return {"answer": answer,
+                "sources": {'documents': [], 'metadatas': [], 'aggregate': facts}}
+
+    def generate_answers(self, queries: list, retrieval_results: list, max_length=512) -> list:
+        """Run the LLM once over a padded batch of prompts built from retrieved chunks"""
+        self.wait_for("llm")
+        prompts = [self._build_prompt(query, results)
+                   for query, results in zip(queries, retrieval_results)]
+        return self._generate(prompts, max_length)
+
+    def _generate(self, prompts: list, max_length=512) -> list:
+        """Decode the LLM's answers to a padded batch of finished prompts"""
+        self.wait_for("llm")
+        inputs = self._generation_inputs(prompts)
+        BATCH_SIZE.observe(len(prompts), stage="generate")
+        record_tokens("in", inputs['attention_mask'].sum(dim=1).tolist())
+
+        with self._generation_slots, span("generate", batch=len(prompts)):
             outputs = self.llm_model.generate(
                 **inputs,
                 max_length=max_length,
                 temperature=0.7,
                 num_return_sequences=1
             )
-            
-            answer = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            return {
-                "answer": answer,
-                "sources": retrieval_results
-            }
-        except Exception as e:
-            logger.error(f"Generation failed: {str(e)}")
-            return {
-                "answer": "Error processing your request",
-                "sources": {'documents': [], 'metadatas': []}
-            }
\ No newline at end of file
+        if not self.llm_model.config.is_encoder_decoder:
+            # Decoder-only models return the prompt followed by the answer
+            outputs = outputs[:, inputs['input_ids'].shape[1]:]
+        record_tokens("out", (outputs != self.tokenizer.pad_token_id).sum(dim=1).tolist())
+        return [self.tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
+
+    def generate_response(self, query: str, max_length=512, product: str = None,
+                          use_cache: bool = True, aggregates: bool = None) -> dict:
+        """Generate answer using RAG pipeline
+
+        Paraphrases of a recently answered question (same product scope and
+        index version) are served from the semantic answer cache without
+        running the LLM; ``use_cache=False`` bypasses it for this request, as
+        ``aggregates=False`` does the trend cube.
+        """
+        return self.generate_batch([query], max_length, [product], use_cache, aggregates)[0]
+
+    def generate_batch(self, queries: list, max_length=512, products: list = None,
+                       use_cache: bool = True, aggregates: bool = None) -> list:
+        """Answer several queries with one embed, batched retrieval and one padded generate
+
+        ``aggregates=False`` sends count and trend questions through retrieval too.
+        """
+        products = products or [None] * len(queries)
+        responses = [None] * len(queries)
+        with span("request", queries=len(queries)):
+            try:
+                for i, (query, product) in enumerate(zip(queries, products)):
+                    responses[i] = self.answer_aggregate(query, product, max_length,
+                                                         aggregates=aggregates)
+                use_cache = use_cache and self.answer_cache is not None
+                if use_cache:
+                    self._refresh_index_version()
+                    query_embeddings = self.embed_queries(queries)
+                    for i, (embedding, product) in enumerate(zip(query_embeddings, products)):
+                        if responses[i] is not None:
+                            continue
+                        hit = self.answer_cache.lookup(embedding, product, self.index_version)
+                        record_cache("answer", hit is not None, hit is None)
+                        if hit is not None:
+                            responses[i], similarity = hit
+                            logger.info(f"Answer cache hit (similarity {similarity:.3f})")
+                pending = [i for i, response in enumerate(responses) if response is None]
+                if not pending:
+                    return responses
+
+                # Retrieve context
+                retrieval_results = self.retrieve_batch(
+                    [queries[i] for i in pending], products=[products[i] for i in pending])
+                answers = self.generate_answers([queries[i] for i in pending], retrieval_results, max_length)
+                for i, answer, results in zip(pending, answers, retrieval_results):
+                    responses[i] = {"answer": answer, "sources": results}
+                    if use_cache:
+                        self.answer_cache.put(queries[i], query_embeddings[i], responses[i],
+                                              products[i], self.index_version)
+                return responses
+            except Exception as e:
+                logger.error(f"Generation failed: {str(e)}")
+                return [response or {
+                    "answer": "Error processing your request",
+                    "sources": {'documents': [], 'metadatas': []}
+                } for response in responses]
@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20.0
+
+class MicroBatcher:
+    """Collect concurrent requests into batches for a single worker thread
+
+    The worker blocks until a request arrives, then keeps collecting for up
+    to ``max_wait_ms`` or until ``max_batch_size`` requests are waiting, and
+    calls ``process_batch(items)``, which must return one result per item.
+    Each caller gets its own result (or the batch's exception) through a
+    ``Future``.
+    """
+    def __init__(self, process_batch, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS, name: str = "micro-batcher"):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}
+        self.total_wait_seconds = 0.0
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item) -> Future:
+        """Queue one request; the future resolves when its batch has run"""
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop requests whose callers already gave up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.total_wait_seconds += sum(started - queued for _, _, queued in batch)
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch of {len(batch)} returned {len(results)} results")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {str(e)}", exc_info=True)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+
+    def queue_depth(self) -> int:
+        """Requests waiting for a batch slot"""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Queue depth and batch size counters"""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch_size': self.requests_batched / self.batches if self.batches else 0.0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'mean_wait_ms': (self.total_wait_seconds / self.requests_batched * 1e3
+                                 if self.requests_batched else 0.0),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1e3,
+            }
+
+    @property
+    def requests_batched(self) -> int:
+        return sum(size * count for size, count in self.batch_sizes.items())
+
+class GenerationScheduler:
+    """Micro-batch concurrent ``generate_response`` calls into ``generate_batch``
+
+    Requests that arrive within ``max_wait_ms`` of each other (up to
+    ``max_batch_size``) share one embedding call, batched retrieval and one
+    padded ``generate`` call.
+    """
+    def __init__(self, rag, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_length: int = 512):
+        self.rag = rag
+        self.max_length = max_length
+        self.batcher = MicroBatcher(self._generate, max_batch_size, max_wait_ms,
+                                    name="generation-scheduler")
+
+    def _generate(self, items: list) -> list:
+        queries = [query for query, _ in items]
+        products = [product for _, product in items]
+        logger.info(f"Generating batch of {len(items)} "
+                    f"({self.batcher.queue_depth()} still queued)")
+        return self.rag.generate_batch(queries, self.max_length, products)
+
+    def submit(self, query: str, product: str = None) -> Future:
+        return self.batcher.submit((query, product))
+
+    def generate_response(self, query: str, product: str = None, timeout: float = None) -> dict:
+        """Blocking drop-in for ``RAGSystem.generate_response``"""
+        return self.submit(query, product).result(timeout)
+
+    def stats(self) -> dict:
+        return self.batcher.stats()
+
+class StreamingScheduler:
+    """Micro-batch concurrent streamed answers into ``RAGSystem.stream_batch``
+
+    Requests that arrive within ``max_wait_ms`` of each other (up to
+    ``max_batch_size``) share one embedding call, batched retrieval and one
+    padded ``generate``, yet each caller reads its own ``stream_response``
+    events as its row decodes. A caller that stops reading does not stop the
+    batch: its row decodes alongside the others until the batch finishes.
+    """
+    def __init__(self, rag, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_length: int = 512):
+        self.rag = rag
+        self.max_length = max_length
+        self.batcher = MicroBatcher(self._generate, max_batch_size, max_wait_ms,
+                                    name="streaming-scheduler")
+
+    def _generate(self, items: list) -> list:
+        logger.info(f"Streaming batch of {len(items)} "
+                    f"({self.batcher.queue_depth()} still queued)")
+        sinks = [sink for _, _, sink, _ in items]
+        self.rag.stream_batch([query for query, _, _, _ in items],
+                              lambda i, event: sinks[i].put(event), self.max_length,
+                              products=[product for _, product, _, _ in items],
+                              started=[started for _, _, _, started in items])
+        return [None] * len(items)
+
+    def stream(self, query: str, product: str = None):
+        """Drop-in for ``RAGSystem.stream_response``: yields this query's events"""
+        sink = queue.Queue()
+        future = self.batcher.submit((query, product, sink, time.perf_counter()))
+        while True:
+            try:
+                event = sink.get(timeout=0.1)
+            except queue.Empty:
+                # Every event is queued before the batch's future resolves
+                if future.done() and sink.empty():
+                    yield {'type': 'error', 'answer': "Error processing your request",
+                           'sources': {'documents': [], 'metadatas': []}}
+                    return
+                continue
+            yield event
+            if event['type'] in ('done', 'error'):
+                return
+
+    def stats(self) -> dict:
+        return self.batcher.stats()
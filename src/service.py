@@ -0,0 +1,182 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+class ServiceOverloaded(RuntimeError):
+    """Raised instead of queueing when a stage already has too many waiting requests"""
+
+class Stage:
+    """One pipeline stage: a thread pool plus an admission limit
+
+    At most ``workers`` calls run at once; up to ``max_pending`` more may
+    wait for a slot, and any beyond that are rejected with
+    ``ServiceOverloaded`` so latency cannot grow without bound.
+    """
+    def __init__(self, name: str, workers: int, max_pending: int):
+        if workers <= 0:
+            raise ValueError(f"{name} stage needs at least one worker")
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"rag-{name}")
+        self._semaphore = asyncio.Semaphore(workers)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` on the stage's pool once a slot is free
+
+        The slot is held until the worker thread finishes, even if the caller
+        times out or is cancelled first, so abandoned calls still count
+        against the limit instead of piling up in the pool's queue.
+        """
+        if self.waiting >= self.max_pending and self._semaphore.locked():
+            self.rejected += 1
+            raise ServiceOverloaded(f"{self.name} queue is full ({self.waiting} waiting); retry later")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release_from_thread(loop))
+        try:
+            result = await asyncio.wrap_future(future)
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            # The worker thread finishes on its own; its result is discarded
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+    def _release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    def _release_from_thread(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # The event loop has already closed; there is nobody left to admit
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'waiting': self.waiting,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class RAGService:
+    """Async API over ``RAGSystem`` with per-stage pools, limits and timeouts
+
+    Embedding, retrieval and generation each run in their own thread pool
+    (the models release the GIL) with their own concurrency limit. Requests
+    that would wait behind a full stage are rejected with
+    ``ServiceOverloaded``; requests that take longer than ``timeout`` seconds
+    raise ``TimeoutError``; cancelling the calling task abandons the request.
+    Create the service inside the event loop that will use it.
+
+    The generate stage's workers are the model's generation slots: they
+    default to the RAGSystem's ``max_concurrent_generations``, and any other
+    value is rejected, since extra workers would only wait inside the model
+    while the stage counted them as running.
+    """
+    def __init__(self, rag, embed_workers: int = 2, retrieve_workers: int = 4,
+                 generate_workers: int = None, max_pending: int = 32, timeout: float = 60.0):
+        if generate_workers is None:
+            generate_workers = rag.max_concurrent_generations
+        elif generate_workers != rag.max_concurrent_generations:
+            raise ValueError(f"generate_workers={generate_workers} does not match the model's "
+                             f"max_concurrent_generations={rag.max_concurrent_generations}")
+        self.rag = rag
+        self.timeout = timeout
+        self.stages = {
+            'embed': Stage("embed", embed_workers, max_pending),
+            'retrieve': Stage("retrieve", retrieve_workers, max_pending),
+            'generate': Stage("generate", generate_workers, max_pending),
+        }
+        self.timeouts = 0
+
+    async def _answer(self, query: str, product: str, k: int, max_length: int, use_cache: bool,
+                      aggregates: bool) -> dict:
+        # Count and trend questions are answered from the trend cube without retrieval
+        facts = await self.stages['retrieve'].run(self.rag.aggregate_facts, query, product, aggregates)
+        if facts is not None:
+            return await self.stages['generate'].run(
+                self.rag.summarize_aggregate, query, facts, max_length)
+        use_cache = use_cache and self.rag.answer_cache is not None
+        if use_cache:
+            cached, embedding = await self.stages['embed'].run(
+                self.rag.lookup_cached_answer, query, product)
+            if cached is not None:
+                return cached
+        else:
+            await self.stages['embed'].run(self.rag.embed_query, query)
+        # The embedding is cached now, so retrieval does not encode again
+        results = await self.stages['retrieve'].run(self.rag.retrieve, query, k, product)
+        answers = await self.stages['generate'].run(
+            self.rag.generate_answers, [query], [results], max_length)
+        response = {"answer": answers[0], "sources": results}
+        if use_cache:
+            self.rag.answer_cache.put(query, embedding, response, product, self.rag.index_version)
+        return response
+
+    async def _with_timeout(self, coroutine, timeout: float):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"Request timed out after {timeout}s") from None
+
+    async def answer(self, query: str, product: str = None, k: int = 5, max_length: int = 512,
+                     timeout: float = None, use_cache: bool = True, aggregates: bool = None) -> dict:
+        """Answer one question; raises ``ServiceOverloaded`` or ``TimeoutError``
+
+        ``aggregates=False`` skips the trend cube for this request.
+        """
+        return await self._with_timeout(
+            self._answer(query, product, k, max_length, use_cache, aggregates), timeout)
+
+    async def retrieve(self, query: str, product: str = None, k: int = 5, timeout: float = None) -> dict:
+        """Retrieval only, through the embed and retrieve stages"""
+        async def run():
+            await self.stages['embed'].run(self.rag.embed_query, query)
+            return await self.stages['retrieve'].run(self.rag.retrieve, query, k, product)
+        return await self._with_timeout(run(), timeout)
+
+    def stats(self) -> dict:
+        """Per-stage queue and outcome counters"""
+        return {'timeouts': self.timeouts,
+                **{name: stage.stats() for name, stage in self.stages.items()}}
+
+    def shutdown(self):
+        for stage in self.stages.values():
+            stage.shutdown()
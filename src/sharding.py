@@ -0,0 +1,204 @@
+import os
+import sys
+import glob
+import zlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.artifacts import artifact_columns, iter_artifact, read_artifact, write_artifact
+from src.chunking import DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, PASSTHROUGH_COLUMNS
+from src.embedding import (CHUNK_COLUMNS, MODEL_NAME, batch_generator,
+                           chunk_content_hash, fetch_stored_hashes, get_chunks_path,
+                           initialize_vector_db, logger, plan_incremental_update,
+                           reset_collection, run_embedding_pipeline)
+from src.utils import get_data_path
+from src.vector_index import write_index_version
+
+# Near-duplicate cluster columns are included when the chunks artifact has them
+SHARD_METADATA_COLUMNS = ['chunk_id', 'complaint_id', 'product', 'content_hash', 'text'] + PASSTHROUGH_COLUMNS
+
+def get_shard_dir() -> str:
+    """Get absolute path to the directory holding embedding shard outputs"""
+    return get_data_path("processed", "embedding_shards")
+
+def shard_of(chunk_id: str, num_shards: int) -> int:
+    """Deterministically assign a chunk to a shard, stable across runs and machines"""
+    return zlib.crc32(str(chunk_id).encode("utf-8")) % num_shards
+
+def shard_paths(shard_dir: str, shard_index: int, num_shards: int) -> tuple:
+    """Paths of one shard's embedding matrix and metadata sidecar"""
+    stem = os.path.join(shard_dir, f"shard-{shard_index:05d}-of-{num_shards:05d}")
+    return f"{stem}.npy", f"{stem}.parquet"
+
+def shard_sets(shard_dir: str) -> dict:
+    """Shard output files in ``shard_dir`` grouped by the shard count they were written for"""
+    sets = {}
+    for path in glob.glob(os.path.join(shard_dir, "shard-*-of-*.*")):
+        num_shards = int(os.path.basename(path).rsplit("-of-", 1)[1].split(".")[0])
+        sets.setdefault(num_shards, []).append(path)
+    return sets
+
+def remove_stale_shards(shard_dir: str, num_shards: int) -> int:
+    """Delete shard outputs written for any other shard count; returns files removed"""
+    stale = [path for count, paths in shard_sets(shard_dir).items() if count != num_shards
+             for path in paths]
+    for path in stale:
+        os.remove(path)
+    if stale:
+        logger.info(f"Removed {len(stale)} stale shard files from {shard_dir}")
+    return len(stale)
+
+def embed_shard(shard_index: int, num_shards: int, shard_dir: str = None,
+                torch_threads: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> int:
+    """Embed one shard of the chunks artifact and write it to its own files
+
+    Can run inside a local worker process or as an independent job on another
+    node; shards never share output files. Returns the number of chunks embedded.
+    """
+    shard_dir = shard_dir or get_shard_dir()
+    os.makedirs(shard_dir, exist_ok=True)
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    # Stream the artifact so each worker only holds its own shard in memory
+    chunks_path = get_chunks_path()
+    columns = CHUNK_COLUMNS + [col for col in PASSTHROUGH_COLUMNS if col in artifact_columns(chunks_path)]
+    parts, total = [], 0
+    for batch in iter_artifact(chunks_path, columns=columns):
+        total += len(batch)
+        mask = [shard_of(chunk_id, num_shards) == shard_index for chunk_id in batch['chunk_id']]
+        if any(mask):
+            parts.append(batch[mask])
+    shard_df = (pd.concat(parts, ignore_index=True) if parts
+                else pd.DataFrame(columns=columns))
+    logger.info(f"Shard {shard_index}/{num_shards}: {len(shard_df)} of {total} chunks")
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME)
+    texts = shard_df['text'].tolist()
+    embeddings = np.zeros((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    def write_batch(positions, batch_embeddings):
+        # Scatter back so rows line up with the metadata sidecar
+        embeddings[positions] = batch_embeddings
+
+    run_embedding_pipeline(model, texts, list(range(len(texts))), write_batch)
+
+    embeddings_path, metadata_path = shard_paths(shard_dir, shard_index, num_shards)
+    shard_df['content_hash'] = [chunk_content_hash(text, MODEL_NAME, chunk_size, chunk_overlap)
+                                for text in texts]
+    # Metadata is written last, so its presence marks a completed shard
+    np.save(embeddings_path, embeddings)
+    write_artifact(shard_df[[col for col in SHARD_METADATA_COLUMNS if col in shard_df.columns]],
+                   metadata_path)
+    logger.info(f"Shard {shard_index}/{num_shards} written to {embeddings_path}")
+    return len(texts)
+
+def run_local_shards(num_workers: int, shard_dir: str = None) -> int:
+    """Embed all shards on this machine, one worker process per shard"""
+    shard_dir = shard_dir or get_shard_dir()
+    # Split the cores between workers so torch threads do not oversubscribe
+    torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    if os.path.isdir(shard_dir):
+        remove_stale_shards(shard_dir, num_workers)
+    logger.info(f"Embedding {num_workers} shards with {torch_threads} threads each")
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(embed_shard, i, num_workers, shard_dir, torch_threads)
+                   for i in range(num_workers)]
+        return sum(future.result() for future in futures)
+
+def merge_shards(shard_dir: str = None, rebuild: bool = False, batch_size: int = 4096,
+                 num_shards: int = None, collection=None) -> int:
+    """Load every shard output into the vector store collection
+
+    Stored chunks with an unchanged content hash are skipped and stored chunks
+    missing from all shards are deleted, as in ``generate_embeddings``. If
+    ``shard_dir`` holds shards written for several shard counts, ``num_shards``
+    must say which set to merge; the other sets are deleted after the merge.
+    """
+    shard_dir = shard_dir or get_shard_dir()
+    sets = shard_sets(shard_dir)
+    if not sets:
+        raise FileNotFoundError(f"No embedding shards found in {shard_dir}")
+    if num_shards is None:
+        if len(sets) > 1:
+            raise ValueError(f"Shards for {sorted(sets)} shard counts found in {shard_dir}; "
+                             f"pass num_shards to choose one")
+        num_shards = next(iter(sets))
+    expected = [path for i in range(num_shards) for path in shard_paths(shard_dir, i, num_shards)]
+    missing = [path for path in expected if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Missing {len(missing)} of {2 * num_shards} shard files: {missing[:3]}")
+
+    collection = collection if collection is not None else initialize_vector_db()
+    if rebuild:
+        collection = reset_collection(collection)
+        stored = {}
+    else:
+        stored = fetch_stored_hashes(collection)
+
+    shards = []
+    for i in range(num_shards):
+        embeddings_path, metadata_path = shard_paths(shard_dir, i, num_shards)
+        shards.append((np.load(embeddings_path, mmap_mode='r'), read_artifact(metadata_path)))
+    all_ids = [chunk_id for _, metadata in shards for chunk_id in metadata['chunk_id']]
+    all_hashes = [h for _, metadata in shards for h in metadata['content_hash']]
+    _, to_delete = plan_incremental_update(all_ids, all_hashes, stored)
+
+    written = 0
+    for embeddings, metadata in shards:
+        to_write, _ = plan_incremental_update(
+            metadata['chunk_id'].tolist(), metadata['content_hash'].tolist(), stored)
+        texts = metadata['text'].tolist()
+        records = metadata.drop(columns=['text']).to_dict('records')
+        for positions in batch_generator(to_write, batch_size):
+            collection.upsert(
+                embeddings=np.asarray(embeddings[positions]).tolist(),
+                documents=[texts[p] for p in positions],
+                metadatas=[records[p] for p in positions],
+                ids=[records[p]['chunk_id'] for p in positions]
+            )
+        written += len(to_write)
+    for batch_ids in batch_generator(to_delete, batch_size):
+        collection.delete(ids=batch_ids)
+
+    write_index_version("chroma")
+    logger.info(f"Merged {num_shards} shards: {written} upserted, {len(to_delete)} deleted")
+    remove_stale_shards(shard_dir, num_shards)
+    return written
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded embedding of the chunks artifact")
+    parser.add_argument("--shard-dir", default=None, help="Directory for shard outputs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    local = subparsers.add_parser("local", help="Embed all shards with local worker processes")
+    local.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    shard = subparsers.add_parser("shard", help="Embed a single shard (e.g. one per node)")
+    shard.add_argument("--index", type=int, required=True)
+    shard.add_argument("--count", type=int, required=True)
+    shard.add_argument("--threads", type=int, default=None, help="Torch threads for this job")
+
+    merge = subparsers.add_parser("merge", help="Load all shard outputs into the vector store")
+    merge.add_argument("--rebuild", action="store_true",
+                       help="Drop the collection before loading the shards")
+    merge.add_argument("--count", type=int, default=None,
+                       help="Shard count to merge when the shard directory holds several sets")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "local":
+            run_local_shards(args.workers, args.shard_dir)
+            merge_shards(args.shard_dir, num_shards=args.workers)
+        elif args.command == "shard":
+            embed_shard(args.index, args.count, args.shard_dir, args.threads)
+        else:
+            merge_shards(args.shard_dir, rebuild=args.rebuild, num_shards=args.count)
+    except Exception as e:
+        logger.error(f"Sharded embedding failed: {str(e)}", exc_info=True)
+        sys.exit(1)
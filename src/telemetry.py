@@ -0,0 +1,264 @@
+import atexit
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.utils import configure_logging
+
+logger = configure_logging()
+
+# Stage latencies from sub-millisecond cache hits to multi-minute batch jobs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 384, 512, 1024, 2048)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536)
+# Set to a path to append every finished span to a JSONL trace file
+TRACE_ENV = "RAG_TRACE_FILE"
+METRICS_PORT = 9100
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter per label combination"""
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    """Bucketed distribution per label combination
+
+    Observations only bump one bucket count, a sum and a count, so recording
+    is cheap and memory does not grow with traffic.
+    """
+    def __init__(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS,
+                 labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return series[2] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, cumulative in zip((*self.buckets, "+Inf"), itertools.accumulate(counts)):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text format"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS,
+                  labelnames: tuple = ()) -> Histogram:
+        return self._get(Histogram, name, documentation, buckets, labelnames)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage", labelnames=("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "rag_stage_errors_total", "Stages that raised", labelnames=("stage",))
+TOKENS = REGISTRY.counter(
+    "rag_tokens_total", "Prompt tokens in and generated tokens out", labelnames=("direction",))
+REQUEST_TOKENS = REGISTRY.histogram(
+    "rag_request_tokens", "Tokens per prompt (in) or answer (out)", TOKEN_BUCKETS, ("direction",))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result", labelnames=("cache", "result"))
+BATCH_SIZE = REGISTRY.histogram(
+    "rag_batch_size", "Items per batch handed to a stage", BATCH_BUCKETS, ("stage",))
+
+class Tracer:
+    """Appends finished spans to a JSONL file
+
+    Each line holds the span name, trace and parent ids, wall-clock start,
+    duration and attributes. Writes are line-buffered under a lock, so
+    concurrent requests interleave whole lines.
+    """
+    def __init__(self, path: str = None):
+        self.path = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        if path:
+            self.open(path)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def open(self, path: str):
+        self.close()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+        self.path = path
+        logger.info(f"Writing traces to {path}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+tracer = Tracer(os.environ.get(TRACE_ENV))
+atexit.register(tracer.close)
+
+# (trace id, span id) of the innermost open span in this thread or task
+_current_span = ContextVar("rag_current_span", default=None)
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time a stage into ``rag_stage_seconds`` and, if tracing, the trace file
+
+    Yields the attribute dict, so the block can add details it learns while
+    running (token counts, cache hits). Spans opened inside the block are
+    recorded as its children.
+    """
+    parent = _current_span.get()
+    token = None
+    if tracer.enabled:
+        span_id = tracer.next_id()
+        trace_id = parent[0] if parent else span_id
+        token = _current_span.set((trace_id, span_id))
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = e
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        if token is not None:
+            _current_span.reset(token)
+            tracer.write({
+                'name': stage,
+                'trace_id': trace_id,
+                'span_id': span_id,
+                'parent_id': parent[1] if parent else None,
+                'start': started_at,
+                'duration_ms': duration * 1e3,
+                'error': repr(error) if error is not None else None,
+                **attributes,
+            })
+
+def record_cache(cache: str, hits: int, misses: int):
+    if hits:
+        CACHE_LOOKUPS.inc(int(hits), cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(int(misses), cache=cache, result="miss")
+
+def record_tokens(direction: str, counts):
+    for count in counts:
+        TOKENS.inc(count, direction=direction)
+        REQUEST_TOKENS.observe(count, direction=direction)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port: int = METRICS_PORT, host: str = "0.0.0.0",
+                  registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` in the Prometheus text format from a daemon thread"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
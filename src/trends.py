@@ -0,0 +1,318 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from src.utils import configure_logging, get_data_path
+from src.artifacts import artifact_path, write_artifact
+
+logger = configure_logging()
+
+CUBE_DIMENSIONS = ['product', 'issue', 'month', 'state']
+CUBE_MEASURES = ['complaints', 'with_narrative']
+# Raw CFPB columns the cube is built from; any that are missing count as UNKNOWN
+RAW_CUBE_COLUMNS = {'Date received': 'month', 'Issue': 'issue', 'State': 'state'}
+UNKNOWN = "Unknown"
+# Partial aggregates held before they are merged into one
+COMPACT_ROWS = 1_000_000
+
+def get_cube_path() -> str:
+    """Get absolute path to the materialized trend cube"""
+    return artifact_path(get_data_path("processed"), "trend_cube")
+
+def aggregate(df: pd.DataFrame) -> pd.DataFrame:
+    """Complaint counts by product, issue, month and state of filtered raw records
+
+    Expects products already mapped by ``filter_products``. Records with and
+    without a narrative are all counted; ``with_narrative`` counts the ones
+    that reach the vector store.
+    """
+    dims = pd.DataFrame({'product': df['Product'].astype(str).to_numpy()})
+    if 'Date received' in df.columns:
+        dates = pd.to_datetime(df['Date received'], errors='coerce')
+        dims['month'] = dates.dt.strftime('%Y-%m').fillna(UNKNOWN).to_numpy()
+    else:
+        dims['month'] = UNKNOWN
+    for raw, name in RAW_CUBE_COLUMNS.items():
+        if name == 'month':
+            continue
+        dims[name] = df[raw].fillna(UNKNOWN).astype(str).to_numpy() if raw in df.columns else UNKNOWN
+    narratives = df.get('Consumer complaint narrative')
+    dims['complaints'] = 1
+    dims['with_narrative'] = (narratives.notna() & (narratives.astype(str).str.strip() != "")).to_numpy() \
+        if narratives is not None else False
+    dims['with_narrative'] = dims['with_narrative'].astype(np.int64)
+    return dims.groupby(CUBE_DIMENSIONS, as_index=False, observed=True)[CUBE_MEASURES].sum()
+
+def _combine(parts: list) -> pd.DataFrame:
+    if not parts:
+        return pd.DataFrame({**{d: pd.Series(dtype=str) for d in CUBE_DIMENSIONS},
+                             **{m: pd.Series(dtype=np.int64) for m in CUBE_MEASURES}})
+    combined = pd.concat(parts, ignore_index=True)
+    combined[CUBE_DIMENSIONS] = combined[CUBE_DIMENSIONS].astype(str)
+    return combined.groupby(CUBE_DIMENSIONS, as_index=False)[CUBE_MEASURES].sum()
+
+class CubeBuilder:
+    """Accumulates cube counts over streamed chunks of raw records
+
+    Partial aggregates are merged whenever they exceed ``compact_rows``, so
+    memory is bounded by the number of distinct cells, not records.
+    """
+    def __init__(self, compact_rows: int = COMPACT_ROWS):
+        self.compact_rows = compact_rows
+        self.records = 0
+        self._parts = []
+        self._rows = 0
+
+    def add(self, df: pd.DataFrame):
+        part = aggregate(df)
+        self.records += len(df)
+        self._parts.append(part)
+        self._rows += len(part)
+        if self._rows > self.compact_rows:
+            self._parts = [_combine(self._parts)]
+            self._rows = len(self._parts[0])
+
+    def result(self) -> pd.DataFrame:
+        return _combine(self._parts)
+
+def merge_cube(existing: pd.DataFrame, update: pd.DataFrame) -> pd.DataFrame:
+    """Replace the months present in ``update`` and keep every other month
+
+    Re-processing a month therefore never double counts it, and appending a
+    new month's dump leaves history untouched.
+    """
+    if existing is None or existing.empty:
+        return update
+    months = set(update['month'].astype(str))
+    kept = existing[~existing['month'].astype(str).isin(months)]
+    return _combine([kept, update])
+
+def write_cube(cube: pd.DataFrame, path: str = None):
+    """Store the cube as Parquet with dictionary-encoded dimensions, sorted by month"""
+    path = path or get_cube_path()
+    cube = cube.sort_values(['month', 'product', 'issue', 'state'], kind='stable').reset_index(drop=True)
+    cube = cube.astype({**{d: 'category' for d in CUBE_DIMENSIONS}, **{m: np.int64 for m in CUBE_MEASURES}})
+    tmp_path = path + ".tmp.parquet"
+    write_artifact(cube, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"Trend cube with {len(cube)} cells ({int(cube['complaints'].sum())} complaints) "
+                f"written to {path}")
+
+def update_cube(update: pd.DataFrame, path: str = None) -> pd.DataFrame:
+    """Merge freshly aggregated months into the stored cube"""
+    path = path or get_cube_path()
+    existing = TrendCube.load(path).df if os.path.exists(path) else None
+    cube = merge_cube(existing, update)
+    write_cube(cube, path)
+    return cube
+
+MONTHS = {name: i for i, name in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august",
+     "september", "october", "november", "december"], 1)}
+STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'puerto rico': 'PR', 'rhode island': 'RI', 'south carolina': 'SC',
+    'south dakota': 'SD', 'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT',
+    'virginia': 'VA', 'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+}
+
+# Longest names first, so "west virginia" is not read as "virginia"
+_STATE_NAME_RE = re.compile(r"\b(" + "|".join(sorted(STATES, key=len, reverse=True)) + r")\b")
+# A question is only sent to the cube when it asks for a number (count or
+# trend phrase) over an explicit time range or breakdown; words such as
+# "increasing" or "top" alone are common in qualitative questions
+_QUALITATIVE_RE = re.compile(r"^\s*(why|how come|how do|how can|how should|explain|what should)\b")
+_COUNT_RE = re.compile(r"\b(how many|number of|count of|total number|volume of)\b")
+_TREND_RE = re.compile(r"\b(trends?|trending|over time|month over month|month-over-month)\b")
+_CHANGE_RE = re.compile(r"\b(increas\w*|decreas\w*|ris(?:e|es|ing)|grow\w*|fall\w*|spik\w*|changed?)\b")
+_TOP_RE = re.compile(r"\b(?:top(?:\s+\d+)?|most common|most frequent|biggest|leading)\s+(?:\w+\s+)?"
+                     r"(issues?|states?|products?|complaint types?|categories)\b")
+_WHICH_MOST_RE = re.compile(r"\bwhich\s+(issues?|states?|products?)\s+(?:\w+\s+){0,2}(?:the\s+)?most\b")
+_BREAKDOWN_RE = re.compile(r"\b(?:by|per|for each|in each|across)\s+(month|state|issue|product)s?\b")
+_TIME_RE = re.compile(r"\b(20\d\d|since|this year|each month|per month|by month|monthly|over time|"
+                      r"(?:last|past)\s+(?:\d+\s+)?(?:months?|year))\b")
+_YEAR_RE = re.compile(r"\b(20\d\d)\b")
+_MONTH_YEAR_RE = re.compile(r"\b(" + "|".join(MONTHS) + r")\s+(20\d\d)\b")
+_LAST_MONTHS_RE = re.compile(r"\b(?:last|past)\s+(\d+)\s+months?\b")
+_LAST_YEAR_RE = re.compile(r"\b(?:last|past)\s+(?:year|12 months)\b")
+_STATE_CODE_RE = re.compile(r"\b(?:in|from)\s+([A-Z]{2})\b")
+_WORD_RE = re.compile(r"[a-z]+")
+_ISSUE_STOPWORDS = {"with", "your", "from", "that", "have", "this", "their", "about", "problem",
+                    "other", "issue", "issues", "company", "complaints"}
+
+def _month_offset(month: str, months: int) -> str:
+    period = pd.Period(month, freq='M') + months
+    return period.strftime('%Y-%m')
+
+def _match_issue(text: str, issues) -> str:
+    """The cube issue named in a question, by exact name or most of its content words"""
+    words = set(_WORD_RE.findall(text))
+    best, best_score = None, 0.0
+    for issue in issues:
+        if issue == UNKNOWN:
+            continue
+        if issue.lower() in text:
+            return issue
+        content = {w for w in _WORD_RE.findall(issue.lower()) if len(w) > 3 and w not in _ISSUE_STOPWORDS}
+        if len(content) < 1:
+            continue
+        matched = len(content & words)
+        score = matched / len(content)
+        if matched >= min(2, len(content)) and score >= 0.75 and score > best_score:
+            best, best_score = issue, score
+    return best
+
+def parse_aggregate_question(question: str, cube: "TrendCube", product: str = None) -> dict:
+    """Recognize a count, trend or top-N question and its filters, or return ``None``
+
+    Top-N questions must name what to rank ("top issues"); trend questions
+    need a trend phrase, or a change word ("increasing") together with a
+    count phrase or time range; count questions need a count phrase together
+    with a time range, a breakdown or a state. "Why"/"how do" questions are
+    never aggregate. ``product`` comes from the caller's product detection.
+    States are matched by name or by a two-letter code after "in"/"from";
+    dates by year, month and year, or "last N months" relative to the cube's
+    latest month.
+    """
+    text = question.lower()
+    if _QUALITATIVE_RE.search(text):
+        return None
+    state_name = _STATE_NAME_RE.search(text)
+    state = STATES[state_name.group(1)] if state_name else None
+    if state is None:
+        match = _STATE_CODE_RE.search(question)
+        if match and match.group(1) in STATES.values():
+            state = match.group(1)
+
+    counted = _COUNT_RE.search(text) is not None
+    timed = _TIME_RE.search(text) is not None
+    if _TOP_RE.search(text) or _WHICH_MOST_RE.search(text):
+        kind = "top"
+    elif _TREND_RE.search(text) or (_CHANGE_RE.search(text) and (counted or timed)):
+        kind = "trend"
+    elif counted and (timed or _BREAKDOWN_RE.search(text) or state):
+        kind = "count"
+    else:
+        return None
+
+    start = end = None
+    month_year = _MONTH_YEAR_RE.search(text)
+    last_months = _LAST_MONTHS_RE.search(text)
+    years = sorted(int(year) for year in _YEAR_RE.findall(text))
+    if month_year:
+        start = end = f"{month_year.group(2)}-{MONTHS[month_year.group(1)]:02d}"
+    elif last_months or _LAST_YEAR_RE.search(text):
+        n = int(last_months.group(1)) if last_months else 12
+        end = cube.latest_month
+        start = _month_offset(end, -(n - 1)) if end else None
+    elif years:
+        start, end = f"{years[0]}-01", f"{years[-1]}-12"
+
+    return {
+        'kind': kind,
+        'product': product,
+        'issue': _match_issue(text, cube.issues),
+        'state': state,
+        'start': start,
+        'end': end,
+    }
+
+class TrendCube:
+    """Read-side view of the trend cube
+
+    The cube has one row per product, issue, month and state cell, so
+    filters and group-bys touch thousands of rows rather than millions of
+    complaints.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        months = df['month'].astype(str)
+        known = months[months != UNKNOWN]
+        self.latest_month = known.max() if len(known) else None
+        self.issues = sorted(df['issue'].astype(str).unique())
+
+    @classmethod
+    def load(cls, path: str = None) -> "TrendCube":
+        path = path or get_cube_path()
+        return cls(pd.read_parquet(path))
+
+    def select(self, product: str = None, issue: str = None, state: str = None,
+               start: str = None, end: str = None) -> pd.DataFrame:
+        """Cells matching every given filter; ``start``/``end`` are inclusive ``YYYY-MM``"""
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, value in (('product', product), ('issue', issue), ('state', state)):
+            if value is not None:
+                mask &= (self.df[column] == value).to_numpy()
+        if start or end:
+            months = self.df['month'].astype(str)
+            known = (months != UNKNOWN).to_numpy()
+            if start:
+                mask &= known & (months >= start).to_numpy()
+            if end:
+                mask &= known & (months <= end).to_numpy()
+        return self.df[mask]
+
+    def facts(self, request: dict, top_n: int = 5, months: int = 12) -> dict:
+        """Totals, the monthly series and the leading issues, states and products"""
+        cells = self.select(request.get('product'), request.get('issue'), request.get('state'),
+                            request.get('start'), request.get('end'))
+
+        def top(column):
+            counts = cells.groupby(column, observed=True)['complaints'].sum()
+            counts = counts[counts.index.astype(str) != UNKNOWN].nlargest(top_n)
+            return [(str(name), int(count)) for name, count in counts.items()]
+
+        monthly = cells.groupby('month', observed=True)['complaints'].sum()
+        monthly = monthly[monthly.index.astype(str) != UNKNOWN].sort_index()
+        series = [(str(month), int(count)) for month, count in monthly.items()]
+        facts = {
+            **request,
+            'total': int(cells['complaints'].sum()),
+            'with_narrative': int(cells['with_narrative'].sum()),
+            'monthly': series[-months:],
+            'top_issues': top('issue') if not request.get('issue') else [],
+            'top_states': top('state') if not request.get('state') else [],
+            'top_products': top('product') if not request.get('product') else [],
+        }
+        if len(series) >= 2 and series[-2][1]:
+            facts['last_month_change'] = series[-1][1] / series[-2][1] - 1
+        return facts
+
+def render_facts(facts: dict) -> str:
+    """Plain-text statistics block for the summary prompt and the no-LLM answer"""
+    filters = [f"{name} {facts[name]}" for name in ('product', 'issue', 'state') if facts.get(name)]
+    if facts.get('start') or facts.get('end'):
+        filters.append(f"months {facts.get('start') or '...'} to {facts.get('end') or '...'}")
+    lines = [f"Complaints{' for ' + ', '.join(filters) if filters else ''}: {facts['total']:,}"]
+    if facts['monthly']:
+        lines.append("Monthly: " + ", ".join(f"{month} {count:,}" for month, count in facts['monthly']))
+    if 'last_month_change' in facts:
+        lines.append(f"Latest month vs previous: {facts['last_month_change']:+.0%}")
+    for key, label in (('top_issues', "Top issues"), ('top_states', "Top states"),
+                       ('top_products', "By product")):
+        if facts.get(key):
+            lines.append(f"{label}: " + ", ".join(f"{name} ({count:,})" for name, count in facts[key]))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+    from src.data_processing import filter_products, iter_raw_chunks, raw_columns
+
+    parser = argparse.ArgumentParser(description="Add a raw CFPB extract to the trend cube")
+    parser.add_argument("input", help="Raw CFPB CSV, e.g. the latest month's complaints")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
+    builder = CubeBuilder()
+    for chunk in iter_raw_chunks(args.input, chunksize=args.chunksize, usecols=raw_columns(args.input)):
+        builder.add(filter_products(chunk))
+    cube = update_cube(builder.result())
+    logger.info(f"Added {builder.records} records; cube now spans "
+                f"{cube['month'].astype(str).min()} to {cube['month'].astype(str).max()}")
@@ -22,6 +22,9 @@ def configure_logging(log_file: str = "complaint_analysis.log") -> logging.Logge
     
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
+    # Every module calls this; attach the handlers only once
+    if logger.handlers:
+        return logger
     
     # File handler
     fh = logging.FileHandler(log_path)
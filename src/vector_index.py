@@ -0,0 +1,275 @@
+import os
+import json
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from src.utils import configure_logging, get_project_root
+
+logger = configure_logging()
+
+# Shared by the embedding job and the RAG system for every backend
+COLLECTION_NAME = "creditrust_complaints"
+
+VECTOR_DTYPES = ("float16", "int8")
+# Rows sorted by this metadata column are stored as contiguous partitions
+PARTITION_COLUMN = "product"
+# Rows scored per matrix product; bounds the float32 working copy
+SEARCH_BLOCK_ROWS = 262_144
+
+def get_index_dir(name: str = COLLECTION_NAME) -> str:
+    """Get absolute path to a flat vector index directory"""
+    return os.path.join(get_project_root(), "vectorstore", "flat", name)
+
+def get_version_path() -> str:
+    """Get absolute path to the stamp that changes whenever the index is rewritten"""
+    return os.path.join(get_project_root(), "vectorstore", "index_version.json")
+
+def write_index_version(backend: str) -> str:
+    """Stamp a new index version so readers can invalidate cached results"""
+    path = get_version_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    version = uuid.uuid4().hex
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'version': version, 'backend': backend, 'updated_at': time.time()}, f)
+    os.replace(tmp_path, path)
+    logger.info(f"Index version {version} written for {backend} backend")
+    return version
+
+def read_index_version():
+    """Current index version, or ``None`` if no index has been stamped yet"""
+    try:
+        with open(get_version_path()) as f:
+            return json.load(f).get('version')
+    except (FileNotFoundError, ValueError):
+        return None
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize embeddings so inner products are cosine similarities"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+def contiguous_partitions(values) -> dict:
+    """``{value: [start, end]}`` if equal values are contiguous, else ``None``"""
+    values = np.asarray(values, dtype=object)
+    if len(values) == 0:
+        return {}
+    starts = np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1])
+    ends = np.append(starts[1:], len(values))
+    partitions = {}
+    for start, end in zip(starts, ends):
+        key = str(values[start])
+        if key in partitions:
+            return None
+        partitions[key] = [int(start), int(end)]
+    return partitions
+
+def _quantize_int8(embeddings: np.ndarray) -> tuple:
+    """Symmetric per-row int8 quantization of normalized embeddings"""
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    quantized = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return quantized, scales
+
+class FlatVectorIndex:
+    """Exact cosine top-k over a memory-mapped float16 or int8 embedding matrix
+
+    Vectors live in ``vectors.npy`` and ids, metadata and documents in an
+    uncompressed Arrow IPC sidecar; both are memory-mapped on load, so opening
+    an index deserializes nothing. ``query`` mirrors ``chromadb.Collection.query``
+    so callers can switch backends without changing how results are read.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.dtype = self.meta['dtype']
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        self.scales = (np.load(os.path.join(directory, "scales.npy"), mmap_mode='r')
+                       if self.dtype == "int8" else None)
+        self.sidecar = pa.ipc.open_file(pa.memory_map(os.path.join(directory, "sidecar.arrow"))).read_all()
+        self.ids = self.sidecar.column('chunk_id')
+        self.metadata_columns = [col for col in self.meta['metadata_columns']
+                                 if col in self.sidecar.column_names]
+        self._column_cache = {}
+
+    @classmethod
+    def load(cls, directory: str = None) -> "FlatVectorIndex":
+        """Open an existing index"""
+        directory = directory or get_index_dir()
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            raise FileNotFoundError(f"Flat vector index not found at {directory}")
+        index = cls(directory)
+        logger.info(f"Opened flat index with {index.count()} {index.dtype} vectors from {directory}")
+        return index
+
+    def count(self) -> int:
+        return self.vectors.shape[0]
+
+    def column(self, name: str) -> np.ndarray:
+        """Sidecar column as a NumPy array, cached for repeated filtering"""
+        if name not in self._column_cache:
+            self._column_cache[name] = self.sidecar.column(name).to_numpy(zero_copy_only=False)
+        return self._column_cache[name]
+
+    def partitions(self, column: str = PARTITION_COLUMN) -> dict:
+        """Contiguous ``{value: (start, end)}`` row ranges of a partitioned column"""
+        return {value: tuple(bounds) for value, bounds
+                in self.meta.get('partitions', {}).get(column, {}).items()}
+
+    def rows_matching(self, where: dict):
+        """Rows whose metadata equals every ``{column: value}`` in ``where``
+
+        Partitioned columns resolve to a contiguous ``range`` without scanning;
+        any remaining conditions are evaluated over that range only.
+        """
+        rows = range(self.count())
+        remaining = {}
+        for key, value in where.items():
+            partitions = self.partitions(key)
+            if partitions:
+                start, end = partitions.get(str(value), (0, 0))
+                start = max(rows.start, start)
+                rows = range(start, max(start, min(rows.stop, end)))
+            else:
+                remaining[key] = value
+        if not remaining:
+            return rows
+        mask = np.ones(len(rows), dtype=bool)
+        for key, value in remaining.items():
+            mask &= self.column(key)[rows.start:rows.stop] == value
+        return np.flatnonzero(mask) + rows.start
+
+    def _score_block(self, block_rows, queries: np.ndarray):
+        if isinstance(block_rows, range):
+            block_rows = slice(block_rows.start, block_rows.stop)
+        block = np.asarray(self.vectors[block_rows], dtype=np.float32)
+        scores = queries @ block.T
+        if self.scales is not None:
+            scores *= np.asarray(self.scales[block_rows])[None, :]
+        return scores
+
+    def search(self, query_embeddings: np.ndarray, k: int = 5, rows=None) -> tuple:
+        """Top-k cosine similarities for a batch of queries
+
+        ``rows`` restricts the search to a ``range`` or array of row numbers.
+        Returns ``(scores, row_numbers)`` arrays of shape ``(n_queries, k)``,
+        best first.
+        """
+        queries = normalize_rows(query_embeddings)
+        rows = range(self.count()) if rows is None else rows
+        n_candidates = len(rows)
+        k = min(k, n_candidates)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        if k == 0:
+            return best_scores, best_rows
+
+        for start in range(0, n_candidates, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, n_candidates)
+            block_rows = rows[start:end]
+            scores = self._score_block(block_rows, queries)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            candidates = np.concatenate(
+                [best_rows, np.broadcast_to(np.asarray(block_rows), (len(queries), end - start))],
+                axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                candidates = np.take_along_axis(candidates, top, axis=1)
+            best_scores, best_rows = scores, candidates
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        return (np.take_along_axis(best_scores, order, axis=1),
+                np.take_along_axis(best_rows, order, axis=1))
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include: tuple = ("documents", "metadatas", "distances")) -> dict:
+        """Chroma-compatible query returning cosine distances"""
+        rows = self.rows_matching(where) if where else None
+        scores, row_numbers = self.search(np.asarray(query_embeddings), n_results, rows)
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for query_scores, query_rows in zip(scores, row_numbers):
+            taken = self.sidecar.take(pa.array(query_rows)).to_pydict()
+            results['ids'].append(taken['chunk_id'])
+            results['distances'].append((1.0 - query_scores).tolist())
+            if "documents" in include:
+                results['documents'].append(taken.get('text', [None] * len(query_rows)))
+            if "metadatas" in include:
+                results['metadatas'].append([
+                    {col: taken[col][i] for col in self.metadata_columns}
+                    for i in range(len(query_rows))
+                ])
+        return {key: value for key, value in results.items()
+                if key == 'ids' or key in include}
+
+class FlatIndexBuilder:
+    """Write a new flat index next to the live one and swap it in atomically"""
+    def __init__(self, directory: str, count: int, dim: int, dtype: str = "float16"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}; expected one of {VECTOR_DTYPES}")
+        self.directory = directory
+        self.dtype = dtype
+        self._build_dir = directory + ".building"
+        shutil.rmtree(self._build_dir, ignore_errors=True)
+        os.makedirs(self._build_dir)
+        self.vectors = np.lib.format.open_memmap(
+            os.path.join(self._build_dir, "vectors.npy"), mode='w+', dtype=dtype, shape=(count, dim))
+        self.scales = np.ones(count, dtype=np.float32) if dtype == "int8" else None
+
+    def add(self, positions, embeddings: np.ndarray):
+        """Normalize, quantize and store embeddings at the given row positions"""
+        embeddings = normalize_rows(embeddings)
+        if self.dtype == "int8":
+            self.vectors[positions], self.scales[positions] = _quantize_int8(embeddings)
+        else:
+            self.vectors[positions] = embeddings.astype(np.float16)
+
+    def copy_from(self, positions, index: FlatVectorIndex, source_rows):
+        """Reuse already-embedded rows of an existing index"""
+        if index.dtype == self.dtype:
+            self.vectors[positions] = index.vectors[source_rows]
+            if self.scales is not None:
+                self.scales[positions] = index.scales[source_rows]
+        else:
+            vectors = np.asarray(index.vectors[source_rows], dtype=np.float32)
+            if index.scales is not None:
+                vectors *= np.asarray(index.scales[source_rows])[:, None]
+            self.add(positions, vectors)
+
+    def finalize(self, records: pd.DataFrame, model_name: str) -> FlatVectorIndex:
+        """Write the sidecar and metadata, then replace the live index"""
+        self.vectors.flush()
+        if self.scales is not None:
+            np.save(os.path.join(self._build_dir, "scales.npy"), self.scales)
+        table = pa.Table.from_pandas(records.reset_index(drop=True), preserve_index=False)
+        with pa.OSFile(os.path.join(self._build_dir, "sidecar.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        partitions = (contiguous_partitions(records[PARTITION_COLUMN])
+                      if PARTITION_COLUMN in records.columns else None)
+        if partitions is None and PARTITION_COLUMN in records.columns:
+            logger.warning(f"Records not sorted by {PARTITION_COLUMN}; index is not partitioned")
+        with open(os.path.join(self._build_dir, "meta.json"), "w") as f:
+            json.dump({
+                'dtype': self.dtype,
+                'count': int(self.vectors.shape[0]),
+                'dim': int(self.vectors.shape[1]),
+                'model_name': model_name,
+                'metadata_columns': [col for col in records.columns if col != 'text'],
+                'partitions': {PARTITION_COLUMN: partitions} if partitions else {},
+            }, f, indent=2)
+        del self.vectors
+
+        retired = self.directory + ".old"
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.rename(self.directory, retired)
+        os.rename(self._build_dir, self.directory)
+        shutil.rmtree(retired, ignore_errors=True)
+        logger.info(f"Wrote flat index with {len(records)} {self.dtype} vectors to {self.directory}")
+        return FlatVectorIndex.load(self.directory)
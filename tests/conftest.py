@@ -0,0 +1,200 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from src.rag_logic import RAGSystem
+from src.vector_index import FlatIndexBuilder
+
+class StubEmbedder:
+    """Sentence encoder stand-in
+
+    A text ending in a number ``i`` embeds as ``vectors[i]``, so it retrieves
+    chunk ``i`` first; any other text gets a vector seeded from its hash.
+    """
+    def __init__(self, vectors=None, dim=8):
+        self.vectors = vectors
+        self.dim = dim if vectors is None else vectors.shape[1]
+        self.calls = []
+
+    def _encode(self, text):
+        last = text.split()[-1] if text.split() else ""
+        if self.vectors is not None and last.isdigit() and int(last) < len(self.vectors):
+            return self.vectors[int(last)]
+        return np.random.default_rng(abs(hash(text)) % 2**32).normal(size=self.dim)
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        return np.stack([self._encode(text) for text in texts]).astype(np.float32)
+
+class Tensor(np.ndarray):
+    """numpy array with torch's ``sum(dim=...)``"""
+    def sum(self, dim=None, **kwargs):
+        return np.asarray(self).sum(axis=dim).view(Tensor)
+
+class WordTokenizer:
+    """Whitespace tokenizer with a growing vocabulary; id 0 pads on the right"""
+    pad_token_id = 0
+
+    def __init__(self):
+        self.vocab = {"<pad>": 0}
+        self.words = ["<pad>"]
+        self.prompts = []
+
+    def _encode(self, text):
+        ids = []
+        for word in text.split():
+            if word not in self.vocab:
+                self.vocab[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.vocab[word])
+        return ids
+
+    def __call__(self, texts, return_tensors=None, max_length=None, truncation=False, padding=False,
+                 add_special_tokens=True):
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        ids = [self._encode(text)[:max_length] for text in texts]
+        if return_tensors is None:
+            return {'input_ids': ids}
+        self.prompts.extend(texts)
+        width = max(len(row) for row in ids)
+        input_ids = np.array([row + [0] * (width - len(row)) for row in ids]).view(Tensor)
+        return {'input_ids': input_ids, 'attention_mask': (input_ids != 0).astype(np.int64).view(Tensor)}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return " ".join(self.words[i] for i in ids if i or not skip_special_tokens)
+
+class EchoModel:
+    """Decoder-only generator stand-in that answers with its prompt's last ``echo`` words
+
+    Like ``generate`` it returns the padded prompt followed by the answer
+    tokens, padded to the longest answer in the batch, and feeds a
+    ``streamer`` the prompt and then one token per row at a time.
+    """
+    class config:
+        is_encoder_decoder = False
+
+    def __init__(self, echo=3, delay=0.0):
+        self.echo = echo
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, input_ids, attention_mask, max_length=512, streamer=None, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.calls.append(input_ids.shape)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        answers = [[int(i) for i in row[mask.astype(bool)][-self.echo:]]
+                   for row, mask in zip(input_ids, attention_mask)]
+        width = max(len(answer) for answer in answers)
+        answers = np.array([answer + [0] * (width - len(answer)) for answer in answers])
+        if streamer is not None:
+            streamer.put(np.asarray(input_ids))
+            for step in answers.T:
+                streamer.put(step)
+            streamer.end()
+        return np.concatenate([np.asarray(input_ids), answers], axis=1).view(Tensor)
+
+class StubRAG(RAGSystem):
+    """RAGSystem over stub components
+
+    ``index`` is the flat index to retrieve from and ``embedder`` defaults to
+    a ``StubEmbedder`` over ``vectors``. With a ``model`` the real tokenize,
+    ``generate`` and decode path runs on a ``WordTokenizer``; without one,
+    ``generate_answers`` answers "answer to <query> from <top chunk id>"
+    after ``delay`` seconds and tracks how many calls overlap. Loading waits
+    for ``gate`` when given, and components named in ``fail`` raise.
+    """
+    def __init__(self, index=None, vectors=None, embedder=None, model=None, delay=0.0,
+                 gate=None, fail=(), **kwargs):
+        self._index = index
+        self.stub_embedder = embedder or StubEmbedder(vectors)
+        self.model = model
+        self.delay = delay
+        self.gate = gate
+        self.fail = fail
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._calls_lock = threading.Lock()
+        kwargs.setdefault('vector_backend', "flat")
+        kwargs.setdefault('answer_cache', False)
+        kwargs.setdefault('warmup', False)
+        kwargs.setdefault('trend_cube_path', "missing_trend_cube.parquet")
+        super().__init__(**kwargs)
+
+    def _wait(self, name):
+        if self.gate is not None:
+            self.gate.wait()
+        if name in self.fail:
+            raise OSError("model files missing")
+
+    def _load_embedder(self):
+        self._wait("embedder")
+        self.embedder = self.stub_embedder
+
+    def _load_index(self):
+        self._wait("index")
+        self.vector_db = self._index
+
+    def _load_llm(self):
+        self._wait("llm")
+        self._device = "cpu"
+        if self.model is not None:
+            self.tokenizer = WordTokenizer()
+            self.llm_model = self.model
+
+    def generate_answers(self, queries, retrieval_results, max_length=512):
+        if self.model is not None:
+            return super().generate_answers(queries, retrieval_results, max_length)
+        with self._calls_lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._calls_lock:
+            self.active -= 1
+        return [f"answer to {query} from {results['ids'][0][0]}"
+                for query, results in zip(queries, retrieval_results)]
+
+class MemoryCollection:
+    """The slice of the Chroma collection API that the embedding jobs use"""
+    def __init__(self):
+        self.rows = {}
+        self.upserts = 0
+
+    def get(self, include=None, limit=None, offset=0):
+        ids = sorted(self.rows)[offset:offset + limit]
+        return {'ids': ids, 'metadatas': [self.rows[i]['metadata'] for i in ids]}
+
+    def upsert(self, embeddings, documents, metadatas, ids):
+        self.upserts += len(ids)
+        for chunk_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+            self.rows[chunk_id] = {'embedding': embedding, 'document': document, 'metadata': metadata}
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            del self.rows[chunk_id]
+
+def build_flat_index(directory, vectors, products=None):
+    """Flat index whose chunk ``i`` (complaint ``i``) has embedding ``vectors[i]``"""
+    n, dim = vectors.shape
+    builder = FlatIndexBuilder(str(directory), n, dim)
+    builder.add(np.arange(n), vectors)
+    return builder.finalize(pd.DataFrame({
+        'chunk_id': [f"{i}_0" for i in range(n)],
+        'complaint_id': [str(i) for i in range(n)],
+        'product': products or ['BNPL', 'Credit Card'] * (n // 2),
+        'text': [f"narrative {i}" for i in range(n)]}), "stub")
+
+@pytest.fixture(scope="session")
+def flat_index(tmp_path_factory):
+    """``(index, vectors)`` over 40 chunks, alternately BNPL and Credit Card"""
+    vectors = np.random.default_rng(0).normal(size=(40, 16)).astype(np.float32)
+    return build_flat_index(tmp_path_factory.mktemp("stub_index") / "index", vectors), vectors
@@ -0,0 +1,24 @@
+import os
+import pandas as pd
+import pytest
+from src.artifacts import ArtifactWriter, read_artifact, write_artifact
+
+@pytest.mark.parametrize("name", ["records.parquet", "records.csv"])
+def test_failed_write_keeps_previous_artifact(tmp_path, name):
+    path = str(tmp_path / name)
+    write_artifact(pd.DataFrame({'Complaint ID': [1], 'Product': ['BNPL']}), path)
+    with pytest.raises(RuntimeError):
+        with ArtifactWriter(path) as writer:
+            writer.write(pd.DataFrame({'Complaint ID': [2, 3], 'Product': ['BNPL', 'Credit Card']}))
+            raise RuntimeError("worker died")
+    assert read_artifact(path)['Complaint ID'].tolist() == [1]
+    assert os.listdir(tmp_path) == [name]
+
+def test_first_batch_with_all_null_column(tmp_path):
+    path = str(tmp_path / "records.parquet")
+    with ArtifactWriter(path) as writer:
+        writer.write(pd.DataFrame({'Complaint ID': [1], 'Product': ['BNPL'], 'note': [None]}))
+        writer.write(pd.DataFrame({'Complaint ID': [2], 'Product': ['Credit Card'], 'note': ["refund"]}))
+    df = read_artifact(path)
+    assert df['note'].tolist() == [None, "refund"]
+    assert df['Product'].astype(str).tolist() == ['BNPL', 'Credit Card']
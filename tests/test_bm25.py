@@ -0,0 +1,67 @@
+import math
+import pandas as pd
+import pytest
+from src.artifacts import write_artifact
+from src.bm25 import BM25Index, build_bm25_index, fuse_results, tokenize
+
+TEXTS = [
+    "charged a late fee on my credit card",
+    "zelle transfer never arrived and the bank refused a chargeback",
+    "chargeback denied twice for the same chargeback",
+    "savings account interest was not paid",
+]
+
+def build(tmp_path):
+    chunks = pd.DataFrame({
+        'text': TEXTS,
+        'complaint_id': [1, 2, 3, 4],
+        'product': ['Credit Card', 'Money Transfer', 'Credit Card', 'Savings Account'],
+        'chunk_id': ['1_0', '2_0', '3_0', '4_0'],
+    })
+    path = str(tmp_path / "chunks.parquet")
+    write_artifact(chunks, path)
+    return build_bm25_index(path, str(tmp_path / "bm25"))
+
+def test_bm25_scores_match_formula(tmp_path):
+    index = build(tmp_path)
+    docs, scores = index.scores("chargeback")
+    lengths = [len(tokenize(text)) for text in TEXTS]
+    avg = sum(lengths) / len(lengths)
+    idf = math.log(1 + (4 - 2 + 0.5) / (2 + 0.5))
+    expected = {f"{i + 1}_0": idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * lengths[i] / avg))
+                for i, tf in enumerate([0, 1, 2, 0]) if tf}
+    chunk_ids = index.sidecar.column('chunk_id').take(docs).to_pylist()
+    assert dict(zip(chunk_ids, scores.tolist())) == pytest.approx(expected, rel=1e-5)
+
+def test_bm25_query_reloads_and_filters(tmp_path):
+    build(tmp_path)
+    index = BM25Index.load(str(tmp_path / "bm25"))
+    results = index.query(["Chargeback via Zelle"], n_results=5)
+    assert results['ids'][0] == ['2_0', '3_0']
+    assert results['documents'][0][0] == TEXTS[1]
+
+    filtered = index.query(["chargeback"], n_results=5, where={'product': 'Credit Card'})
+    assert filtered['ids'][0] == ['3_0']
+    assert filtered['metadatas'][0][0] == {'chunk_id': '3_0', 'complaint_id': 3, 'product': 'Credit Card'}
+    assert index.query(["unknownterm the"], n_results=5)['ids'][0] == []
+
+def test_bm25_filters_read_only_matching_postings(tmp_path):
+    index = build(tmp_path)
+    # Documents are numbered in product order, so each product is one doc-number range
+    assert index.partitions() == {'Credit Card': (0, 2), 'Money Transfer': (2, 3), 'Savings Account': (3, 4)}
+    assert index.sidecar.column('chunk_id').to_pylist() == ['1_0', '3_0', '2_0', '4_0']
+    docs, _ = index.scores("chargeback late interest", where={'product': 'Credit Card'})
+    assert docs.tolist() == [0, 1]
+    assert index.scores("chargeback", where={'product': 'Student Loan'})[0].tolist() == []
+    assert index.query(["chargeback"], 5, where={'complaint_id': 2})['ids'][0] == ['2_0']
+    assert index.query(["chargeback"], 5, where={'product': 'Credit Card', 'complaint_id': 2})['ids'][0] == []
+
+def test_fuse_results_rewards_agreement():
+    dense = {'ids': [['a', 'b']], 'documents': [['A', 'B']],
+             'metadatas': [[{}, {}]], 'distances': [[0.1, 0.2]]}
+    lexical = {'ids': [['c', 'b']], 'documents': [['C', 'B']],
+               'metadatas': [[{}, {}]], 'scores': [[3.0, 2.0]]}
+    fused = fuse_results(dense, lexical, k=2)
+    assert fused['ids'][0] == ['b', 'a']
+    assert fused['documents'][0] == ['B', 'A']
+    assert fused['distances'][0] == [0.2, 0.1]
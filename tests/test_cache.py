@@ -0,0 +1,83 @@
+import os
+import time
+import numpy as np
+from src.cache import SemanticAnswerCache, TTLCache, normalize_query
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (3, 1, 1, 2)
+
+def test_ttl_cache_expiry_and_clear():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.put("q", "embedding")
+    clock.now = 4.9
+    assert cache.get("q") == "embedding"
+    clock.now = 5.1
+    assert cache.get("q") is None
+    assert len(cache) == 0
+
+    cache.put("q", "embedding")
+    cache.clear()
+    assert cache.get("q") is None
+
+def test_normalize_query():
+    assert normalize_query("  BNPL   late\tFees ") == "bnpl late fees"
+
+def test_semantic_answer_cache_threshold_and_scope():
+    cache = SemanticAnswerCache(maxsize=4, threshold=0.95, ttl=None)
+    response = {"answer": "Late fees", "sources": {"documents": [["doc"]]}}
+    cache.put("bnpl late fees", [1.0, 0.0, 0.0], response, product="BNPL", index_version="v1")
+
+    assert cache.lookup([0.99, 0.05, 0.0], product="BNPL", index_version="v1")[0] == response
+    assert cache.lookup([0.5, 0.5, 0.5], product="BNPL", index_version="v1") is None
+    # Other product scopes and rebuilt indexes never reuse the answer
+    assert cache.lookup([1.0, 0.0, 0.0], product="Credit Card", index_version="v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], product="BNPL", index_version="v2") is None
+    assert cache.stats()['hits'] == 1
+
+def test_semantic_answer_cache_lru_ttl_and_persistence(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "answers.npz")
+    cache = SemanticAnswerCache(maxsize=2, ttl=10, threshold=0.99, path=path, clock=clock)
+    for i, vector in enumerate(np.eye(3)):
+        cache.put(f"q{i}", vector, {"answer": f"a{i}"})
+    assert len(cache) == 2
+    assert cache.lookup(np.eye(3)[0]) is None
+
+    cache.flush()
+    reloaded = SemanticAnswerCache(maxsize=2, ttl=10, threshold=0.99, path=path, clock=clock)
+    assert reloaded.lookup(np.eye(3)[2])[0] == {"answer": "a2"}
+    clock.now = 11
+    assert reloaded.lookup(np.eye(3)[2]) is None
+
+def test_semantic_answer_cache_saves_in_background(tmp_path):
+    path = str(tmp_path / "answers.npz")
+    cache = SemanticAnswerCache(ttl=None, threshold=0.99, path=path, save_interval=0.05)
+    cache.put("q0", np.eye(3)[0], {"answer": "a0"})
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.02)
+    assert len(SemanticAnswerCache(ttl=None, path=path)) == 1
+
+    slow = SemanticAnswerCache(ttl=None, threshold=0.99, path=path, save_interval=60)
+    slow.put("q1", np.eye(3)[1], {"answer": "a1"})
+    assert len(SemanticAnswerCache(ttl=None, path=path)) == 1
+    slow.close()
+    assert len(SemanticAnswerCache(ttl=None, path=path)) == 2
@@ -0,0 +1,65 @@
+import pandas as pd
+from src.artifacts import read_artifact, write_artifact
+from src.chunking import TextSplitter, chunk_artifact, create_chunks
+
+def test_split_text_word_windows():
+    text = " ".join(f"w{i}" for i in range(1000))
+    splitter = TextSplitter(chunk_size=100, chunk_overlap=10)
+    chunks = splitter.split_text_with_offsets(text)
+
+    words = [chunk.split() for chunk, _, _ in chunks]
+    assert all(len(w) <= 100 for w in words)
+    # Consecutive chunks overlap by exactly chunk_overlap words
+    for prev, nxt in zip(words, words[1:]):
+        assert prev[-10:] == nxt[:10]
+    assert words[-1][-1] == "w999"
+    # Offsets point at the exact span
+    for chunk, start, end in chunks:
+        assert text[start:end] == chunk
+
+def test_split_text_prefers_sentence_boundaries():
+    sentence = " ".join(["word"] * 9) + " end."
+    text = " ".join([sentence] * 30)
+    splitter = TextSplitter(chunk_size=25, chunk_overlap=5)
+
+    for chunk, start, end in splitter.split_text_with_offsets(text):
+        assert text[start:end] == chunk
+        assert len(chunk.split()) <= 25
+    assert all(chunk.endswith("end.") for chunk in splitter.split_text(text))
+
+def test_split_text_short_and_empty():
+    splitter = TextSplitter(chunk_size=10, chunk_overlap=2)
+    assert splitter.split_text("") == []
+    assert splitter.split_text_with_offsets("  short text ") == [("short text", 2, 12)]
+
+def test_create_chunks_records_offsets():
+    df = pd.DataFrame({
+        'Complaint ID': [1, 2],
+        'Product': ['BNPL', 'Credit Card'],
+        'clean_narrative': ["late fee " * 300, "card declined"]
+    })
+    chunk_df = create_chunks(df, chunk_size=100, chunk_overlap=10)
+
+    for _, row in chunk_df.iterrows():
+        narrative = df.loc[df['Complaint ID'] == row['complaint_id'], 'clean_narrative'].iloc[0]
+        assert narrative[row['start_index']:row['end_index']] == row['text']
+    assert chunk_df['chunk_id'].tolist()[-1] == "2_0"
+
+def test_chunk_artifact_matches_create_chunks(tmp_path):
+    df = pd.DataFrame({
+        'Complaint ID': range(40),
+        'Product': ['BNPL', 'Credit Card', 'Money Transfer', 'Personal Loan'] * 10,
+        'clean_narrative': [("refund missing. " * (i * 7)).strip() or None for i in range(40)]
+    })
+    input_path = str(tmp_path / "filtered_complaints.parquet")
+    output_path = str(tmp_path / "chunks.parquet")
+    write_artifact(df, input_path)
+
+    n_chunks = chunk_artifact(input_path, output_path, chunk_size=50, chunk_overlap=5,
+                              n_jobs=2, partition_rows=6)
+    streamed = read_artifact(output_path)
+    streamed['product'] = streamed['product'].astype(object)
+    expected = create_chunks(df, chunk_size=50, chunk_overlap=5)
+
+    assert n_chunks == len(expected)
+    pd.testing.assert_frame_equal(streamed, expected)
@@ -0,0 +1,35 @@
+from src.context import (fit_to_budget, group_by_complaint, merge_overlap, pack_context,
+                         whitespace_counter)
+
+def results(ids, texts, complaint_ids):
+    return {'ids': [ids], 'documents': [texts],
+            'metadatas': [[{'complaint_id': c, 'product': 'BNPL'} for c in complaint_ids]]}
+
+def test_merge_overlap_drops_shared_words():
+    assert merge_overlap("a b c d e", "d e f g") == "a b c d e f g"
+    assert merge_overlap("a b", "c d") == "a b c d"
+
+def test_group_by_complaint_merges_chunks_in_document_order():
+    retrieved = results(["7_1", "9_0", "7_0", "7_1"],
+                        ["late fee again", "zelle scam", "i was charged a late fee", "late fee again"],
+                        [7, 9, 7, 7])
+    groups = group_by_complaint(retrieved)
+    assert [g['complaint_id'] for g in groups] == ["7", "9"]
+    assert groups[0]['text'] == "i was charged a late fee again"
+    assert groups[0]['chunk_ids'] == ["7_0", "7_1"]
+
+def test_fit_to_budget_cuts_at_sentence_boundaries():
+    text = "First sentence here. Second one is longer than that. Third."
+    assert fit_to_budget(text, 7, whitespace_counter) == "First sentence here."
+    assert fit_to_budget(text, 9, whitespace_counter) == "First sentence here. Second one is longer than that."
+    # No sentence boundary at all: fall back to whole words
+    assert fit_to_budget("one two three four five", 3, whitespace_counter) == "one two three"
+
+def test_pack_context_respects_budget_and_shares_it():
+    long_text = " ".join(f"Sentence {i} about fees." for i in range(40))
+    retrieved = results(["1_0", "2_0", "3_0"], [long_text, "Short complaint.", long_text], [1, 2, 3])
+    context, packed = pack_context(retrieved, whitespace_counter, budget=60)
+    assert sum(whitespace_counter([context])) <= 60
+    assert [p['complaint_id'] for p in packed] == ["1", "2", "3"]
+    assert context.splitlines()[1] == "[Source 2] Short complaint."
+    assert all(p['text'].endswith(".") for p in packed)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from src.artifacts import read_artifact, write_artifact
+from src.chunking import chunk_artifact
+from src.dedup import (MAX_DUPLICATE_IDS, deduplicate, deduplicate_artifact, minhash_signatures,
+                       shingle_hashes)
+
+LETTER = ("i am disputing the following account xxxx opened on xx xx xxxx with a balance of {amount} "
+          "this account does not belong to me and i have never authorized it under the fair credit "
+          "reporting act you are required to investigate and remove inaccurate information from my "
+          "credit report within thirty days please delete this account and send me an updated copy "
+          "of my report as soon as possible {extra}")
+
+def records():
+    rng = np.random.default_rng(0)
+    words = "bank card loan fee charged refund never called told transfer zelle late interest".split()
+    letters = [LETTER.format(amount=f"{rng.integers(100, 9000)}.{rng.integers(10, 99)}",
+                             extra="thank you" if i % 2 else "regards")
+               for i in range(6)]
+    distinct = [" ".join(rng.choice(words, size=80)) for _ in range(4)]
+    texts = letters + distinct
+    return pd.DataFrame({'Complaint ID': np.arange(100, 100 + len(texts)),
+                         'Product': ['Credit Card'] * len(texts),
+                         'clean_narrative': texts,
+                         'word_count': [len(t.split()) for t in texts]})
+
+def test_shingles_ignore_redactions_and_amounts():
+    first = shingle_hashes("xxxx paid 120.50 on xx xx xxxx late fee again", size=3)
+    assert (first == shingle_hashes("xxxx paid 99.00 on xx xx xxxx late fee again", size=3)).all()
+    assert len(first) == 3
+    signatures = minhash_signatures(["a b c d e f", "a b c d e f", "g h i j k l"])
+    assert (signatures[0] == signatures[1]).all()
+    assert (signatures[0] == signatures[2]).mean() < 0.2
+
+def test_deduplicate_keeps_one_representative_per_form_letter():
+    kept, report = deduplicate(records())
+    assert kept['Complaint ID'].tolist() == [100, 106, 107, 108, 109]
+    letter = kept.iloc[0]
+    assert letter['duplicate_count'] == 6
+    assert letter['duplicate_ids'] == "101;102;103;104;105"
+    assert (kept['duplicate_count'].iloc[1:] == 1).all() and (kept['duplicate_ids'].iloc[1:] == "").all()
+    assert report['duplicates_removed'] == 5
+    assert report['chunks_after'] < report['chunks_before']
+    assert report['index_bytes_after'] < report['index_bytes_before']
+
+def test_deduplicate_artifact_streams_and_chunks_carry_metadata(tmp_path):
+    processed = tmp_path / "processed.parquet"
+    write_artifact(records(), str(processed))
+    deduplicated, chunks = tmp_path / "deduplicated.parquet", tmp_path / "chunks.parquet"
+    report = deduplicate_artifact(str(processed), str(deduplicated), n_jobs=1, partition_rows=3,
+                                  work_dir=str(tmp_path))
+    assert report['narratives_out'] == 5
+    assert read_artifact(str(deduplicated))['Complaint ID'].tolist() == [100, 106, 107, 108, 109]
+    chunk_artifact(str(deduplicated), str(chunks), chunk_size=40, chunk_overlap=5, n_jobs=1)
+    chunk_df = read_artifact(str(chunks))
+    letter_chunks = chunk_df[chunk_df['complaint_id'] == 100]
+    assert len(letter_chunks) > 1
+    assert (letter_chunks['duplicate_count'] == 6).all()
+    assert (letter_chunks['duplicate_ids'] == "101;102;103;104;105").all()
+
+def test_clusters_never_span_products(tmp_path):
+    df = records()
+    df.loc[3:5, 'Product'] = 'BNPL'
+    kept, report = deduplicate(df)
+    assert kept['Complaint ID'].tolist() == [100, 103, 106, 107, 108, 109]
+    assert kept.set_index('Complaint ID').loc[[100, 103], 'duplicate_count'].tolist() == [3, 3]
+    processed, deduplicated = tmp_path / "processed.parquet", tmp_path / "deduplicated.parquet"
+    write_artifact(df, str(processed))
+    deduplicate_artifact(str(processed), str(deduplicated), n_jobs=1, partition_rows=4,
+                         work_dir=str(tmp_path))
+    assert read_artifact(str(deduplicated))['Complaint ID'].tolist() == [100, 103, 106, 107, 108, 109]
+
+def test_duplicate_ids_are_capped():
+    df = pd.concat([records().iloc[[0]]] * 30, ignore_index=True)
+    df['Complaint ID'] = np.arange(30)
+    kept, _ = deduplicate(df)
+    assert kept['duplicate_count'].tolist() == [30]
+    assert kept['duplicate_ids'].iloc[0].split(";") == [str(i) for i in range(1, MAX_DUPLICATE_IDS + 1)]
@@ -0,0 +1,159 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from src import embedding
+from src.artifacts import write_artifact
+from src.embedding import (fetch_stored_hashes, generate_embeddings, length_sorted_batches,
+                           run_embedding_pipeline)
+from tests.conftest import MemoryCollection
+
+class LengthEmbedder:
+    """Embeds a text as ``[len(text), its number]``; texts look like "<number> <words>" """
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.batches = []
+
+    @property
+    def encoded(self):
+        return [text for batch in self.batches for text in batch]
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, convert_to_numpy=True):
+        if len(self.batches) == self.fail_after:
+            raise RuntimeError("embedding worker killed")
+        self.batches.append(list(texts))
+        return np.array([[len(text), int(text.split()[0])] for text in texts], dtype=np.float32)
+
+def numbered_texts(n):
+    return [f"{i} " + "word " * ((i * 7) % 11) for i in range(n)]
+
+def test_length_sorted_batches_group_similar_lengths():
+    texts = numbered_texts(20)
+    batches = length_sorted_batches(texts, list(range(20)), 6)
+    assert [len(batch) for batch in batches] == [6, 6, 6, 2]
+    assert sorted(p for batch in batches for p in batch) == list(range(20))
+    lengths = [len(texts[p]) for batch in batches for p in batch]
+    assert lengths == sorted(lengths)
+
+def test_pipeline_restores_original_order():
+    texts = numbered_texts(50)
+    model = LengthEmbedder()
+    stored = np.zeros((50, 2), dtype=np.float32)
+
+    def write_batch(positions, embeddings):
+        assert isinstance(embeddings, np.ndarray)
+        stored[positions] = embeddings
+
+    positions = list(range(0, 50, 2))
+    stats = run_embedding_pipeline(model, texts, positions, write_batch, batch_size=4)
+    assert stored[positions].tolist() == [[len(texts[p]), p] for p in positions]
+    assert not stored[1::2].any()
+    encoded = [len(text) for batch in model.batches for text in batch]
+    assert encoded == sorted(encoded)
+    assert stats['chunks'] == 25
+    for stage in ('encode', 'write', 'wall'):
+        assert stats[f'{stage}_seconds'] > 0 and stats[f'{stage}_chunks_per_second'] > 0
+
+def test_slow_writer_holds_back_the_encoder():
+    texts = numbered_texts(40)
+    model = LengthEmbedder()
+    release = threading.Event()
+    written = []
+
+    def write_batch(positions, embeddings):
+        release.wait()
+        written.extend(positions)
+
+    runner = threading.Thread(target=run_embedding_pipeline,
+                              args=(model, texts, list(range(40)), write_batch, 2, 2))
+    runner.start()
+    time.sleep(0.3)
+    # One batch in the writer, two queued and one waiting to be queued
+    assert len(model.batches) == 4
+    release.set()
+    runner.join(timeout=5)
+    assert len(model.batches) == 20 and sorted(written) == list(range(40))
+
+def test_writer_error_stops_the_pipeline():
+    model = LengthEmbedder()
+
+    def write_batch(positions, embeddings):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        run_embedding_pipeline(model, numbered_texts(40), list(range(40)), write_batch,
+                               batch_size=2, queue_size=1)
+    # The encoder stops soon after the failure instead of encoding everything
+    assert len(model.batches) < 20
+
+class MemoryClient:
+    """Chroma client holding one ``MemoryCollection``, for ``reset_collection``"""
+    def __init__(self):
+        self.collection = self.get_or_create_collection()
+
+    def get_or_create_collection(self, name=None, metadata=None):
+        collection = MemoryCollection()
+        collection.name, collection._client = name, self
+        self.collection = collection
+        return collection
+
+    def delete_collection(self, name):
+        self.collection = None
+
+def use_chunks(monkeypatch, tmp_path, chunks: dict):
+    """Point the embedding job at a chunks artifact of ``{chunk_id: text}``"""
+    path = str(tmp_path / "chunks.parquet")
+    write_artifact(pd.DataFrame({'text': list(chunks.values()),
+                                 'complaint_id': [int(c.split("_")[0]) for c in chunks],
+                                 'product': 'BNPL', 'chunk_id': list(chunks)}), path)
+    monkeypatch.setattr(embedding, "get_chunks_path", lambda: path)
+    monkeypatch.setattr(embedding, "write_index_version", lambda backend: None)
+
+def test_incremental_update_embeds_only_new_and_changed_chunks(tmp_path, monkeypatch):
+    chunks = {f"{i}_0": text for i, text in enumerate(numbered_texts(30))}
+    use_chunks(monkeypatch, tmp_path, chunks)
+    collection = MemoryCollection()
+    assert generate_embeddings(batch_size=4, model=LengthEmbedder(), collection=collection)
+    assert len(collection.rows) == 30
+    hashes = fetch_stored_hashes(collection)
+    assert fetch_stored_hashes(collection, page_size=7) == hashes and None not in hashes.values()
+
+    del chunks["5_0"]
+    chunks["7_0"] = "7 rewritten narrative"
+    chunks["30_0"] = "30 new narrative"
+    use_chunks(monkeypatch, tmp_path, chunks)
+    model = LengthEmbedder()
+    assert generate_embeddings(batch_size=4, model=model, collection=collection)
+    assert sorted(model.encoded) == ["30 new narrative", "7 rewritten narrative"]
+    assert sorted(collection.rows) == sorted(chunks)
+    assert collection.rows["7_0"]['document'] == "7 rewritten narrative"
+    assert collection.rows["7_0"]['metadata']['content_hash'] != hashes["7_0"]
+    assert collection.upserts == 32
+
+    unchanged = LengthEmbedder()
+    assert generate_embeddings(batch_size=4, model=unchanged, collection=collection)
+    assert unchanged.batches == []
+
+def test_interrupted_run_resumes_without_reencoding(tmp_path, monkeypatch):
+    texts = numbered_texts(30)
+    use_chunks(monkeypatch, tmp_path, {f"{i}_0": text for i, text in enumerate(texts)})
+    collection = MemoryCollection()
+    crashed = LengthEmbedder(fail_after=3)
+    assert not generate_embeddings(batch_size=4, model=crashed, collection=collection)
+    # Batches encoded before the crash were committed with their hashes
+    assert sorted(row['document'] for row in collection.rows.values()) == sorted(crashed.encoded)
+    assert len(crashed.encoded) == 12
+
+    resumed = LengthEmbedder()
+    assert generate_embeddings(batch_size=4, model=resumed, collection=collection)
+    assert sorted(crashed.encoded + resumed.encoded) == sorted(texts)
+    assert len(collection.rows) == 30
+
+def test_rebuild_reembeds_everything(tmp_path, monkeypatch):
+    use_chunks(monkeypatch, tmp_path, {f"{i}_0": text for i, text in enumerate(numbered_texts(10))})
+    client = MemoryClient()
+    assert generate_embeddings(batch_size=4, model=LengthEmbedder(), collection=client.collection)
+    model = LengthEmbedder()
+    assert generate_embeddings(rebuild=True, batch_size=4, model=model, collection=client.collection)
+    assert len(model.encoded) == 10 and len(client.collection.rows) == 10
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.evaluation import evaluate_parallel, load_questions, retrieval_metrics
+from tests.conftest import StubRAG
+
+def results(complaint_ids, products):
+    return {'ids': [[f"{c}_0" for c in complaint_ids]],
+            'metadatas': [[{'complaint_id': c, 'product': p} for c, p in zip(complaint_ids, products)]]}
+
+def test_retrieval_metrics_for_complaint_and_product_labels():
+    retrieved = results(["3", "8", "3", "5"], ["BNPL", "Credit Card", "BNPL", "Credit Card"])
+    by_id = retrieval_metrics(retrieved, ["5", "9"], k=5)
+    assert by_id == {'recall_at_k': 0.5, 'hit_at_k': 1.0, 'reciprocal_rank': pytest.approx(1 / 3)}
+    # Duplicate chunks of complaint 3 count once, so 5 is still inside k=3
+    assert retrieval_metrics(retrieved, ["5"], k=3)['recall_at_k'] == 1.0
+    by_product = retrieval_metrics(retrieved, product="Credit Card", k=5)
+    assert by_product['reciprocal_rank'] == 0.5 and by_product['recall_at_k'] == 1.0
+    assert retrieval_metrics(retrieved)['recall_at_k'] is None
+
+def test_load_questions_parses_label_formats(tmp_path):
+    path = tmp_path / "questions.csv"
+    pd.DataFrame({'question': ["a", "b"], 'complaint_ids': ["1; 2", None]}).to_csv(path, index=False)
+    questions = load_questions(str(path))
+    assert questions['complaint_ids'].tolist() == [["1", "2"], []]
+    assert questions['product'].tolist() == [None, None]
+
+def test_evaluate_parallel_scores_batches_and_times_stages(flat_index):
+    index, vectors = flat_index
+    rag = StubRAG(index, vectors)
+    # Each question embeds exactly like its complaint, so it is retrieved first
+    questions = pd.DataFrame({'question': [f"complaint number {i}" for i in range(30)],
+                              'complaint_ids': [[str(i)] for i in range(30)],
+                              'product': [None] * 30})
+    report, summary = evaluate_parallel(rag, questions, k=3, batch_size=8, workers=3)
+    assert len(report) == 30 and summary['failed'] == 0
+    assert summary['recall@3'] == 1.0 and summary['mrr'] == 1.0
+    assert rag.calls == 4
+    assert report['answer'].tolist()[0] == "answer to complaint number 0 from 0_0"
+    for stage in ("embed", "retrieve", "generate", "total"):
+        latency = summary['latency'][stage]
+        assert latency['p50_ms'] <= latency['p95_ms'] <= latency['p99_ms']
+    assert summary['throughput_qps'] > 0
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+import pytest
+from src.inference import PrefixKVCache, load_generator, quantize_linear_int8
+
+class StubTokenizer:
+    pad_token = None
+    eos_token = "</s>"
+    padding_side = "right"
+
+    def __call__(self, *args, **kwargs):
+        raise AssertionError("an encoder-decoder prefix must not be tokenized")
+
+def stub_model(is_encoder_decoder):
+    return SimpleNamespace(config=SimpleNamespace(is_encoder_decoder=is_encoder_decoder))
+
+def test_prefix_cache_is_disabled_for_encoder_decoder_models():
+    cache = PrefixKVCache(stub_model(True), StubTokenizer(), "Answer the question")
+    assert not cache.enabled
+    assert cache.inputs_for("Answer the question: why?", 512) is None
+    assert not PrefixKVCache(stub_model(False), StubTokenizer(), "").enabled
+
+@pytest.mark.parametrize("is_encoder_decoder", [True, False])
+def test_load_generator_picks_model_class_from_config(monkeypatch, is_encoder_decoder):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    loaded = []
+
+    class StubModel(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.config = SimpleNamespace(is_encoder_decoder=is_encoder_decoder)
+
+    def from_pretrained(kind):
+        def load(cls, model_name, **kwargs):
+            loaded.append((kind, kwargs))
+            return StubModel()
+        return classmethod(load)
+
+    monkeypatch.setattr(transformers.AutoConfig, "from_pretrained",
+                        classmethod(lambda cls, name: SimpleNamespace(is_encoder_decoder=is_encoder_decoder)))
+    monkeypatch.setattr(transformers.AutoTokenizer, "from_pretrained",
+                        classmethod(lambda cls, name: StubTokenizer()))
+    monkeypatch.setattr(transformers.AutoModelForSeq2SeqLM, "from_pretrained", from_pretrained("seq2seq"))
+    monkeypatch.setattr(transformers.AutoModelForCausalLM, "from_pretrained", from_pretrained("causal"))
+
+    tokenizer, model = load_generator("stub-model")
+    assert [name for name, _ in loaded] == ["seq2seq" if is_encoder_decoder else "causal"]
+    assert loaded[0][1]['low_cpu_mem_usage'] and loaded[0][1]['torch_dtype'] == torch.float32
+    assert not model.training
+    # Batched decoder-only prompts pad on the left with the end-of-sequence token
+    assert tokenizer.padding_side == ("right" if is_encoder_decoder else "left")
+    assert tokenizer.pad_token == (None if is_encoder_decoder else "</s>")
+    with pytest.raises(ValueError, match="only supported on CPU"):
+        load_generator("stub-model", device="cuda", cpu_int8=True)
+
+def test_quantize_linear_int8_converts_nested_and_top_level_layers():
+    torch = pytest.importorskip("torch")
+    model = torch.nn.Module()
+    model.encoder = torch.nn.Sequential(torch.nn.Linear(8, 8), torch.nn.ReLU(), torch.nn.Linear(8, 8))
+    model.lm_head = torch.nn.Linear(8, 4)
+    assert quantize_linear_int8(model) is model
+    assert not any(isinstance(module, torch.nn.Linear) for module in model.modules())
+    assert model.lm_head(model.encoder(torch.ones(2, 8))).shape == (2, 4)
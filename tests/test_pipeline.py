@@ -0,0 +1,59 @@
+import json
+import pytest
+from src.pipeline import MANIFEST_NAME, Stage, run_pipeline, default_stages
+
+def make_stages(tmp_path, calls, upper=True, suffix=""):
+    raw, clean, counts = tmp_path / "raw.txt", tmp_path / "clean.txt", tmp_path / "out" / "counts.json"
+
+    def clean_stage():
+        calls.append("clean")
+        text = raw.read_text()
+        clean.write_text((text.upper() if upper else text).strip() + suffix)
+
+    def count_stage():
+        calls.append("count")
+        counts.parent.mkdir(exist_ok=True)
+        counts.write_text(json.dumps({'words': len(clean.read_text().split())}))
+
+    return [Stage("clean", clean_stage, [str(raw)], [str(clean)], {'upper': upper, 'suffix': suffix}),
+            Stage("count", count_stage, [str(clean)], [str(counts)], {})]
+
+def test_unchanged_pipeline_skips_every_stage(tmp_path):
+    (tmp_path / "raw.txt").write_text("late fee charged twice")
+    calls = []
+    assert run_pipeline(make_stages(tmp_path, calls)) == {'clean': "ran", 'count': "ran"}
+    assert run_pipeline(make_stages(tmp_path, calls)) == {'clean': "skipped", 'count': "skipped"}
+    assert calls == ["clean", "count"]
+    assert (tmp_path / MANIFEST_NAME).exists() and (tmp_path / "out" / MANIFEST_NAME).exists()
+
+def test_changed_params_rerun_stage_and_identical_output_stops_there(tmp_path):
+    (tmp_path / "raw.txt").write_text("LATE FEE CHARGED TWICE\n")
+    calls = []
+    run_pipeline(make_stages(tmp_path, calls))
+    # Different parameter, byte-identical output: downstream stays skipped
+    assert run_pipeline(make_stages(tmp_path, calls, upper=False)) == {'clean': "ran", 'count': "skipped"}
+    assert run_pipeline(make_stages(tmp_path, calls), force=("clean",)) == {'clean': "ran", 'count': "skipped"}
+    # A changed output reruns downstream
+    assert run_pipeline(make_stages(tmp_path, calls, suffix=" AGAIN")) == {'clean': "ran", 'count': "ran"}
+    assert calls.count("count") == 2
+
+def test_changed_input_or_missing_output_reruns(tmp_path):
+    raw = tmp_path / "raw.txt"
+    raw.write_text("late fee")
+    calls = []
+    run_pipeline(make_stages(tmp_path, calls))
+    raw.write_text("late fee and interest")
+    assert run_pipeline(make_stages(tmp_path, calls)) == {'clean': "ran", 'count': "ran"}
+    (tmp_path / "out" / "counts.json").unlink()
+    assert run_pipeline(make_stages(tmp_path, calls), dry_run=True) == {'clean': "skipped", 'count': "stale"}
+    raw.unlink()
+    with pytest.raises(FileNotFoundError):
+        run_pipeline(make_stages(tmp_path, calls))
+
+def test_default_stages_ignore_llm_settings():
+    stages = {stage.name: stage for stage in default_stages(chunk_size=256)}
+    assert list(stages) == ["preprocess", "dedup", "chunk", "lexical", "embed"]
+    assert stages["chunk"].inputs == stages["dedup"].outputs
+    assert stages['chunk'].params['chunk_size'] == 256
+    assert stages['embed'].params['model_name'] == "sentence-transformers/all-MiniLM-L6-v2"
+    assert all("rag_logic" not in module.__name__ for stage in stages.values() for module in stage.code)
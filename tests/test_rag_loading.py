@@ -0,0 +1,55 @@
+import threading
+import pytest
+from tests.conftest import EchoModel, StubRAG
+
+def test_background_loading_reports_readiness():
+    gate = threading.Event()
+    rag = StubRAG(gate=gate, background=True)
+    assert not rag.is_ready
+    assert rag.status()['components']['embedder']['state'] in ("pending", "loading")
+    assert not rag.wait_until_ready(timeout=0.05)
+
+    gate.set()
+    assert rag.wait_until_ready(timeout=5)
+    assert rag.embed_query("Hello  World").shape == (8,)
+
+def test_failed_component_is_reported():
+    gate = threading.Event()
+    gate.set()
+    rag = StubRAG(gate=gate, fail=("embedder",), background=True)
+    assert not rag.wait_until_ready(timeout=5)
+    assert rag.status()['components']['embedder']['error'] == "model files missing"
+    with pytest.raises(RuntimeError, match="embedder failed to load"):
+        rag.embed_query("hello")
+
+def test_eager_loading_raises():
+    gate = threading.Event()
+    gate.set()
+    with pytest.raises(OSError):
+        StubRAG(gate=gate, fail=("embedder",))
+
+def test_stream_response_serves_cached_answer(tmp_path):
+    rag = StubRAG(answer_cache=True, answer_cache_path=str(tmp_path / "answers.npz"))
+    response = {'answer': "Late fees.", 'sources': {'documents': [["fee"]], 'metadatas': [[{}]]}}
+    rag.answer_cache.put("why fees", rag.embed_query("Why fees?"), response, None, rag.index_version)
+
+    events = list(rag.stream_response("Why fees?"))
+    assert [event['type'] for event in events] == ['sources', 'token', 'done']
+    assert events[0]['sources'] == response['sources']
+    assert events[-1]['answer'] == "Late fees." and events[-1]['cached']
+
+def test_concurrent_generations_share_the_model_one_at_a_time():
+    model = EchoModel(delay=0.05)
+    rag = StubRAG(model=model)
+    answers = [None] * 4
+
+    def ask(i):
+        answers[i] = rag._generate([f"question number {i}"])[0]
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert answers == [f"question number {i}" for i in range(4)]
+    assert model.peak == 1 and len(model.calls) == 4
@@ -0,0 +1,81 @@
+import threading
+import pytest
+from src.scheduler import GenerationScheduler, MicroBatcher, StreamingScheduler
+from tests.conftest import EchoModel, StubRAG
+
+def test_micro_batcher_groups_concurrent_requests():
+    batches = []
+    batcher = MicroBatcher(lambda items: batches.append(list(items)) or [i * 2 for i in items],
+                           max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [f.result(timeout=5) for f in futures] == [i * 2 for i in range(10)]
+    assert [len(b) for b in batches] == [4, 4, 2]
+    stats = batcher.stats()
+    assert stats['requests'] == 10 and stats['batches'] == 3
+    assert stats['batch_sizes'] == {2: 1, 4: 2}
+    assert stats['queue_depth'] == 0 and stats['max_queue_depth'] >= 4
+
+def test_micro_batcher_propagates_errors():
+    def fail(items):
+        raise ValueError("model crashed")
+    future = MicroBatcher(fail, max_wait_ms=1).submit("q")
+    with pytest.raises(ValueError, match="model crashed"):
+        future.result(timeout=5)
+
+def test_scheduler_batches_embedding_and_routes_results(flat_index):
+    rag = StubRAG(*flat_index)
+    embedder = rag.stub_embedder
+    scheduler = GenerationScheduler(rag, max_batch_size=8, max_wait_ms=200)
+    queries = [f"question {i}" for i in range(8)]
+    futures = [scheduler.submit(q, 'Credit Card' if i % 2 else None) for i, q in enumerate(queries)]
+    responses = [f.result(timeout=5) for f in futures]
+
+    assert embedder.calls == [queries]
+    for i, response in enumerate(responses):
+        assert response['answer'] == f"answer to {queries[i]} from {i}_0"
+        assert response['sources']['ids'][0][0] == f"{i}_0"
+    assert scheduler.stats()['batch_sizes'] == {8: 1}
+
+def test_scheduler_decodes_each_answer_past_its_own_padded_prompt(flat_index):
+    model = EchoModel()
+    rag = StubRAG(*flat_index, model=model)
+    scheduler = GenerationScheduler(rag, max_batch_size=3, max_wait_ms=200)
+    queries = ["short 1", "a much longer question about late fees 2", "why so 3"]
+    futures = [scheduler.submit(q) for q in queries]
+    responses = [f.result(timeout=5) for f in futures]
+
+    # The stub answers with its prompt's last words, so padding would leak into shorter answers
+    prompts = rag.tokenizer.prompts
+    assert len({len(prompt.split()) for prompt in prompts}) == 3
+    for query, prompt, response in zip(queries, prompts, responses):
+        assert f"Question: {query}" in prompt and f"narrative {query.split()[-1]}" in prompt
+        assert response['answer'] == " ".join(query.split()[-2:] + ["Answer:"])
+    assert len(model.calls) == 1 and model.calls[0][0] == len(queries)
+    assert scheduler.stats()['batch_sizes'] == {3: 1}
+
+def test_streaming_scheduler_batches_generation_and_streams_each_caller(flat_index):
+    model = EchoModel()
+    rag = StubRAG(*flat_index, model=model)
+    scheduler = StreamingScheduler(rag, max_batch_size=4, max_wait_ms=200)
+    queries = ["short 1", "a much longer question about late fees 2", "why so 3"]
+    events = [None] * len(queries)
+
+    def ask(i):
+        events[i] = list(scheduler.stream(queries[i]))
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(model.calls) == 1 and model.calls[0][0] == len(queries)
+    for query, query_events in zip(queries, events):
+        kinds = [event['type'] for event in query_events]
+        assert kinds[0] == 'sources' and kinds[-1] == 'done' and kinds.count('token') == 3
+        assert query_events[0]['sources']['ids'][0][0] == f"{query.split()[-1]}_0"
+        answer = " ".join(query.split()[-2:] + ["Answer:"])
+        assert "".join(e['text'] for e in query_events if e['type'] == 'token').strip() == answer
+        assert query_events[-1]['answer'] == answer and query_events[-1]['ttft_seconds'] > 0
+    assert scheduler.stats()['batch_sizes'] == {3: 1}
+    assert rag.streaming_stats()['streams'] == 3
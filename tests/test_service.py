@@ -0,0 +1,117 @@
+import asyncio
+import pandas as pd
+import pytest
+from src.service import RAGService, ServiceOverloaded
+from src.trends import aggregate, update_cube
+from tests.conftest import EchoModel, StubRAG
+
+def test_service_answers_concurrent_requests_within_limits(flat_index):
+    rag = StubRAG(*flat_index, delay=0.01, max_concurrent_generations=2)
+
+    async def main():
+        service = RAGService(rag, generate_workers=2, max_pending=200, timeout=10)
+        responses = await asyncio.gather(*[service.answer(f"question {i}") for i in range(60)])
+        return service, responses
+
+    service, responses = asyncio.run(main())
+    assert all(r['answer'].startswith(f"answer to question {i} ") for i, r in enumerate(responses))
+    assert all(len(r['sources']['ids'][0]) == 5 for r in responses)
+    assert rag.peak == 2
+    stats = service.stats()
+    assert stats['generate']['completed'] == 60
+    assert stats['generate']['waiting'] == stats['generate']['running'] == 0
+    service.shutdown()
+
+def test_generate_workers_must_match_generation_slots(flat_index):
+    rag = StubRAG(*flat_index, max_concurrent_generations=2)
+
+    async def main():
+        with pytest.raises(ValueError, match="max_concurrent_generations=2"):
+            RAGService(rag, generate_workers=4)
+        service = RAGService(rag)
+        assert service.stats()['generate']['workers'] == 2
+        service.shutdown()
+
+    asyncio.run(main())
+
+def test_service_rejects_when_queue_is_full(flat_index):
+    rag = StubRAG(*flat_index, delay=0.2)
+
+    async def main():
+        service = RAGService(rag, generate_workers=1, max_pending=2, timeout=10)
+        outcomes = await asyncio.gather(*[service.answer(f"q {i}") for i in range(8)],
+                                        return_exceptions=True)
+        return service, outcomes
+
+    service, outcomes = asyncio.run(main())
+    rejected = [o for o in outcomes if isinstance(o, ServiceOverloaded)]
+    # Every stage admits its workers plus two waiters: the trend cube check
+    # in the retrieve stage turns away two requests, the embed and generate
+    # (one slow worker) stages three more between them
+    assert len(rejected) == 5
+    assert any("generate queue is full" in str(r) for r in rejected)
+    assert sum(isinstance(o, dict) for o in outcomes) == 3
+    stats = service.stats()
+    assert stats['retrieve']['rejected'] == 2
+    assert stats['embed']['rejected'] + stats['generate']['rejected'] == 3
+    service.shutdown()
+
+def test_service_timeout_and_cancellation(flat_index):
+    rag = StubRAG(*flat_index, delay=0.3)
+
+    async def main():
+        service = RAGService(rag, generate_workers=1, timeout=10)
+        with pytest.raises(TimeoutError, match="timed out after 0.05s"):
+            await service.answer("slow", timeout=0.05)
+        task = asyncio.create_task(service.answer("abandoned"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The timed-out generation still holds its slot until its thread finishes
+        assert service.stats()['generate']['running'] == 1
+        await asyncio.sleep(0.4)
+        return service
+
+    service = asyncio.run(main())
+    stats = service.stats()
+    assert stats['timeouts'] == 1
+    assert stats['generate']['cancelled'] + stats['embed']['cancelled'] + stats['retrieve']['cancelled'] == 2
+    assert stats['generate']['running'] == stats['generate']['waiting'] == 0
+    service.shutdown()
+
+def test_abandoned_requests_do_not_queue_work(flat_index):
+    rag = StubRAG(*flat_index, delay=0.2)
+
+    async def main():
+        service = RAGService(rag, generate_workers=1, max_pending=32, timeout=10)
+        outcomes = await asyncio.gather(*[service.answer(f"q {i}", timeout=0.05) for i in range(5)],
+                                        return_exceptions=True)
+        await asyncio.sleep(0.5)
+        return service, outcomes
+
+    service, outcomes = asyncio.run(main())
+    assert all(isinstance(o, TimeoutError) for o in outcomes)
+    # Only the request that reached the single generate slot ran the model
+    assert rag.calls == 1
+    assert service.stats()['generate']['running'] == 0
+    service.shutdown()
+
+def test_service_answers_trend_questions_from_the_cube(flat_index, tmp_path):
+    cube_path = str(tmp_path / "trend_cube.parquet")
+    update_cube(aggregate(pd.DataFrame({'Product': ['BNPL'] * 3, 'Date received': ['2024-01-02'] * 3,
+                                        'Issue': ['Fees'] * 3, 'State': ['CA', 'CA', 'TX'],
+                                        'Consumer complaint narrative': ['late fee', None, None]})),
+                cube_path)
+    rag = StubRAG(*flat_index, model=EchoModel(), trend_cube_path=cube_path)
+
+    async def main():
+        service = RAGService(rag, timeout=10)
+        return service, await service.answer("How many BNPL complaints were filed in California?")
+
+    service, response = asyncio.run(main())
+    assert response['sources']['aggregate']['total'] == 2
+    assert "Complaints for product BNPL, state CA: 2" in response['answer']
+    assert rag.calls == 0
+    assert service.stats()['embed']['completed'] == 0
+    service.shutdown()
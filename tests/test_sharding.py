@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from src import sharding
+from src.artifacts import write_artifact
+from src.sharding import SHARD_METADATA_COLUMNS, merge_shards, shard_of, shard_paths
+from tests.conftest import MemoryCollection
+
+def write_shards(shard_dir, chunk_ids, num_shards, dim=3):
+    for i in range(num_shards):
+        ids = [chunk_id for chunk_id in chunk_ids if shard_of(chunk_id, num_shards) == i]
+        metadata = pd.DataFrame({
+            'chunk_id': ids,
+            'complaint_id': [int(chunk_id.split("_")[0]) for chunk_id in ids],
+            'product': 'BNPL',
+            'content_hash': [f"hash-{chunk_id}" for chunk_id in ids],
+            'text': [f"text {chunk_id}" for chunk_id in ids],
+            'duplicate_count': 1,
+            'duplicate_ids': "",
+        })[SHARD_METADATA_COLUMNS]
+        embeddings = np.array([[int(c.split("_")[0]), int(c.split("_")[1]), i] for c in ids],
+                              dtype=np.float32).reshape(-1, dim)
+        embeddings_path, metadata_path = shard_paths(str(shard_dir), i, num_shards)
+        np.save(embeddings_path, embeddings)
+        write_artifact(metadata, metadata_path)
+
+def test_shard_of_is_stable_and_covers_every_shard():
+    # crc32 values, so assignments never depend on PYTHONHASHSEED or the machine
+    assert [shard_of(chunk_id, 4) for chunk_id in ["1_0", "1_1", "2_0", "17_3"]] == [2, 0, 3, 0]
+    assert shard_of(42, 8) == shard_of("42", 8)
+    counts = np.bincount([shard_of(f"{i}_0", 8) for i in range(2000)], minlength=8)
+    assert counts.min() > 180
+
+def test_merge_round_trip_and_stale_shard_sets(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "write_index_version", lambda backend: None)
+    chunk_ids = [f"{complaint}_{part}" for complaint in range(20) for part in range(3)]
+    write_shards(tmp_path, chunk_ids, 4)
+    collection = MemoryCollection()
+    assert merge_shards(str(tmp_path), collection=collection) == len(chunk_ids)
+    row = collection.rows["7_2"]
+    assert row['embedding'] == [7.0, 2.0, float(shard_of("7_2", 4))]
+    assert row['document'] == "text 7_2"
+    assert row['metadata']['content_hash'] == "hash-7_2" and row['metadata']['complaint_id'] == 7
+    assert row['metadata']['duplicate_count'] == 1 and row['metadata']['duplicate_ids'] == ""
+    assert merge_shards(str(tmp_path), collection=collection) == 0
+
+    # A rerun with another shard count leaves an older set behind
+    write_shards(tmp_path, chunk_ids[:30], 2)
+    with pytest.raises(ValueError, match="shard counts"):
+        merge_shards(str(tmp_path), collection=collection)
+    assert merge_shards(str(tmp_path), collection=collection, num_shards=2) == 0
+    assert sorted(collection.rows) == sorted(chunk_ids[:30])
+    assert all("-of-00002." in name for name in os.listdir(tmp_path))
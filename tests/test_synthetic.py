@@ -0,0 +1,20 @@
+import numpy as np
+from benchmarks.synthetic import generate_complaints, load_eda_stats, product_mix
+from src.data_processing import preprocess_data
+
+def test_generator_is_deterministic_and_matches_eda_mix():
+    stats = load_eda_stats()
+    first = generate_complaints(20_000, seed=3)
+    assert first.equals(generate_complaints(20_000, seed=3))
+
+    missing = first['Consumer complaint narrative'].isna().mean()
+    assert abs(missing - stats['missing_narratives'] / stats['total_records']) < 0.02
+    shares = first['Product'].value_counts(normalize=True)
+    for product, share in product_mix(stats).items():
+        assert abs(shares.get(product, 0.0) - share) < 0.02
+
+def test_synthetic_complaints_survive_preprocessing():
+    raw = generate_complaints(500, seed=1)
+    processed = preprocess_data(raw.copy(), n_jobs=1)
+    assert len(processed) == raw['Consumer complaint narrative'].notna().sum()
+    assert np.median(processed['word_count']) > 50
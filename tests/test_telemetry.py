@@ -0,0 +1,53 @@
+import json
+import urllib.request
+import pytest
+from src.telemetry import Registry, Tracer, serve_metrics, span
+import src.telemetry as telemetry
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    lookups = registry.counter("lookups_total", "Cache lookups", ("result",))
+    lookups.inc(result="hit")
+    lookups.inc(2, result="hit")
+    latency = registry.histogram("latency_seconds", "Latency", (0.1, 1.0), ("stage",))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage="embed")
+    text = registry.render()
+    assert 'lookups_total{result="hit"} 3' in text
+    assert 'latency_seconds_bucket{stage="embed",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="embed",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{stage="embed",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{stage="embed"} 3' in text
+    with pytest.raises(ValueError):
+        lookups.inc(stage="embed")
+
+def test_spans_record_histogram_and_nested_trace(tmp_path, monkeypatch):
+    tracer = Tracer(str(tmp_path / "trace.jsonl"))
+    monkeypatch.setattr(telemetry, "tracer", tracer)
+    before = telemetry.STAGE_SECONDS.count(stage="test_outer")
+    with span("test_outer", queries=2) as attributes:
+        with span("test_inner"):
+            pass
+        attributes['hits'] = 1
+    with pytest.raises(RuntimeError):
+        with span("test_inner"):
+            raise RuntimeError("boom")
+    tracer.close()
+
+    assert telemetry.STAGE_SECONDS.count(stage="test_outer") == before + 1
+    inner, outer, failed = [json.loads(line) for line in open(tmp_path / "trace.jsonl")]
+    assert outer['name'] == "test_outer" and outer['queries'] == 2 and outer['hits'] == 1
+    assert inner['parent_id'] == outer['span_id'] and inner['trace_id'] == outer['trace_id']
+    assert failed['parent_id'] is None and "boom" in failed['error']
+
+def test_metrics_endpoint_serves_registry():
+    registry = Registry()
+    registry.counter("requests_total", "Requests").inc()
+    server = serve_metrics(port=0, host="127.0.0.1", registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers['Content-Type'].startswith("text/plain")
+            assert "requests_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
@@ -0,0 +1,79 @@
+import pandas as pd
+from src.data_processing import preprocess_stream
+from src.trends import TrendCube, aggregate, merge_cube, parse_aggregate_question, update_cube
+from tests.conftest import EchoModel, StubRAG
+
+def raw_records():
+    return pd.DataFrame({
+        'Complaint ID': range(8),
+        'Product': ['Credit Card'] * 5 + ['BNPL'] * 3,
+        'Consumer complaint narrative': ['Late fee', None, 'Fee again', 'Wrong rate', None,
+                                         'Refund missing', 'Refund', None],
+        'Date received': ['2024-01-05', '2024-01-20', '2024-02-03', '2024-02-11', '2024-02-28',
+                          '2024-01-09', '2024-02-14', 'not a date'],
+        'Issue': ['Fees or interest'] * 3 + ['Problem with a purchase shown on your statement'] * 2
+                 + ['Problem with a purchase or transfer'] * 3,
+        'State': ['CA', 'CA', 'TX', 'CA', None, 'NY', 'NY', 'TX'],
+    })
+
+def test_merge_replaces_reprocessed_months():
+    cube = aggregate(raw_records())
+    assert cube['complaints'].sum() == 8 and cube['with_narrative'].sum() == 5
+    assert set(cube['month']) == {'2024-01', '2024-02', 'Unknown'}
+
+    february = aggregate(raw_records().iloc[[2, 3]])
+    merged = merge_cube(cube, february)
+    assert merged[merged['month'] == '2024-02']['complaints'].sum() == 2
+    assert merged[merged['month'] == '2024-01']['complaints'].sum() == 3
+    # Reapplying the same update does not double count
+    assert merge_cube(merged, february)['complaints'].sum() == merged['complaints'].sum()
+
+def test_cube_facts_and_question_parsing(tmp_path):
+    path = str(tmp_path / "trend_cube.parquet")
+    update_cube(aggregate(raw_records()), path)
+    cube = TrendCube.load(path)
+    assert cube.latest_month == '2024-02'
+    assert cube.select(product='Credit Card', state='CA')['complaints'].sum() == 3
+
+    request = parse_aggregate_question("How many credit card complaints about fees or interest in 2024?",
+                                       cube, product='Credit Card')
+    assert request == {'kind': 'count', 'product': 'Credit Card', 'issue': 'Fees or interest',
+                       'state': None, 'start': '2024-01', 'end': '2024-12'}
+    facts = cube.facts(request)
+    assert facts['total'] == 3 and facts['monthly'] == [('2024-01', 2), ('2024-02', 1)]
+    assert facts['top_states'] == [('CA', 2), ('TX', 1)]
+
+    request = parse_aggregate_question("What is the trend of complaints in New York over the last 2 months?",
+                                       cube)
+    assert (request['kind'], request['state'], request['start'], request['end']) == \
+        ('trend', 'NY', '2024-01', '2024-02')
+    assert parse_aggregate_question("Top issues for complaints from TX", cube)['state'] == 'TX'
+    assert parse_aggregate_question("How many purchase shown on statement problems since 2023?",
+                                    cube)['issue'] == 'Problem with a purchase shown on your statement'
+    assert parse_aggregate_question("How many complaints in West Virginia last year?", cube)['state'] == 'WV'
+    assert parse_aggregate_question("Which states have the most BNPL complaints?", cube)['kind'] == 'top'
+    for question in ["Why are people unhappy with BNPL refunds?", "Why are BNPL late fees increasing?",
+                     "On top of the late fee they charged interest, is that allowed?",
+                     "How many times can a card issuer raise my rate?"]:
+        assert parse_aggregate_question(question, cube) is None
+
+def test_aggregate_questions_skip_retrieval(tmp_path):
+    raw_path, cube_path = tmp_path / "raw.csv", tmp_path / "trend_cube.parquet"
+    raw = raw_records()
+    raw['Product'] = ['Credit card'] * 5 + ['BNPL'] * 3
+    raw.to_csv(raw_path, index=False)
+    preprocess_stream(str(raw_path), str(tmp_path / "processed.parquet"), chunksize=3, n_jobs=1)
+    assert TrendCube.load(str(cube_path)).df['complaints'].sum() == 8
+
+    rag = StubRAG(model=EchoModel(), trend_cube_path=str(cube_path))
+    response = rag.generate_batch(["How many BNPL complaints were there in February 2024?"])[0]
+    assert response['sources']['aggregate']['total'] == 1
+    assert response['sources']['documents'] == []
+    assert "Complaints for product BNPL, months 2024-02 to 2024-02: 1" in rag.tokenizer.prompts[0]
+    assert "Complaints for product BNPL, months 2024-02 to 2024-02: 1" in response['answer']
+
+    events = list(rag.stream_response("What are the top issues for BNPL?"))
+    assert [event['type'] for event in events] == ['sources', 'token', 'done']
+    assert events[-1]['sources']['aggregate']['top_issues'] == [('Problem with a purchase or transfer', 3)]
+    assert rag.answer_aggregate("Why do BNPL refunds take so long?") is None
+    assert rag.answer_aggregate("How many BNPL complaints in 2024?", aggregates=False) is None
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.vector_index import FlatIndexBuilder, FlatVectorIndex
+
+def build_index(directory, dtype, n=300, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+    records = pd.DataFrame({
+        'chunk_id': [f"{i}_0" for i in range(n)],
+        'complaint_id': np.arange(n),
+        'product': ['BNPL', 'Credit Card', 'Money Transfer'] * (n // 3),
+        'text': [f"narrative {i}" for i in range(n)],
+    })
+    builder = FlatIndexBuilder(str(directory), n, dim, dtype)
+    builder.add(np.arange(n), embeddings)
+    return builder.finalize(records, "test-model"), embeddings
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_flat_index_exact_top_k(tmp_path, dtype):
+    index, embeddings = build_index(tmp_path / "index", dtype)
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized[:20] @ normalized.T), axis=1)[:, :5]
+
+    scores, rows = index.search(embeddings[:20], k=5)
+    assert rows.shape == (20, 5)
+    assert (rows[:, 0] == np.arange(20)).all()
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(rows, expected)]) >= 0.9
+    assert (np.diff(scores, axis=1) <= 1e-6).all()
+
+def test_flat_index_query_matches_chroma_format(tmp_path):
+    build_index(tmp_path / "index", "float16")
+    index = FlatVectorIndex.load(str(tmp_path / "index"))
+    query = np.asarray(index.vectors[4], dtype=np.float32)
+
+    results = index.query([query], n_results=3, where={'product': 'Credit Card'})
+    assert results['ids'][0][0] == "4_0"
+    assert results['documents'][0][0] == "narrative 4"
+    assert all(meta['product'] == 'Credit Card' for meta in results['metadatas'][0])
+    assert results['distances'][0][0] == pytest.approx(0.0, abs=1e-3)
+
+def test_flat_index_rebuild_reuses_rows(tmp_path):
+    index, _ = build_index(tmp_path / "index", "float16")
+    builder = FlatIndexBuilder(str(tmp_path / "index"), 10, index.vectors.shape[1], "int8")
+    builder.copy_from(np.arange(10), index, np.arange(10, 20))
+    records = pd.DataFrame({'chunk_id': [f"{i}_0" for i in range(10, 20)],
+                            'text': [f"narrative {i}" for i in range(10, 20)]})
+    rebuilt = builder.finalize(records, "test-model")
+
+    _, rows = rebuilt.search(np.asarray(index.vectors[10:20], dtype=np.float32), k=1)
+    assert (rows[:, 0] == np.arange(10)).all()
+    assert rebuilt.count() == 10
+
+def test_flat_index_product_partitions(tmp_path):
+    rng = np.random.default_rng(1)
+    products = ['BNPL'] * 40 + ['Credit Card'] * 50 + ['Money Transfer'] * 30
+    records = pd.DataFrame({'chunk_id': [f"{i}_0" for i in range(120)], 'product': products})
+    builder = FlatIndexBuilder(str(tmp_path / "index"), 120, 16, "float16")
+    builder.add(np.arange(120), rng.normal(size=(120, 16)))
+    index = builder.finalize(records, "test-model")
+
+    assert index.partitions() == {'BNPL': (0, 40), 'Credit Card': (40, 90), 'Money Transfer': (90, 120)}
+    assert index.rows_matching({'product': 'Credit Card'}) == range(40, 90)
+    assert len(index.rows_matching({'product': 'Mortgage'})) == 0
+
+    results = index.query(rng.normal(size=(2, 16)), n_results=10, where={'product': 'Money Transfer'})
+    assert all(meta['product'] == 'Money Transfer' for hits in results['metadatas'] for meta in hits)
+    assert len(results['ids'][0]) == 10